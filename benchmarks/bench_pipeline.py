@@ -0,0 +1,263 @@
+"""bench_pipeline
+==========================================================
+Benchmark of the PerfectRadar pipeline (the steps of run.py) over synthetic listings of a city.
+
+It creates the four CSV files of run.py (deptos_venta, deptos_renta, casa_venta, casa_renta) with random listings
+around Guadalajara, and mesure the time and the peak memory of each method. The times are the best of 'repeat' runs;
+the memory is mesured in a different run with tracemalloc (it makes slower the code).
+
+The last stages are the hourly update of a prepared radar: append_rows and remove_rows of DELTA_ROWS listings (they
+only fill the buffer), apply_updates (the merge of the buffer in the DataFrame and the indexes, once for all the
+deltas) and a query after the update.
+
+Usage:
+    python benchmarks/bench_pipeline.py --sizes 10000 100000 1000000 --json bench.json
+    python benchmarks/bench_pipeline.py --sizes 10000 --compare bench.json  # <- Exit code 1 if there are regressions
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # <- Run it from any directory
+from perfectradar.perfectradar.radar import PerfectRadar
+
+CENTER = (20.6953967, -103.4134952)  # <- The coordinate of run.py (Guadalajara)
+FILES = {'deptos_venta': ('Departamento', 'Buy'), 'deptos_renta': ('Departamento', 'Rent'),
+         'casa_venta': ('Casa', 'Buy'), 'casa_renta': ('Casa', 'Rent')}
+OUTLIER_COLS = ('precio_name', 'm2_terreno_name', 'm2_construccion_name')
+DELTA_ROWS = 5_000  # <- The rows of the hourly update of append_rows and remove_rows
+
+
+def make_listings(n: int, type_of_listing: str, type_of_offer: str, seed: int = 0, prefix: str = 'sku',
+                  spread_km: float = 8.0) -> pd.core.frame.DataFrame:
+    """Create random listings with the columns of run.py.
+
+    The coordinates are a normal distribution around the CENTER ('spread_km' of standard deviation), so the center
+    is dense and the border is sparse like a real city. The prices are log-normal, and ~2% of the land sizes are 0.
+
+    Parameters
+    ----------
+    n : int
+        Is the number of listings
+
+    type_of_listing : str
+        Is the type of listing (Casa or Departamento).
+
+    type_of_offer : str
+        Is the type of offer (Buy or Rent).
+
+    seed : int
+        Is the seed of the random values. (Default value = 0)
+
+    prefix : str
+        Is the prefix of the IDs. (Default value = 'sku')
+
+    spread_km : float
+        Is the standard deviation of the distance to the CENTER. (Default value = 8.0)
+
+    Returns
+    -------
+    DataFrame
+    """
+
+    rng = np.random.default_rng(seed)
+    median_price = 4_000_000 if type_of_offer == 'Buy' else 15_000
+    land_size = rng.integers(60, 400, n) * (rng.random(n) > 0.02)
+
+    return pd.DataFrame({
+        'sku_nombre': [f'{prefix}-{i}' for i in range(n)],
+        'lat_name': CENTER[0] + rng.normal(0, spread_km / 110.574, n),
+        'long_name': CENTER[1] + rng.normal(0, spread_km / 104.0, n),
+        'tipo_inmueble': type_of_listing,
+        'tipo_oferta_nombre': type_of_offer,
+        'precio_name': np.round(rng.lognormal(np.log(median_price), 0.6, n)).astype(np.int64),
+        'm2_terreno_name': land_size,
+        'm2_construccion_name': rng.integers(40, 500, n),
+    })
+
+
+def write_csvs(n: int, directory: str, seed: int = 0) -> list:
+    """Write the four CSV files of run.py with n listings in total and return their paths."""
+
+    paths = []
+    for position, (name, (type_of_listing, type_of_offer)) in enumerate(FILES.items()):
+        path = os.path.join(directory, name)
+        make_listings(n // len(FILES), type_of_listing, type_of_offer, seed + position, name).to_csv(path, index=False)
+        paths.append(path)
+
+    return paths
+
+
+def new_radar(paths: list) -> PerfectRadar:
+    """Create the PerfectRadar of run.py."""
+
+    p = PerfectRadar('Benchmark', *paths)
+    p.config_columns(id='sku_nombre', lat_col='lat_name', lon_col='long_name', type_of_listing_col='tipo_inmueble',
+                     type_of_offer_col='tipo_oferta_nombre', price_col='precio_name',
+                     land_size_col='m2_terreno_name', rent_value='Rent')
+    p.set_coordinates(*CENTER)
+    return p
+
+
+def pipeline(p: PerfectRadar) -> list:
+    """Return the stages of the benchmark: [(name, function), ...]. Each function returns the rows of its result."""
+
+    def rows(result) -> int:
+        results = result if isinstance(result, tuple) else (result,)
+        return sum(len(df) for df in results if df is not None)
+
+    def chain() -> tuple:
+        PerfectRadar.subset_by_type(p, 'Casa', 'Buy')
+        p.set_sim_val(6500000, 150, 150, 3, 3, 2.5)
+        p.set_subset_sector_inmo()
+        p.subset_by_bbox()
+        p.mesure_df_distances()
+        p.subset_by_km()
+        return (p.rm_outliers(p.subset_by_type, False, *OUTLIER_COLS),
+                p.rm_outliers(p.subset_by_type_rent, False, *OUTLIER_COLS))
+
+    # The hourly update: new listings and the IDs of old ones (the first listings of casa_venta)
+    delta = make_listings(DELTA_ROWS, 'Casa', 'Buy', seed=99, prefix='delta')
+    removed_ids = [f'casa_venta-{i}' for i in range(DELTA_ROWS)]
+
+    return [
+        ('cvs_to_df', lambda: rows(p.cvs_to_df('m2_construccion_name', prune=True))),
+        ('set_col_sector_inmo', lambda: rows(p.set_col_sector_inmo())),
+        ('set_avg_price_cols', lambda: rows((p.set_avg_pricem2_col(), p.set_avg_priceconst_col())[-1])),
+        ('subset_by_type', lambda: rows(PerfectRadar.subset_by_type(p, 'Casa', 'Buy'))),
+        ('set_subset_sector_inmo', lambda: (p.set_sim_val(6500000, 150, 150, 3, 3, 2.5),
+                                            rows(p.set_subset_sector_inmo()))[-1]),
+        ('subset_by_bbox', lambda: rows(p.subset_by_bbox())),
+        ('mesure_df_distances', lambda: rows(p.mesure_df_distances())),
+        ('subset_by_km', lambda: rows(p.subset_by_km())),
+        ('rm_outliers', lambda: rows((p.rm_outliers(p.subset_by_type, False, *OUTLIER_COLS),
+                                      p.rm_outliers(p.subset_by_type_rent, False, *OUTLIER_COLS)))),
+        ('end_to_end_chain', lambda: rows(chain())),
+        ('query', lambda: rows(p.query('Casa', 'Buy', *OUTLIER_COLS))),
+        ('build_spatial_index', lambda: len(p.build_spatial_index())),
+        ('query_indexed', lambda: rows(p.query('Casa', 'Buy', *OUTLIER_COLS))),
+        ('knn_query_indexed', lambda: rows(p.knn_query(50, 'Casa', 'Buy'))),
+        ('append_rows', lambda: rows(p.append_rows(delta))),
+        ('remove_rows', lambda: (p.remove_rows(*removed_ids), len(removed_ids))[-1]),
+        ('apply_updates', lambda: (p.apply_updates(), rows(p.df))[-1]),
+        ('query_after_updates', lambda: rows(p.query('Casa', 'Buy', *OUTLIER_COLS))),
+    ]
+
+
+def run_pipeline(paths: list, trace_memory: bool = False) -> dict:
+    """Run all the stages once over a new PerfectRadar.
+
+    Returns
+    -------
+    dict -> {stage: {'seconds', 'rows', 'peak_mb' (only with trace_memory)}}
+    """
+
+    p = new_radar(paths)
+    results = {}
+    for name, stage in pipeline(p):
+        if trace_memory:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        rows = stage()
+        seconds = time.perf_counter() - start
+
+        results[name] = {'seconds': seconds, 'rows': int(rows)}
+        if trace_memory:
+            results[name]['peak_mb'] = (tracemalloc.get_traced_memory()[1] - start_memory) / 2 ** 20
+
+    return results
+
+
+def bench_size(n: int, repeat: int = 3, seed: int = 0) -> dict:
+    """Benchmark the pipeline with n listings: the best time of 'repeat' runs and the peak memory of each stage."""
+
+    with tempfile.TemporaryDirectory(prefix='perfectradar-bench-') as directory:
+        paths = write_csvs(n, directory, seed)
+
+        runs = [run_pipeline(paths) for _ in range(repeat)]
+
+        tracemalloc.start()
+        try:
+            memory = run_pipeline(paths, trace_memory=True)
+        finally:
+            tracemalloc.stop()
+
+    return {name: {'seconds': min(run[name]['seconds'] for run in runs), 'rows': runs[0][name]['rows'],
+                   'peak_mb': memory[name]['peak_mb']} for name in runs[0]}
+
+
+def environment() -> dict:
+    """Return the versions of the environment of the benchmark."""
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+
+def print_report(report: dict, baseline: dict = None, threshold: float = 1.25, min_delta: float = 0.002) -> list:
+    """Print the table of the report. With a baseline it adds the ratio of the times and returns the regressions
+    (slower than 'threshold' times the baseline and more than 'min_delta' seconds, the noise of the fast stages)."""
+
+    regressions = []
+    header = f'{"rows":>9} {"stage":<24} {"seconds":>10} {"peak MB":>9} {"out rows":>9}'
+    print(header + (f' {"vs base":>8}' if baseline else ''))
+    print('-' * (len(header) + (9 if baseline else 0)))
+
+    for size, stages in report['results'].items():
+        for name, stage in stages.items():
+            line = f'{size:>9} {name:<24} {stage["seconds"]:>10.4f} {stage["peak_mb"]:>9.1f} {stage["rows"]:>9}'
+            base = (baseline or {}).get('results', {}).get(size, {}).get(name)
+            if base:
+                ratio = stage['seconds'] / max(base['seconds'], 1e-9)
+                line += f' {ratio:>7.2f}x'
+                if ratio > threshold and stage['seconds'] - base['seconds'] > min_delta:
+                    line += '  <- slower'
+                    regressions.append((size, name, ratio))
+            print(line)
+
+    return regressions
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark of the PerfectRadar pipeline with synthetic listings.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help='Number of listings of each benchmark (default: 10000 100000 1000000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each size, the best time is used (default: 3)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random listings (default: 0)')
+    parser.add_argument('--json', help='Save the report in this JSON file')
+    parser.add_argument('--compare', help='Compare the times with a JSON report of other run')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Ratio of the time to the baseline considered a regression (default: 1.25)')
+    parser.add_argument('--min-delta', type=float, default=0.002,
+                        help='Minimal difference in seconds considered a regression (default: 0.002)')
+    args = parser.parse_args(argv)
+
+    report = {'environment': environment(), 'repeat': args.repeat, 'results': {}}
+    for n in args.sizes:
+        report['results'][str(n)] = bench_size(n, args.repeat, args.seed)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+    regressions = print_report(report, baseline, args.threshold, args.min_delta)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
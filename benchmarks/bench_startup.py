@@ -0,0 +1,82 @@
+"""bench_startup
+==========================================================
+Benchmark of the cold start (import time) of the package.
+
+Each import runs in a new python process, so nothing is cached in sys.modules. It reports the median time of the
+imports and which heavy dependencies (numpy, pandas, geopy, pyarrow) each one loads.
+
+Usage:
+    python benchmarks/bench_startup.py --repeat 10 --json startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('numpy', 'pandas', 'geopy', 'pyarrow')
+
+# Name of the benchmark -> python code of the import
+IMPORTS = {
+    'python': 'pass',
+    'perfectradar': 'import perfectradar.perfectradar',
+    'col_creator': 'from perfectradar.perfectradar.col_creator import segment_sector_inmo',
+    'distances': 'from perfectradar.perfectradar.distances import distances_km',
+    'PerfectRadar': 'from perfectradar.perfectradar import PerfectRadar',
+    'PerfectRadar + geopy': 'from perfectradar.perfectradar import PerfectRadar; import geopy.distance',
+}
+
+SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+{code}
+seconds = time.perf_counter() - start
+print(seconds, *[name for name in {heavy!r} if name in sys.modules])
+'''
+
+
+def time_import(code: str) -> tuple:
+    """Run the import in a new process and return (seconds, loaded heavy modules)."""
+
+    output = subprocess.run([sys.executable, '-c', SCRIPT.format(code=code, heavy=HEAVY_MODULES)], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout.split()
+    return float(output[0]), output[1:]
+
+
+def bench_imports(repeat: int = 10) -> dict:
+    """Return the median time (ms) and the heavy modules of each import of IMPORTS."""
+
+    report = {}
+    for name, code in IMPORTS.items():
+        runs = [time_import(code) for _ in range(repeat)]
+        report[name] = {'median_ms': statistics.median(seconds for seconds, _ in runs) * 1000,
+                        'min_ms': min(seconds for seconds, _ in runs) * 1000, 'loads': runs[0][1]}
+
+    return report
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark of the import time of the package.')
+    parser.add_argument('--repeat', type=int, default=10, help='Processes of each import (default: 10)')
+    parser.add_argument('--json', help='Save the report in this JSON file')
+    args = parser.parse_args(argv)
+
+    report = bench_imports(args.repeat)
+
+    print(f'{"import":<22} {"median ms":>10} {"min ms":>8}  loads')
+    print('-' * 64)
+    for name, result in report.items():
+        print(f'{name:<22} {result["median_ms"]:>10.1f} {result["min_ms"]:>8.1f}  {", ".join(result["loads"])}')
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,3 @@
-from perfectradar.perfectradar.radar import PerfectRadar
-
 """perfect_radar
 ==========================================================
 Find the nearest listing of a coordinate in your city (Data Base).
@@ -8,5 +6,39 @@ This package let you identify the closes listings in a area of your city. Can fi
 type of offer. It will return a filter DataFrame with a new column call it 'Distancia'. This is the representation
 of the distance between the main coordinate (the area you want to analyze) and a several coordinates inside a 
 spreadsheet. 
+
+The names are imported the first time they are used (PEP 562), so 'import perfectradar' doesn't import pandas or
+geopy, and the col_creator helpers only need numpy.
 """
 
+import importlib
+
+# Name -> module of the package that defines it.
+_LAZY_NAMES = {
+    'PerfectRadar': 'radar',
+    'PreparedDataset': 'dataset',
+    'ZoneStats': 'zone_stats',
+    'segment_sector_inmo': 'col_creator',
+    'segment_sector_inmo_array': 'col_creator',
+    'avg_price_m2': 'col_creator',
+    'avg_price_m2_array': 'col_creator',
+    'avg_price_m2_const': 'col_creator',
+    'avg_price_m2_const_array': 'col_creator',
+    'distances_km': 'distances',
+}
+
+__all__ = list(_LAZY_NAMES)
+
+
+def __getattr__(name: str):
+    module = _LAZY_NAMES.get(name)
+    if module is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value  # <- The next uses don't call __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
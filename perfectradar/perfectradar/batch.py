@@ -0,0 +1,390 @@
+"""batch
+==========================================================
+Find the comparables listings of many target coordinates against one loaded DataFrame.
+
+It's the same result of applying the methods subset_by_type, set_subset_sector_inmo, mesure_df_distances, subset_by_km
+and rm_outliers for each target, but the candidates of all the targets are found with the spatial index and the
+distances are mesured in a single array operation for each chunk of targets.
+"""
+
+import numpy as np
+import pandas as pd
+from ..perfectradar.col_creator import segment_sector_inmo_array
+from ..perfectradar.distances import distances_km
+from ..perfectradar.outliers import Q_LOW, Q_HIGH, warn_ignored_columns
+
+TARGET_COLUMNS = ['lat', 'lon', 'type_of_listing', 'type_of_offer', 'price']
+TARGET_DEFAULTS = {'type_of_listing': 'Casa', 'type_of_offer': 'Buy', 'price': np.nan}
+
+
+def targets_to_df(targets) -> pd.core.frame.DataFrame:
+    """Convert the targets to a DataFrame with the columns of TARGET_COLUMNS and 'target_id'.
+
+    Parameters
+    ----------
+    targets : DataFrame or list
+        Is a DataFrame with the TARGET_COLUMNS (and optional 'target_id') or a list of rows:
+        (lat, lon[, type_of_listing, type_of_offer, price]). The missing values use the TARGET_DEFAULTS.
+
+    Returns
+    -------
+    DataFrame
+    """
+
+    if isinstance(targets, pd.DataFrame):
+        targets = targets.copy()
+    else:
+        rows = [tuple(row) for row in targets]
+        width = max((len(row) for row in rows), default=2)
+        if width < 2 or width > len(TARGET_COLUMNS):
+            raise ValueError('Each target must be a row of (lat, lon[, type_of_listing, type_of_offer, price]).')
+        targets = pd.DataFrame([row + (None,) * (width - len(row)) for row in rows],
+                               columns=TARGET_COLUMNS[:width])
+
+    for col in ['lat', 'lon']:
+        if col not in targets:
+            raise ValueError(f'The targets need the column "{col}".')
+
+    for col, default in TARGET_DEFAULTS.items():
+        targets[col] = targets[col].fillna(default) if col in targets else default
+
+    if 'target_id' not in targets:
+        targets['target_id'] = np.arange(len(targets))
+
+    return targets.reset_index(drop=True)
+
+
+def batch_query(radar, targets, radio: float = None, values_to_rm: tuple = (),
+                chunk_size: int = 2000) -> pd.core.frame.DataFrame:
+    """Find the sale and rent comparables of each target.
+
+    The result is a long table with one row for each pair (target, listing). The column 'target_id' identifies the
+    target, and the column 'side' is 'main' (type of offer of the target) or 'rent' (Rent listings of the same
+    'sector_inmo' of the target price, only for the targets that are not Rent). It includes the 'distancia' column.
+
+    Parameters
+    ----------
+    radar : PerfectRadar
+        Is the instance with the DataFrame and the config_columns. The spatial index is built if it doesn't exist.
+
+    targets : DataFrame or list
+        See the function 'targets_to_df'.
+
+    radio : float
+        Is the radio of the circle in kilometres. (Default value = None, it uses the RADIO attribute)
+
+    values_to_rm : tuple
+        Are the names of the columns to remove the outliers of each target and side.
+        (Default value = (), doesn't remove outliers)
+
+    chunk_size : int
+        Is the number of targets processed in each array operation. It limits the memory used.
+        (Default value = 2000)
+
+    Returns
+    -------
+    DataFrame
+    """
+
+    config = radar.config_columns
+    radio = radar.RADIO if radio is None else radio
+    targets = targets_to_df(targets)
+
+    if radar.spatial_index is None:
+        radar.build_spatial_index()
+
+    listings, values = encode_listings(radar.df, config)
+    encoded = encode_targets(targets, values, config)
+
+    results = []
+    for start in range(0, len(targets), chunk_size):
+        chunk = {key: array[start:start + chunk_size] for key, array in encoded.items()}
+        results.extend(chunk_pairs(radar.spatial_index, listings, chunk, start, radio, radar.DISTANCE_METHOD))
+
+    return build_result(radar.df, targets, results, config.get('ID'), values_to_rm)
+
+
+def encode_listings(df: pd.core.frame.DataFrame, config: dict) -> tuple:
+    """Convert the type of listing, type of offer and sector_inmo columns to integer codes.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Is the DataFrame of the listings
+
+    config : dict
+        Is the 'config_columns' of the PerfectRadar
+
+    Returns
+    -------
+    tuple -> (codes, values) two dictionaries with the arrays of codes and the values of each code.
+    """
+
+    codes, values = {}, {}
+    codes['listing'], values['listing'] = pd.factorize(df[config['TYPE_OF_LISTING']])
+    codes['offer'], values['offer'] = pd.factorize(df[config['TYPE_OF_OFFER']])
+    codes['sector'], values['sector'] = pd.factorize(df['sector_inmo'] if 'sector_inmo' in df else
+                                                     pd.Series('Unknown', index=df.index))
+    return codes, values
+
+
+def encode_targets(targets: pd.core.frame.DataFrame, values: dict, config: dict) -> dict:
+    """Convert the targets to arrays with the same codes of 'encode_listings'.
+
+    The values that don't exist in the DataFrame have the code -1 (never match).
+
+    Parameters
+    ----------
+    targets : DataFrame
+        Is the result of 'targets_to_df'
+
+    values : dict
+        Are the values of the codes returned by 'encode_listings'
+
+    config : dict
+        Is the 'config_columns' of the PerfectRadar
+
+    Returns
+    -------
+    dict
+    """
+
+    has_price = targets['price'].notna().to_numpy()
+    # The rent comparables are filtered by the sector_inmo of the price of the target.
+    sectors = segment_sector_inmo_array(np.full(len(targets), 'Buy'), targets['price'].to_numpy(dtype=float))
+
+    return {
+        'lat': targets['lat'].to_numpy(dtype=float),
+        'lon': targets['lon'].to_numpy(dtype=float),
+        'listing': values['listing'].get_indexer(targets['type_of_listing']),
+        'offer': values['offer'].get_indexer(targets['type_of_offer']),
+        'rent_offer': np.full(len(targets), values['offer'].get_indexer([config['RENT']])[0]),
+        'want_rent': (targets['type_of_offer'] != config['RENT']).to_numpy(),
+        'has_price': has_price,
+        'sector': values['sector'].get_indexer(sectors),
+    }
+
+
+def chunk_pairs(index, listings: dict, chunk: dict, start: int, radio: float, method: str) -> list:
+    """Find the main and rent comparables of a chunk of targets.
+
+    Parameters
+    ----------
+    index : GridIndex
+        Is the spatial index of the listings
+
+    listings : dict
+        Are the codes of the listings (encode_listings)
+
+    chunk : dict
+        Are the arrays of a chunk of targets (encode_targets)
+
+    start : int
+        Is the position of the first target of the chunk
+
+    radio : float
+        Is the radio of the circle in kilometres
+
+    method : str
+        Is the method to mesure the distances: 'haversine', 'vincenty' or 'geodesic'.
+
+    Returns
+    -------
+    list -> [(targets, positions, distances, side), ...]
+    """
+
+    pair_target, pair_position = index.candidates_many(chunk['lat'], chunk['lon'], radio)
+
+    # Filter by type before the distances, it's only an integer comparison.
+    same_listing = listings['listing'][pair_position] == chunk['listing'][pair_target]
+    offer = listings['offer'][pair_position]
+    is_main = same_listing & (offer == chunk['offer'][pair_target])
+    is_rent = same_listing & (offer == chunk['rent_offer'][pair_target]) & chunk['want_rent'][pair_target]
+    is_rent &= ~chunk['has_price'][pair_target] | (listings['sector'][pair_position] == chunk['sector'][pair_target])
+
+    results = []
+    for side, keep in (('main', is_main), ('rent', is_rent)):
+        side_target, side_position = pair_target[keep], pair_position[keep]
+        distances = distances_km(chunk['lat'][side_target], chunk['lon'][side_target],
+                                 index.lats[side_position], index.lons[side_position], method)
+        inside = distances <= radio
+        results.append((side_target[inside] + start, side_position[inside], distances[inside], side))
+
+    return results
+
+
+def build_result(df: pd.core.frame.DataFrame, targets: pd.core.frame.DataFrame, results: list, id_col: str,
+                  values_to_rm: tuple, keep_index: bool = False) -> pd.core.frame.DataFrame:
+    """Materialize the pairs (target, listing) of 'chunk_pairs' in a single DataFrame sorted by target, side and
+    listing. It removes the outliers of each target and side. With 'keep_index' the rows keep the index of the
+    listings in 'df' (like PerfectRadar.query), else the index is 0, 1, 2..."""
+
+    pair_target = np.concatenate([result[0] for result in results] + [np.empty(0, dtype=np.int64)])
+    pair_position = np.concatenate([result[1] for result in results] + [np.empty(0, dtype=np.int64)])
+    distances = np.concatenate([result[2] for result in results] + [np.empty(0)])
+    sides = np.concatenate([np.full(len(result[0]), result[3] == 'rent') for result in results] +
+                           [np.empty(0, dtype=bool)])
+
+    order = np.lexsort((pair_position, sides, pair_target))
+    pair_target, pair_position, distances, sides = (pair_target[order], pair_position[order],
+                                                    distances[order], sides[order])
+
+    result = df.take(pair_position)
+    result.insert(0, 'side', np.where(sides, 'rent', 'main'))
+    result.insert(0, 'target_id', targets['target_id'].to_numpy()[pair_target])
+    result['distancia'] = distances
+
+    if values_to_rm:
+        # The same rows of rm_outliers: the limits of the first column, then the duplicated IDs
+        warn_ignored_columns(values_to_rm)
+        val = values_to_rm[0]
+        groups = result.groupby(['target_id', 'side'], sort=False)
+        q_low = groups[val].transform('quantile', Q_LOW)
+        q_high = groups[val].transform('quantile', Q_HIGH)
+        result = result[((result[val] > q_low) & (result[val] < q_high)).to_numpy()]
+        result = result[~result.duplicated(['target_id', 'side', id_col]).to_numpy()]
+
+    return result if keep_index else result.reset_index(drop=True)
+
+
+def group_quantiles(values: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float) -> np.ndarray:
+    """Return the quantile (linear interpolation, like np.quantile) of each group of a sorted array.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Are the values sorted inside each group
+
+    starts : np.ndarray
+        Is the position of the first value of each group
+
+    counts : np.ndarray
+        Is the number of values of each group (the groups without values return NaN)
+
+    q : float
+        Is the quantile
+
+    Returns
+    -------
+    np.ndarray
+    """
+
+    rank = q * np.maximum(counts - 1, 0)
+    low = np.floor(rank).astype(np.int64)
+    high = np.minimum(low + 1, np.maximum(counts - 1, 0))
+    has_values = counts > 0
+
+    result = np.full(len(counts), np.nan)
+    low_values = values[(starts + low)[has_values]]
+    high_values = values[(starts + high)[has_values]]
+    result[has_values] = low_values + (rank - low)[has_values] * (high_values - low_values)
+    return result
+
+
+def estimate_yields(radar, targets, radio: float = None, rm_outliers: bool = True, expense_ratio: float = None,
+                    chunk_size: int = 2000) -> pd.core.frame.DataFrame:
+    """Estimate the monthly rent and the gross yield of many simulated listings.
+
+    The rent comparables of each target are the Rent listings of the same type of listing and of the 'sector_inmo' of
+    the target price inside the radio (the 'rent' side of batch_query). They are found with the spatial index and
+    summarized with array operations by target, the comparables are never materialized as a DataFrame.
+
+    Parameters
+    ----------
+    radar : PerfectRadar
+        Is the instance with the DataFrame and the config_columns. The spatial index is built if it doesn't exist.
+
+    targets : DataFrame or list
+        See the function 'targets_to_df'. With the optional column 'm2_terr' (land size of the target) it also
+        estimates the rent by the rent price of each m2 of the comparables.
+
+    radio : float
+        Is the radio of the circle in kilometres. (Default value = None, it uses the RADIO attribute)
+
+    rm_outliers : bool
+        Remove the rent prices of each target out of the Q_LOW and Q_HIGH quantiles (like rm_outliers).
+        (Default value = True)
+
+    expense_ratio : float
+        Is the part of the rent spent in expenses (Example: 0.3) to estimate the 'cap_rate'.
+        (Default value = None, without cap_rate)
+
+    chunk_size : int
+        Is the number of targets processed in each array operation. (Default value = 2000)
+
+    Returns
+    -------
+    DataFrame -> The targets with the columns 'rent_count', 'rent_median' (the estimated monthly rent),
+    'rent_mean_distance', 'est_rent_m2' (with 'm2_terr', the median rent of each m2 times m2_terr), 'gross_yield'
+    (yearly rent_median over the price), 'cap_rate' (with expense_ratio) and 'enough_rent'
+    (rent_count >= RENTAL_MINIMAL_DATA).
+    """
+
+    config = radar.config_columns
+    radio = radar.RADIO if radio is None else radio
+    targets = targets_to_df(targets)
+
+    if radar.spatial_index is None:
+        radar.build_spatial_index()
+
+    listings, values = encode_listings(radar.df, config)
+    encoded = encode_targets(targets, values, config)
+    encoded['offer'] = np.full(len(targets), -1)  # <- Only the rent side, the main side never match
+
+    rent_target, rent_position, distances = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)], [np.empty(0)]
+    for start in range(0, len(targets), chunk_size):
+        chunk = {key: array[start:start + chunk_size] for key, array in encoded.items()}
+        for pair_target, pair_position, pair_distances, side in chunk_pairs(radar.spatial_index, listings, chunk,
+                                                                            start, radio, radar.DISTANCE_METHOD):
+            if side == 'rent':
+                rent_target.append(pair_target)
+                rent_position.append(pair_position)
+                distances.append(pair_distances)
+
+    rent_target, rent_position, distances = (np.concatenate(rent_target), np.concatenate(rent_position),
+                                             np.concatenate(distances))
+    prices = radar.df[config['PRICE']].to_numpy(dtype=np.float64)[rent_position]
+
+    # Sort the comparables by target and price: the quantiles of each target are positions of the array.
+    valid = ~np.isnan(prices)
+    rent_target, rent_position, distances, prices = (rent_target[valid], rent_position[valid], distances[valid],
+                                                     prices[valid])
+    order = np.lexsort((prices, rent_target))
+    rent_target, rent_position, distances, prices = (rent_target[order], rent_position[order], distances[order],
+                                                     prices[order])
+
+    if rm_outliers:
+        counts = np.bincount(rent_target, minlength=len(targets))
+        starts = np.cumsum(counts) - counts
+        q_low = group_quantiles(prices, starts, counts, Q_LOW)[rent_target]
+        q_high = group_quantiles(prices, starts, counts, Q_HIGH)[rent_target]
+        keep = (prices > q_low) & (prices < q_high)
+        rent_target, rent_position, distances, prices = (rent_target[keep], rent_position[keep], distances[keep],
+                                                         prices[keep])
+
+    counts = np.bincount(rent_target, minlength=len(targets))
+    starts = np.cumsum(counts) - counts
+
+    result = targets.copy()
+    result['rent_count'] = counts
+    result['rent_median'] = group_quantiles(prices, starts, counts, 0.5)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['rent_mean_distance'] = np.bincount(rent_target, distances, minlength=len(targets)) / counts
+
+    if 'm2_terr' in result and 'avg_price_const' in radar.df:
+        # The median rent by m2 of the comparables with land size (the column is 0 without land size)
+        price_m2 = radar.df['avg_price_const'].to_numpy(dtype=np.float64)[rent_position]
+        has_m2 = price_m2 > 0
+        m2_target, price_m2 = rent_target[has_m2], price_m2[has_m2]
+        order_m2 = np.lexsort((price_m2, m2_target))
+        counts_m2 = np.bincount(m2_target, minlength=len(targets))
+        result['est_rent_m2'] = (group_quantiles(price_m2[order_m2], np.cumsum(counts_m2) - counts_m2, counts_m2,
+                                                 0.5) * result['m2_terr'].to_numpy(dtype=np.float64))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['gross_yield'] = result['rent_median'] * 12 / result['price']
+    if expense_ratio is not None:
+        result['cap_rate'] = result['gross_yield'] * (1 - expense_ratio)
+    result['enough_rent'] = counts >= radar.RENTAL_MINIMAL_DATA
+
+    return result
@@ -0,0 +1,238 @@
+"""cli
+==========================================================
+Command line batch mode: find the comparables of many targets and stream the results to disk.
+
+The targets file (CSV or JSONL) has one row per simulated listing with the columns 'lat', 'lon' and the optional
+'type_of_listing', 'type_of_offer', 'price', 'm2_terr', 'm2_const', 'rooms', 'bathrooms', 'cars' (the values of
+set_sim_val) and 'target_id'. It's read in batches of '--batch-size' rows; each batch is solved with batch_query and
+written as a part file of the comparables and of the summary, so the memory doesn't grow with the number of targets.
+
+After each batch the file 'checkpoint.json' of the output directory saves the number of completed batches. If the job
+stops, run the same command again and it continues after the last completed batch. The checkpoint is only used by
+the same job: other listings (other CSV files, or the same files changed), columns or options raise an error.
+
+Example:
+    perfectradar --csv ./demo_data/casa_venta ./demo_data/casa_renta --targets targets.csv --output ./result \\
+        --outliers precio_name m2_terreno_name --batch-size 5000 --format parquet
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from ..perfectradar import batch
+from ..perfectradar.radar import PerfectRadar
+
+CREATED_COLUMNS = ['sector_inmo', 'avg_price_m2', 'avg_price_const']  # <- They are not in the CSV files
+CHECKPOINT_FILE = 'checkpoint.json'
+FORMATS = ('csv', 'parquet')
+
+
+def read_targets(path: str, batch_size: int):
+    """Read the targets file in batches of DataFrames. The format depends on the extension (.jsonl/.json or CSV)."""
+
+    if path.endswith(('.jsonl', '.json')):
+        return pd.read_json(path, lines=True, chunksize=batch_size)
+    return pd.read_csv(path, chunksize=batch_size)
+
+
+def summarize(result: pd.core.frame.DataFrame, targets: pd.core.frame.DataFrame,
+              config: dict) -> pd.core.frame.DataFrame:
+    """Create one row of summary statistics for each target.
+
+    Parameters
+    ----------
+    result : DataFrame
+        Is the result of batch_query (a row for each pair target, listing)
+
+    targets : DataFrame
+        Are the targets of the batch (with 'target_id')
+
+    config : dict
+        Is the 'config_columns' of the PerfectRadar
+
+    Returns
+    -------
+    DataFrame -> The columns of the targets and, for each side (main and rent): count, median price, median
+    avg_price_m2 and mean distance. 'gross_yield' is the yearly median rent over the price of the target.
+    """
+
+    price = config['PRICE']
+    aggregations = {'count': (price, 'size'), 'median_price': (price, 'median'),
+                    'mean_distance': ('distancia', 'mean')}
+    if 'avg_price_m2' in result:
+        aggregations['median_price_m2'] = ('avg_price_m2', 'median')
+
+    stats = result.groupby(['target_id', 'side'], observed=True).agg(**aggregations).unstack('side')
+    stats.columns = [f'{side}_{name}' for name, side in stats.columns]
+
+    summary = targets.join(stats, on='target_id')
+    for side in ('main', 'rent'):
+        count = f'{side}_count'
+        summary[count] = summary[count].fillna(0).astype(np.int64) if count in summary else 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        summary['gross_yield'] = summary.get('rent_median_price', np.nan) * 12 / summary['price']
+
+    return summary
+
+
+def write_part(df: pd.core.frame.DataFrame, directory: str, number: int, file_format: str) -> str:
+    """Write a part file (part-00000.csv). It's written with a temporal name and renamed, never half written."""
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'part-{number:05d}.{file_format}')
+    tmp_path = path + '.tmp'
+
+    if file_format == 'parquet':
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_csv(tmp_path, index=False)
+
+    os.replace(tmp_path, path)
+    return path
+
+
+def file_version(path: str) -> list:
+    """Return the absolute path and the modification time of a file: [path, mtime]."""
+    return [os.path.abspath(path), os.path.getmtime(path)]
+
+
+def job_key(args: argparse.Namespace, p: PerfectRadar) -> dict:
+    """Return the description of the job saved in the checkpoint. A restart continues only the same job: the same
+    listings and targets (the same files, not changed after the checkpoint), columns and options."""
+
+    return {'csv': [file_version(path) for path in args.csv], 'targets': file_version(args.targets),
+            'columns': p.config_columns, 'extra_cols': args.extra_cols, 'batch_size': args.batch_size,
+            'format': args.format, 'radio': p.RADIO, 'outliers': args.outliers}
+
+
+def load_checkpoint(output: str, job: dict) -> int:
+    """Return the number of completed batches of the job (0 for a new job)."""
+
+    path = os.path.join(output, CHECKPOINT_FILE)
+    if not os.path.isfile(path):
+        return 0
+
+    with open(path) as file:
+        checkpoint = json.load(file)
+
+    if checkpoint['job'] != job:
+        raise ValueError(f'The output directory "{output}" has the checkpoint of other job. Use other directory or '
+                         f'remove the file {CHECKPOINT_FILE}.')
+
+    return checkpoint['completed_batches']
+
+
+def save_checkpoint(output: str, job: dict, completed_batches: int, targets_done: int) -> None:
+    """Save the number of completed batches (written in a temporal file and renamed)."""
+
+    path = os.path.join(output, CHECKPOINT_FILE)
+    with open(path + '.tmp', 'w') as file:
+        json.dump({'job': job, 'completed_batches': completed_batches, 'targets_done': targets_done}, file)
+    os.replace(path + '.tmp', path)
+
+
+def load_radar(args: argparse.Namespace, project_name: str = 'perfectradar-cli') -> PerfectRadar:
+    """Create the PerfectRadar of the arguments (add_radar_arguments) with the prepared DataFrame and the spatial
+    index."""
+
+    p = PerfectRadar(project_name, *args.csv)
+    p.config_columns(id=args.id_col, lat_col=args.lat_col, lon_col=args.lon_col,
+                     type_of_listing_col=args.listing_col, type_of_offer_col=args.offer_col,
+                     price_col=args.price_col, land_size_col=args.land_size_col, rent_value=args.rent_value)
+    if args.radio is not None:
+        p.RADIO = args.radio
+
+    extra_cols = [col for col in args.extra_cols + args.outliers if col not in CREATED_COLUMNS]
+    p.prepare_df(*extra_cols, cache_dir=args.cache_dir, prune=True)  # <- Only the columns of the job
+    p.build_spatial_index()
+    return p
+
+
+def run(args: argparse.Namespace) -> int:
+    """Run the batch job of the arguments and return the number of targets processed in this run."""
+
+    p = load_radar(args)
+
+    os.makedirs(args.output, exist_ok=True)
+    job = job_key(args, p)
+    completed = load_checkpoint(args.output, job)
+
+    processed = 0
+    start = 0
+    for number, targets in enumerate(read_targets(args.targets, args.batch_size)):
+        if 'target_id' not in targets:
+            targets['target_id'] = np.arange(start, start + len(targets))  # <- Unique in all the batches
+        start += len(targets)
+
+        if number < completed:
+            continue  # <- Completed before the restart
+
+        targets = batch.targets_to_df(targets)
+        result = p.batch_query(targets, None, *args.outliers, workers=args.workers)
+
+        write_part(result, os.path.join(args.output, 'comparables'), number, args.format)
+        write_part(summarize(result, targets, p.config_columns), os.path.join(args.output, 'summary'), number,
+                   args.format)
+        save_checkpoint(args.output, job, number + 1, start)
+        processed += len(targets)
+
+        if not args.quiet:
+            print(f'Batch {number}: {len(targets)} targets, {len(result)} comparables ({start} targets done)')
+
+    return processed
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Create the parser of the arguments. The default names of the columns are the names of run.py."""
+
+    parser = argparse.ArgumentParser(prog='perfectradar',
+                                     description='Find the comparables of many targets and stream them to disk.')
+    parser.add_argument('--targets', required=True, help='CSV or JSONL file of the targets')
+    parser.add_argument('--output', required=True, help='Output directory (comparables, summary and checkpoint)')
+    parser.add_argument('--format', choices=FORMATS, default='csv', help='Format of the part files (default: csv)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Targets of each batch (default: 1000)')
+    parser.add_argument('--outliers', nargs='*', default=[], help='Columns to remove the outliers')
+    parser.add_argument('--workers', type=int, default=1, help='Processes of the batch queries (default: 1)')
+    parser.add_argument('--quiet', action='store_true', help="Don't print the progress")
+    add_radar_arguments(parser)
+
+    return parser
+
+
+def add_radar_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments of the listings: CSV files, names of the columns, radio and cache (see load_radar)."""
+
+    parser.add_argument('--csv', nargs='+', required=True, help='CSV files of the listings')
+    parser.add_argument('--radio', type=float, help=f'Radio in kilometres (default: {PerfectRadar.RADIO})')
+    parser.add_argument('--extra-cols', nargs='*', default=[], help='Other columns of the CSV files to keep')
+    parser.add_argument('--cache-dir', help='Directory of the binary cache of the prepared listings')
+
+    columns = parser.add_argument_group('columns of the CSV files')
+    columns.add_argument('--id-col', default='sku_nombre')
+    columns.add_argument('--lat-col', default='lat_name')
+    columns.add_argument('--lon-col', default='long_name')
+    columns.add_argument('--listing-col', default='tipo_inmueble')
+    columns.add_argument('--offer-col', default='tipo_oferta_nombre')
+    columns.add_argument('--price-col', default='precio_name')
+    columns.add_argument('--land-size-col', default='m2_terreno_name')
+    columns.add_argument('--rent-value', default='Rent', help='Value of the Rent listings in the offer column')
+
+
+def main(argv: list = None) -> int:
+    """Entry point of the 'perfectradar' command."""
+
+    args = build_parser().parse_args(argv)
+    if args.batch_size < 1:
+        raise SystemExit('--batch-size must be at least 1')
+
+    run(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,19 @@
+import numpy as np
+
+SECTOR_INMO_LABELS = ['Interés Social', 'Interés Medio', 'Residencial', 'Residencial Plus', 'Premium']
+UNKNOWN_SECTOR_INMO = 'Unknown'
+
+HOUSE_LISTINGS = ['Casa', 'House']
+
+SALE_OFFERS = ['Buy', 'Venta']
+RENT_OFFERS = ['Rent', 'Renta']
+
+# (Min, Max) price of each SECTOR_INMO_LABELS. The same limits of segment_sector_inmo.
+SALE_SECTOR_LIMITS = [(-np.inf, 1000000), (1000001, 3000000), (3000001, 7000000), (7000001, 15000000),
+                      (15000001, np.inf)]
+RENT_SECTOR_LIMITS = [(-np.inf, 5000), (5001, 10000), (10001, 15000), (15001, 30000), (30001, np.inf)]
+
+
 def segment_sector_inmo(type_of_offer_col: str, price_col: int) -> int:
     """Create a New Column call it 'Sector_inmo'. This is a filter of the socioeconomic sectors in Mexico
     by the price_col of the property.
@@ -57,6 +73,64 @@ def segment_sector_inmo(type_of_offer_col: str, price_col: int) -> int:
 
     return sector_inmo
 
+def segment_sector_inmo_codes(type_of_offer: np.ndarray, price: np.ndarray) -> np.ndarray:
+    """Vectorized version of segment_sector_inmo. Return the position of the sector in SECTOR_INMO_LABELS or -1 for
+    the 'Unknown' values.
+
+    It applies a binned lookup of the price in the limits of the Sale (Buy/Venta) and Rent (Rent/Renta) tables. The
+    prices between two limits (Example: 1000000.5) and the missing prices are 'Unknown', like segment_sector_inmo.
+
+    Parameters
+    ----------
+    type_of_offer : np.ndarray
+        Are the values of the type of offer (Example: Buy, Rent)
+
+    price : np.ndarray
+        Are the prices of the listings
+
+    Returns
+    -------
+    np.ndarray
+    """
+
+    type_of_offer = np.asarray(type_of_offer, dtype=object)
+    price = np.asarray(price, dtype=np.float64)
+    codes = np.full(len(price), -1, dtype=np.int8)
+
+    for offers, limits in ((SALE_OFFERS, SALE_SECTOR_LIMITS), (RENT_OFFERS, RENT_SECTOR_LIMITS)):
+        selected = np.flatnonzero(np.isin(type_of_offer, offers))
+        selected_price = price[selected]
+
+        # The first sector with a Max bigger or equal than the price, then validate the Min.
+        mins = np.array([limit[0] for limit in limits])
+        maxs = np.array([limit[1] for limit in limits[:-1]])
+        sector = np.searchsorted(maxs, selected_price, side='left')
+        valid = selected_price >= mins[sector]
+
+        codes[selected[valid]] = sector[valid]
+
+    return codes
+
+
+def segment_sector_inmo_array(type_of_offer: np.ndarray, price: np.ndarray) -> np.ndarray:
+    """Vectorized version of segment_sector_inmo. Return an array with the names of the sectors.
+
+    Parameters
+    ----------
+    type_of_offer : np.ndarray
+        Are the values of the type of offer (Example: Buy, Rent)
+
+    price : np.ndarray
+        Are the prices of the listings
+
+    Returns
+    -------
+    np.ndarray
+    """
+
+    labels = np.array(SECTOR_INMO_LABELS + [UNKNOWN_SECTOR_INMO], dtype=object)
+    return labels[segment_sector_inmo_codes(type_of_offer, price)]  # <- The code -1 is the last label (Unknown)
+
 def avg_price_m2(price: float, land_size_m2: float, type_of_listing_col: str) -> float:
     """Creates a New Column call it mean_price_m2, that refer to the averange value
     of the meter in a listing property.
@@ -120,5 +194,63 @@ def avg_price_m2_const(price: float, m2_construction: float) -> float:
 
     return round(result)
 
+
+def avg_price_m2_const_array(price: np.ndarray, m2_construction: np.ndarray) -> np.ndarray:
+    """Vectorized version of avg_price_m2_const.
+
+    The zero divisions and the missing values return 0. The result is rounded like avg_price_m2_const.
+
+    Parameters
+    ----------
+        price : np.ndarray :
+            Are the prices of the listings
+
+        m2_construction : np.ndarray :
+            Are the Construction sizes of the listings
+
+    Returns
+    ----------
+    np.ndarray
+    """
+
+    price = np.asarray(price, dtype=np.float64)
+    m2_construction = np.asarray(m2_construction, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = np.rint(price / m2_construction)  # <- Round half to even, the same of round()
+
+    result[~np.isfinite(result)] = 0
+
+    return result.astype(np.int64)
+
+
+def avg_price_m2_array(price: np.ndarray, land_size_m2: np.ndarray, type_of_listing: np.ndarray) -> np.ndarray:
+    """Vectorized version of avg_price_m2.
+
+    Only the Houses (Casa or House) have a value, the Departments and the unknown types return 0. The zero
+    divisions and the missing values return 0.
+
+    Parameters
+    ----------
+        price : np.ndarray :
+            Are the prices of the listings
+
+        land_size_m2 : np.ndarray :
+            Are the land sizes of the listings
+
+        type_of_listing : np.ndarray
+            Are the values of the type of listing (Example: Casa, Departamento)
+
+    Returns
+    ----------
+    np.ndarray
+    """
+
+    result = avg_price_m2_const_array(price, land_size_m2)
+    result[~np.isin(np.asarray(type_of_listing, dtype=object), HOUSE_LISTINGS)] = 0
+
+    return result
+
+
 if __name__ == '__main__':
     print(avg_price_m2(5000000, 120, 'Casa'))
\ No newline at end of file
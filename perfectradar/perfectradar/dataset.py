@@ -0,0 +1,170 @@
+"""dataset
+==========================================================
+Immutable prepared dataset and stateless queries.
+
+The PerfectRadar saves the result of each step of the method chain in the instance (subset_by_type, lat, long,
+sector_inmo...), so an instance can answer only one query at a time. A PreparedDataset is a snapshot of the prepared
+DataFrame, the config_columns, the spatial index and the partitions that can't be changed. Its query methods receive
+all the values of the query and return the result without saving anything, so many threads can use the same dataset
+(numpy releases the GIL in the distances and the filters).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from ..perfectradar import query as radar_query
+
+
+class PreparedDataset:
+    """Read-only snapshot of a prepared PerfectRadar for stateless and thread-safe queries."""
+
+    __slots__ = ('df', 'config', 'spatial_index', 'partitions', 'radio', 'distance_method', 'rental_minimal_data')
+
+    def __init__(self, df: pd.core.frame.DataFrame, config: dict, spatial_index=None, partitions=None,
+                 radio: float = 1.5, distance_method: str = 'vincenty', rental_minimal_data: int = 5):
+        """Create the dataset. Use 'from_radar' to create it from a PerfectRadar.
+
+        Parameters
+        ----------
+        df : DataFrame
+            Is the prepared DataFrame (with the columns of prepare_df). Don't change it after this.
+
+        config : dict
+            Is the 'config_columns' of the PerfectRadar
+
+        spatial_index : GridIndex
+            Is the spatial index of the DataFrame. (Default value = None)
+
+        partitions : ListingPartitions
+            Are the partitions of the DataFrame. (Default value = None)
+
+        radio : float
+            Is the default radio of the queries in kilometres. (Default value = 1.5)
+
+        distance_method : str
+            Is the method to mesure the distances. (Default value = 'vincenty')
+
+        rental_minimal_data : int
+            Is the minimal amount of rent rows of the knn queries with grow_radio. (Default value = 5)
+        """
+
+        for name, value in (('df', df), ('config', dict(config)), ('spatial_index', spatial_index),
+                            ('partitions', partitions), ('radio', radio), ('distance_method', distance_method),
+                            ('rental_minimal_data', rental_minimal_data)):
+            object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_radar(cls, radar, build_index: bool = True) -> 'PreparedDataset':
+        """Create a snapshot of a PerfectRadar with the prepared DataFrame.
+
+        The later changes of the PerfectRadar (append_rows, new columns, new indexes...) don't change the dataset:
+        the DataFrame is a deep copy (the in place changes of the radar don't reach it with any version of pandas) and
+        the spatial index and the partitions are copied.
+
+        Parameters
+        ----------
+        radar : PerfectRadar
+            Is the instance with the prepared DataFrame (prepare_df)
+
+        build_index : bool
+            Build the spatial index of the radar if it doesn't exist. (Default value = True)
+
+        Returns
+        -------
+        PreparedDataset
+        """
+
+        if radar.df is None:
+            raise ValueError('You need to apply the method prepare_df first to make this action')
+
+        if build_index and radar.spatial_index is None:
+            radar.build_spatial_index()
+
+        return cls(radar.df.copy(), radar.config_columns,
+                   radar.spatial_index.copy() if radar.spatial_index is not None else None,
+                   radar.partitions.copy() if radar.partitions is not None else None,
+                   radar.RADIO, radar.DISTANCE_METHOD, radar.RENTAL_MINIMAL_DATA)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('The PreparedDataset is immutable, create a new one with from_radar.')
+
+    def __delattr__(self, name):
+        raise AttributeError('The PreparedDataset is immutable, create a new one with from_radar.')
+
+    def __len__(self):
+        return len(self.df)
+
+    def __repr__(self):
+        return f'PreparedDataset(listings={len(self)}, indexed={self.spatial_index is not None})'
+
+    def query(self, lat: float, lon: float, type_of_listing: str = 'Casa', type_of_offer: str = 'Buy',
+              price: float = None, radio: float = None, values_to_rm: tuple = ()) -> tuple:
+        """Find the main and rent comparables of a coordinate (the same result of PerfectRadar.query).
+
+        Parameters
+        ----------
+        lat : float
+            Is the Latitude of the location
+
+        lon : float
+            Is the Longitude of the location
+
+        type_of_listing : str
+            Is the type of listing (Casa or Departamento). (Default value = 'Casa')
+
+        type_of_offer : str
+            Is the type of offer (Buy or Rent). (Default value = 'Buy')
+
+        price : float
+            Is the price of the simulated listing, it selects the sector_inmo of the rent comparables.
+            (Default value = None, all the sectors)
+
+        radio : float
+            Is the radio of the circle in kilometres. (Default value = None, the radio of the dataset)
+
+        values_to_rm : tuple
+            Are the names of the columns to remove the outliers. (Default value = ())
+
+        Returns
+        -------
+        tuple -> (main DataFrame, rent DataFrame or None)
+        """
+
+        return radar_query.radar_query(self.df, self.config, lat, lon, type_of_listing, type_of_offer, price,
+                                       self.radio if radio is None else radio, tuple(values_to_rm),
+                                       self.distance_method, self.spatial_index, self.partitions)
+
+    def knn(self, lat: float, lon: float, k: int = 10, type_of_listing: str = 'Casa', type_of_offer: str = 'Buy',
+            price: float = None, radio: float = None, grow_radio: bool = False) -> tuple:
+        """Find the k nearest main and rent comparables of a coordinate (the same result of PerfectRadar.knn_query).
+
+        Returns
+        -------
+        tuple -> (main DataFrame, rent DataFrame or None) sorted by 'distancia'
+        """
+
+        if grow_radio and radio is None:
+            radio = self.radio
+
+        return radar_query.radar_knn(self.df, self.config, lat, lon, k, type_of_listing, type_of_offer, price, radio,
+                                     self.rental_minimal_data if grow_radio else None, self.distance_method,
+                                     self.spatial_index, self.partitions)
+
+    def query_many(self, queries: list, workers: int = 4) -> list:
+        """Run many queries in a pool of threads over this dataset.
+
+        Parameters
+        ----------
+        queries : list
+            Are the keyword arguments of each query (Example: [{'lat': 20.69, 'lon': -103.41, 'price': 6500000}])
+
+        workers : int
+            Is the number of threads. (Default value = 4)
+
+        Returns
+        -------
+        list -> The results of the queries in the same order
+        """
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda kwargs: self.query(**kwargs), queries))
@@ -0,0 +1,220 @@
+"""df_cache
+==========================================================
+Binary cache of the prepared DataFrame (after cvs_to_df and the set_* columns methods).
+
+Each column is saved as a .npy file inside a directory named with the key of the cache. The key depends on the paths,
+size and modification time of the CSV files and the 'config_columns' mapping, so any change in the sources creates a
+new cache (and the old caches of the same CSV files are removed). The numeric columns are loaded memory-mapped (they
+are read from disk only when they are used). Nothing is saved with pickle, so loading a cache never executes code.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+CACHE_VERSION = 2  # <- Change it when the format of the files changes
+META_FILE = 'meta.json'
+
+
+def cache_key(paths: tuple, config: dict, extra_cols: tuple = (), options: dict = None) -> str:
+    """Create the key of the cache of a list of CSV files.
+
+    Parameters
+    ----------
+    paths : tuple
+        Are the paths of the CSV files
+
+    config : dict
+        Is the 'config_columns' of the PerfectRadar
+
+    extra_cols : tuple
+        Are the extra columns read by cvs_to_df
+        (Default value = ())
+
+    options : dict
+        Are the other options of cvs_to_df (Example: {'prune': True})
+        (Default value = None)
+
+    Returns
+    -------
+    str
+    """
+
+    sources = []
+    for path in paths:
+        stat = os.stat(path)
+        sources.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+
+    content = json.dumps({'version': CACHE_VERSION, 'sources': sources, 'config': config,
+                          'extra_cols': list(extra_cols), 'options': options or {}}, sort_keys=True, default=str)
+
+    return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+
+def source_key(paths: tuple) -> str:
+    """Create the key of the CSV files only (without size, mtime or options). The caches with the same source key
+    are older versions of the same data."""
+    content = json.dumps([os.path.abspath(path) for path in paths])
+    return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+
+def prune_stale(directory: str, source: str) -> list:
+    """Remove the other caches of the parent directory created from the same source (see source_key).
+
+    Parameters
+    ----------
+    directory : str
+        Is the directory of the current cache (it's kept)
+
+    source : str
+        Is the source key of the current cache
+
+    Returns
+    -------
+    list
+        The removed directories
+    """
+
+    parent = os.path.dirname(os.path.abspath(directory))
+    removed = []
+    for name in os.listdir(parent):
+        path = os.path.join(parent, name)
+        if name.startswith('.tmp-') or os.path.abspath(path) == os.path.abspath(directory) or not is_cached(path):
+            continue
+
+        try:
+            with open(os.path.join(path, META_FILE)) as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            continue
+
+        if meta.get('source') == source:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+
+    return removed
+
+
+def save_df(df: pd.core.frame.DataFrame, directory: str, source: str = None) -> str:
+    """Save the DataFrame as .npy column files in the directory.
+
+    It's written in a temporal directory and renamed at the end, so a cache is never read half written.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Is the DataFrame to save. The index is not saved (cvs_to_df always creates a RangeIndex).
+
+    directory : str
+        Is the directory of the cache
+
+    source : str
+        Is the source key of the CSV files (see source_key). The older caches of the same source are removed.
+        (Default value = None, doesn't remove anything)
+
+    Returns
+    -------
+    str
+    """
+
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp_directory = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+
+    try:
+        columns = []
+        for position, (name, col) in enumerate(df.items()):
+            file_name = f'{position}.npy'
+            meta = {'name': name, 'file': file_name}
+
+            if isinstance(col.dtype, pd.CategoricalDtype):
+                meta['kind'] = 'category'
+                meta['categories'] = col.cat.categories.tolist()
+                values = col.cat.codes.to_numpy()
+            elif pd.api.types.is_numeric_dtype(col.dtype) and not pd.api.types.is_extension_array_dtype(col.dtype):
+                meta['kind'] = 'numeric'
+                values = col.to_numpy()
+            elif pd.api.types.infer_dtype(col, skipna=True) in ('string', 'empty'):
+                # Text columns are saved as fixed width unicode (no pickle) with a mask of the missing values.
+                meta['kind'] = 'string'
+                missing = col.isna().to_numpy()
+                np.save(os.path.join(tmp_directory, f'{position}.missing.npy'), missing)
+                values = col.fillna('').to_numpy(dtype=str)
+            else:
+                # Other values are saved as codes and unique values in the meta.json (no pickle)
+                meta['kind'] = 'object'
+                codes, uniques = pd.factorize(col, use_na_sentinel=True)
+                meta['values'] = [value.item() if isinstance(value, np.generic) else value for value in uniques]
+                values = codes
+
+            np.save(os.path.join(tmp_directory, file_name), values, allow_pickle=False)
+            columns.append(meta)
+
+        with open(os.path.join(tmp_directory, META_FILE), 'w') as file:
+            try:
+                json.dump({'version': CACHE_VERSION, 'rows': len(df), 'source': source, 'columns': columns}, file)
+            except TypeError as error:
+                raise ValueError(f'The DataFrame has values that cannot be cached: {error}') from error
+
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.replace(tmp_directory, directory)
+    except BaseException:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        raise
+
+    if source is not None:
+        prune_stale(directory, source)
+
+    return directory
+
+
+def load_df(directory: str, mmap: bool = True) -> pd.core.frame.DataFrame:
+    """Load a DataFrame saved with 'save_df'.
+
+    Parameters
+    ----------
+    directory : str
+        Is the directory of the cache
+
+    mmap : bool
+        Load the numeric columns memory-mapped (read only).
+        (Default value = True)
+
+    Returns
+    -------
+    DataFrame
+    """
+
+    with open(os.path.join(directory, META_FILE)) as file:
+        meta = json.load(file)
+
+    mmap_mode = 'r' if mmap else None
+    data = {}
+    for col in meta['columns']:
+        path = os.path.join(directory, col['file'])
+
+        if col['kind'] == 'numeric':
+            data[col['name']] = np.asarray(np.load(path, mmap_mode=mmap_mode))  # <- ndarray view of the file
+        elif col['kind'] == 'category':
+            data[col['name']] = pd.Categorical.from_codes(np.load(path), categories=col['categories'])
+        elif col['kind'] == 'string':
+            values = np.load(path).astype(object)
+            values[np.load(path.replace('.npy', '.missing.npy'))] = None
+            data[col['name']] = values  # <- pandas infers the text type (like read_csv)
+        else:
+            codes = np.load(path)
+            values = np.fromiter(col['values'] + [None], dtype=object, count=len(col['values']) + 1)
+            data[col['name']] = values[codes]  # <- The code -1 (missing value) takes the last one (None)
+
+    return pd.DataFrame(data, copy=False)
+
+
+def is_cached(directory: str) -> bool:
+    """Validate if the directory contains a complete cache."""
+    return os.path.isfile(os.path.join(directory, META_FILE))
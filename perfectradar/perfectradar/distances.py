@@ -0,0 +1,317 @@
+"""distances
+==========================================================
+Vectorized distance functions between one main coordinate and many coordinates.
+
+All the functions receive the main latitude and longitude (degrees) and two arrays with the latitudes and longitudes
+of the listings. They return a float array with the distance in kilometres of each listing to the main coordinate.
+The main latitude and longitude can also be arrays (one main coordinate per listing) to mesure many pairs at once.
+
+Available methods:
+    'haversine': Great circle distance over a sphere of radius EARTH_RADIUS_KM. It is the fastest, but the error
+                 against the ellipsoid can reach 0.6% (around 9 meters in a 1.5 km radio).
+    'vincenty':  Vincenty inverse formula over the WGS-84 ellipsoid. The result stays within 1 millimeter of geopy
+                 (geodesic). The rows that don't converge (nearly antipodal points) are calculated with geopy.
+    'geodesic':  The geopy geodesic distance applied row by row. It is the slowest, use it only as reference.
+
+geopy is imported only when it's used (the 'geodesic' method or the Vincenty rows that don't converge).
+"""
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088  # <- Mean radius of the Earth (IUGG)
+MAX_DISTANCE_KM = 20040.0  # <- Half of the Equator, there are no points farther than it
+
+# WGS-84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Mesure the great circle distance between the main coordinate and many coordinates.
+
+    Parameters
+    ----------
+    lat : float
+        Is the Latitude of the main location
+
+    lon : float
+        Is the Longitude of the main location
+
+    lats : np.ndarray
+        Are the Latitudes of the listings
+
+    lons : np.ndarray
+        Are the Longitudes of the listings
+
+    Returns
+    -------
+    np.ndarray
+    """
+
+    lat1 = np.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    d_lat = lat2 - lat1
+    d_lon = np.radians(np.asarray(lons, dtype=np.float64) - lon)
+
+    h = np.sin(d_lat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(d_lon / 2) ** 2
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+
+def vincenty_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray,
+                tol: float = 1e-12, max_iter: int = 200) -> np.ndarray:
+    """Mesure the ellipsoidal (WGS-84) distance between the main coordinate and many coordinates.
+
+    Apply the Vincenty inverse formula to all the rows at the same time. The iteration stops when all the rows
+    converge or 'max_iter' is reached. The rows that don't converge are calculated with geopy.
+
+    Parameters
+    ----------
+    lat : float
+        Is the Latitude of the main location
+
+    lon : float
+        Is the Longitude of the main location
+
+    lats : np.ndarray
+        Are the Latitudes of the listings
+
+    lons : np.ndarray
+        Are the Longitudes of the listings
+
+    tol : float
+        Is the tolerance of lambda (radians) to stop the iteration.
+        (Default value = 1e-12)
+
+    max_iter : int
+        Is the maximum number of iterations.
+        (Default value = 200)
+
+    Returns
+    -------
+    np.ndarray
+    """
+
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    f = WGS84_F
+    big_l = np.radians(lons - lon)
+    u1 = np.arctan((1 - f) * np.tan(np.radians(lat)))
+    u2 = np.arctan((1 - f) * np.tan(np.radians(lats)))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+
+    # The Missing coordinates return NaN and don't participate in the convergence.
+    valid = np.isfinite(big_l) & np.isfinite(u2)
+    converged = ~valid
+
+    lam = big_l
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(max_iter):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.sqrt((cos_u2 * sin_lam) ** 2 + (cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam) ** 2)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+
+            sin_alpha = np.where(sin_sigma == 0, 0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # In the Equatorial line cos2_alpha is zero.
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+
+            c = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            lam_prev = lam
+            lam = big_l + (1 - c) * f * sin_alpha * (
+                    sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+
+            converged |= np.abs(lam - lam_prev) < tol
+            if converged.all():
+                break
+
+        u_sq = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+        big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+        big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+        delta_sigma = big_b * sin_sigma * (cos_2sigma_m + big_b / 4 * (
+                cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+                big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+
+    result = WGS84_B * big_a * (sigma - delta_sigma) / 1000
+    result[~valid] = np.nan
+
+    # Nearly antipodal points: Vincenty doesn't converge, use the geodesic of geopy.
+    pending = ~converged
+    if pending.any():
+        result[pending] = geodesic_km(np.broadcast_to(lat, lats.shape)[pending],
+                                      np.broadcast_to(lon, lons.shape)[pending], lats[pending], lons[pending])
+
+    return result
+
+
+def geodesic_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Mesure the geodesic distance of geopy between the main coordinate and many coordinates (row by row).
+
+    Parameters
+    ----------
+    lat : float
+        Is the Latitude of the main location
+
+    lon : float
+        Is the Longitude of the main location
+
+    lats : np.ndarray
+        Are the Latitudes of the listings
+
+    lons : np.ndarray
+        Are the Longitudes of the listings
+
+    Returns
+    -------
+    np.ndarray
+    """
+
+    from geopy import distance  # <- Slow import, only when it's used
+
+    lats, lons, lat, lon = np.broadcast_arrays(np.asarray(lats, dtype=np.float64),
+                                               np.asarray(lons, dtype=np.float64), lat, lon)
+
+    return np.array([distance.distance((lat_1, lon_1), (lat_2, lon_2)).km if np.isfinite(lat_2 + lon_2) else np.nan
+                     for lat_1, lon_1, lat_2, lon_2 in zip(lat, lon, lats, lons)], dtype=np.float64)
+
+
+DISTANCE_METHODS = {
+    'haversine': haversine_km,
+    'vincenty': vincenty_km,
+    'geodesic': geodesic_km,
+}
+
+
+def distances_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray,
+                 method: str = 'vincenty') -> np.ndarray:
+    """Mesure the distance between the main coordinate and many coordinates with the selected method.
+
+    Parameters
+    ----------
+    lat : float
+        Is the Latitude of the main location
+
+    lon : float
+        Is the Longitude of the main location
+
+    lats : np.ndarray
+        Are the Latitudes of the listings
+
+    lons : np.ndarray
+        Are the Longitudes of the listings
+
+    method : str
+        Is the name of the method: 'haversine', 'vincenty' or 'geodesic'.
+        (Default value = 'vincenty')
+
+    Returns
+    -------
+    np.ndarray
+    """
+
+    if method not in DISTANCE_METHODS:
+        raise ValueError(f'The distance method "{method}" is not valid. Use one of: {", ".join(DISTANCE_METHODS)}')
+
+    return DISTANCE_METHODS[method](lat, lon, lats, lons)
+
+
+# Lower bounds of the kilometres in one degree. They make the bounding box conservative for all the methods.
+KM_PER_DEGREE_LAT = 110.574  # <- Meridian degree in the Equator (WGS-84)
+KM_PER_DEGREE_LON = 111.195  # <- Equator degree of the sphere of radius EARTH_RADIUS_KM
+
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> tuple:
+    """Calculate the latitude and longitude limits of a box that contains the circle of 'radius_km' around the
+    main coordinate.
+
+    The box is a little bigger than the circle, because it uses the minimum length of a degree. In the poles it
+    includes all the longitudes. The longitude limits can be out of the [-180, 180] range when the circle cross
+    the antimeridian (use 'lon_ranges' to split them).
+
+    Parameters
+    ----------
+    lat : float
+        Is the Latitude of the main location
+
+    lon : float
+        Is the Longitude of the main location
+
+    radius_km : float
+        Is the radio of the circle in kilometres
+
+    Returns
+    -------
+    tuple -> (lat_min, lat_max, lon_min, lon_max)
+    """
+
+    d_lat = radius_km / KM_PER_DEGREE_LAT
+    lat_min, lat_max = lat - d_lat, lat + d_lat
+
+    # Validate if the circle includes a Pole
+    if lat_min <= -90 or lat_max >= 90:
+        return max(lat_min, -90.0), min(lat_max, 90.0), -180.0, 180.0
+
+    d_lon = radius_km / (KM_PER_DEGREE_LON * np.cos(np.radians(max(abs(lat_min), abs(lat_max)))))
+    if d_lon >= 180:
+        return lat_min, lat_max, -180.0, 180.0
+
+    return lat_min, lat_max, lon - d_lon, lon + d_lon
+
+
+def lon_ranges(lon_min: float, lon_max: float) -> list:
+    """Split the longitude limits of a bounding box in ranges inside [-180, 180].
+
+    Parameters
+    ----------
+    lon_min : float
+        Is the minimal Longitude of the box
+
+    lon_max : float
+        Is the maximal Longitude of the box
+
+    Returns
+    -------
+    list -> [(lon_min, lon_max), ...]
+    """
+
+    if lon_min < -180:
+        return [(lon_min + 360, 180.0), (-180.0, lon_max)]
+
+    if lon_max > 180:
+        return [(lon_min, 180.0), (-180.0, lon_max - 360)]
+
+    return [(lon_min, lon_max)]
+
+
+def bbox_mask(lats: np.ndarray, lons: np.ndarray, box: tuple) -> np.ndarray:
+    """Return a boolean mask of the coordinates inside the bounding box.
+
+    Parameters
+    ----------
+    lats : np.ndarray
+        Are the Latitudes of the listings
+
+    lons : np.ndarray
+        Are the Longitudes of the listings
+
+    box : tuple
+        Is the result of the function 'bounding_box': (lat_min, lat_max, lon_min, lon_max)
+
+    Returns
+    -------
+    np.ndarray
+    """
+
+    lats = np.asarray(lats)
+    lons = np.asarray(lons)
+    lat_min, lat_max, lon_min, lon_max = box
+
+    mask_lon = np.zeros(len(lons), dtype=bool)
+    for range_min, range_max in lon_ranges(lon_min, lon_max):
+        mask_lon |= (lons >= range_min) & (lons <= range_max)
+
+    return mask_lon & (lats >= lat_min) & (lats <= lat_max)
@@ -0,0 +1,181 @@
+"""instrument
+==========================================================
+Timing and counters of the calls to the methods of the PerfectRadar.
+
+The methods are wrapped with the decorator 'instrumented'. While the instrumentation of the instance is None (the
+default) the wrapper only checks that attribute and calls the method. When it's enabled, each call records the wall
+time, the rows before and after, and (optional) the memory growth, in a CallStats that is saved and sent to the
+callback.
+"""
+
+import functools
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+
+import pandas as pd
+
+CallStats = namedtuple('CallStats', ['method', 'seconds', 'rows_in', 'rows_out', 'memory_bytes', 'depth', 'error'])
+
+
+class Instrumentation:
+    """Records of the method calls of a PerfectRadar."""
+
+    def __init__(self, callback=None, track_memory: bool = False):
+        """Create an empty instrumentation.
+
+        Parameters
+        ----------
+        callback : callable
+            Is a function called with the CallStats of each call (Example: send it to the metrics system).
+            (Default value = None)
+
+        track_memory : bool
+            Mesure the memory growth of each call with tracemalloc (it starts tracemalloc, and it makes slower the
+            code). (Default value = False)
+        """
+
+        self.callback = callback
+        self.track_memory = track_memory
+        self.records = []
+        self.local = threading.local()  # <- The depth of the calls of each thread
+
+        self.started_tracing = track_memory and not tracemalloc.is_tracing()  # <- Stopped by 'stop'
+        if self.started_tracing:
+            tracemalloc.start()
+
+    @property
+    def depth(self) -> int:
+        """Is the depth of the current call of this thread: the methods called inside other method have depth > 0."""
+        return getattr(self.local, 'depth', 0)
+
+    @depth.setter
+    def depth(self, depth: int) -> None:
+        self.local.depth = depth
+
+    def __len__(self):
+        return len(self.records)
+
+    def __repr__(self):
+        return f'Instrumentation(calls={len(self)}, track_memory={self.track_memory})'
+
+    def record(self, stats: CallStats) -> None:
+        """Save the stats of a call and send them to the callback."""
+        self.records.append(stats)
+        if self.callback is not None:
+            self.callback(stats)
+
+    def summary(self, top_level: bool = True) -> dict:
+        """Return the total of the calls of each method.
+
+        Parameters
+        ----------
+        top_level : bool
+            Only the calls made by the user (depth 0), the time of the inner calls is already in them.
+            (Default value = True)
+
+        Returns
+        -------
+        dict -> {method: {'calls', 'seconds', 'rows_in', 'rows_out', 'memory_bytes', 'errors'}}
+        """
+
+        summary = {}
+        for stats in self.records:
+            if top_level and stats.depth:
+                continue
+            total = summary.setdefault(stats.method, {'calls': 0, 'seconds': 0.0, 'rows_in': 0, 'rows_out': 0,
+                                                      'memory_bytes': 0, 'errors': 0})
+            total['calls'] += 1
+            total['seconds'] += stats.seconds
+            total['rows_in'] += stats.rows_in
+            total['rows_out'] += stats.rows_out
+            total['memory_bytes'] += stats.memory_bytes or 0
+            total['errors'] += stats.error is not None
+
+        return summary
+
+    def clear(self) -> None:
+        """Remove all the records."""
+        self.records.clear()
+
+    def stop(self) -> None:
+        """Stop tracemalloc if this instrumentation started it (the other allocations are not traced anymore)."""
+        if self.started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.started_tracing = False
+
+
+def count_rows(value) -> int:
+    """Return the rows of a DataFrame or the sum of the rows of a tuple of DataFrames (0 for other values)."""
+
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, tuple):
+        return sum(len(item) for item in value if isinstance(item, pd.DataFrame))
+    return 0
+
+
+def frame_rows(radar) -> int:
+    """Return the rows of the DataFrame of the radar without the pending updates of append_rows and remove_rows (the
+    'df' attribute would apply them)."""
+    return count_rows(radar.__dict__.get('_df'))
+
+
+def subset_rows(radar) -> int:
+    """Return the rows of the subsets of the method chain (subset_by_type and subset_by_type_rent), or of the
+    DataFrame before subset_by_type."""
+
+    main = radar.__dict__.get('subset_by_type')  # <- The instance attribute, not the method
+    if isinstance(main, pd.DataFrame):
+        return count_rows((main, radar.__dict__.get('subset_by_type_rent')))
+    return frame_rows(radar)
+
+
+def instrumented(rows_in: str = 'df'):
+    """Decorator of the methods of PerfectRadar to record their calls in the 'instrumentation' attribute.
+
+    Parameters
+    ----------
+    rows_in : str
+        Are the input rows of the method: 'df' (the DataFrame), 'subset' (the subsets of the method chain) or 'arg'
+        (the first DataFrame argument). (Default value = 'df')
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            instrumentation = getattr(self, 'instrumentation', None)
+            if instrumentation is None:
+                return method(self, *args, **kwargs)  # <- Disabled: a single attribute check
+
+            if rows_in == 'arg':
+                rows_before = next((len(arg) for arg in args if isinstance(arg, pd.DataFrame)), 0)
+            elif rows_in == 'subset':
+                rows_before = subset_rows(self)
+            else:
+                rows_before = frame_rows(self)
+
+            track_memory = instrumentation.track_memory and tracemalloc.is_tracing()
+            memory_before = tracemalloc.get_traced_memory()[0] if track_memory else None
+            depth = instrumentation.depth
+            instrumentation.depth += 1
+            error, result = None, None
+            start = time.perf_counter()
+            try:
+                result = method(self, *args, **kwargs)
+                return result
+            except BaseException as exception:
+                error = type(exception).__name__
+                raise
+            finally:
+                seconds = time.perf_counter() - start
+                instrumentation.depth = depth
+                rows_after = count_rows(result) if isinstance(result, (pd.DataFrame, tuple)) else subset_rows(self)
+                memory = tracemalloc.get_traced_memory()[0] - memory_before if track_memory else None
+                instrumentation.record(CallStats(method.__name__, seconds, rows_before, rows_after, memory, depth,
+                                                 error))
+
+        return wrapper
+
+    return decorator
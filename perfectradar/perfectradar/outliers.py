@@ -0,0 +1,80 @@
+"""outliers
+==========================================================
+Remove the outliers with a single boolean mask.
+
+The quantile limits are calculated in one call and can be saved to apply them again in other queries without
+calculating the quantiles.
+
+rm_outliers keeps the result of the original concat + drop_duplicates: each column was filtered over the rows kept by
+the previous one and the tables were concatenated, so the result was the rows inside the limits of the first column
+(without duplicated IDs). The other columns don't remove rows, and a warning says it when they are passed.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+Q_LOW = 0.01
+Q_HIGH = 0.99
+
+
+def quantile_bounds(dataframe: pd.core.frame.DataFrame, *values_to_rm: str, q_low: float = Q_LOW,
+                    q_high: float = Q_HIGH) -> dict:
+    """Calculate the limits of the outliers of the columns.
+
+    Parameters
+    ----------
+    dataframe : pd.core.frame.DataFrame :
+        Is the DataFrame to calculate the limits
+
+    *values_to_rm : str :
+        Are the names of the columns
+
+    q_low : float
+        Is the quantile of the minimal value. (Default value = 0.01)
+
+    q_high : float
+        Is the quantile of the maximal value. (Default value = 0.99)
+
+    Returns
+    -------
+    dict -> {column: (min, max)}
+    """
+
+    quantiles = dataframe[list(values_to_rm)].quantile([q_low, q_high])
+    return {val: (quantiles[val].iloc[0], quantiles[val].iloc[1]) for val in values_to_rm}
+
+
+def outliers_mask(dataframe: pd.core.frame.DataFrame, bounds: dict) -> np.ndarray:
+    """Return a boolean mask of the rows inside the limits (not included) of all the columns.
+
+    Parameters
+    ----------
+    dataframe : pd.core.frame.DataFrame :
+        Is the DataFrame to filter
+
+    bounds : dict
+        Are the limits of each column: {column: (min, max)}
+
+    Returns
+    -------
+    np.ndarray
+    """
+
+    mask = np.ones(len(dataframe), dtype=bool)
+    for val, (q_low, q_high) in bounds.items():
+        values = dataframe[val].to_numpy()
+        mask &= (values > q_low) & (values < q_high)
+
+    return mask
+
+
+def warn_ignored_columns(columns) -> None:
+    """Warn that the columns after the first one don't remove outliers (see the module docstring)."""
+
+    columns = list(columns)
+    if len(columns) > 1:
+        warnings.warn(f'Only the limits of the first column ({columns[0]!r}) remove outliers, the columns '
+                      f'{columns[1:]} don\'t change the result (the rows of the original concat + drop_duplicates).',
+                      stacklevel=3)
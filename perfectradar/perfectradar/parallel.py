@@ -0,0 +1,115 @@
+"""parallel
+==========================================================
+Run the batch queries in a pool of processes.
+
+The arrays of the listings (coordinates, codes of the types and the spatial index) are copied only once to the shared
+memory. Each worker attach to them when it starts, so the tasks only send the arrays of a chunk of targets and
+receive the positions and distances of the comparables. The DataFrame is never pickled.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from ..perfectradar import batch
+from ..perfectradar.spatial_index import GridIndex
+
+# Worker state, it's created by the initializer of each process.
+_worker = {}
+
+
+def parallel_batch_query(radar, targets, radio: float = None, values_to_rm: tuple = (),
+                         workers: int = None, chunk_size: int = 2000) -> pd.core.frame.DataFrame:
+    """Find the sale and rent comparables of each target using a pool of processes.
+
+    The result is the same of batch.batch_query (in the same order of the targets).
+
+    Parameters
+    ----------
+    radar : PerfectRadar
+        Is the instance with the DataFrame and the config_columns. The spatial index is built if it doesn't exist.
+
+    targets : DataFrame or list
+        See the function batch.targets_to_df.
+
+    radio : float
+        Is the radio of the circle in kilometres. (Default value = None, it uses the RADIO attribute)
+
+    values_to_rm : tuple
+        Are the names of the columns to remove the outliers of each target and side.
+        (Default value = (), doesn't remove outliers)
+
+    workers : int
+        Is the number of processes. (Default value = None, the number of CPUs)
+
+    chunk_size : int
+        Is the number of targets of each task. (Default value = 2000)
+
+    Returns
+    -------
+    DataFrame
+    """
+
+    config = radar.config_columns
+    radio = radar.RADIO if radio is None else radio
+    workers = workers or os.cpu_count()
+    targets = batch.targets_to_df(targets)
+
+    if radar.spatial_index is None:
+        radar.build_spatial_index()
+    index = radar.spatial_index
+
+    listings, values = batch.encode_listings(radar.df, config)
+    encoded = batch.encode_targets(targets, values, config)
+
+    arrays = {'lats': index.lats, 'lons': index.lons, 'keys': index.keys, 'positions': index.positions}
+    arrays.update({f'code_{key}': array for key, array in listings.items()})
+
+    blocks, specs = [], {}
+    try:
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            specs[name] = (block.name, array.shape, array.dtype.str)
+
+        starts = range(0, len(targets), chunk_size)
+        chunks = ({key: array[start:start + chunk_size] for key, array in encoded.items()} for start in starts)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(specs, index.cell_km, radio, radar.DISTANCE_METHOD)) as executor:
+            # map returns the results in the order of the targets
+            results = [result for chunk_results in executor.map(_run_chunk, chunks, starts)
+                       for result in chunk_results]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    return batch.build_result(radar.df, targets, results, config.get('ID'), values_to_rm)
+
+
+def _init_worker(specs: dict, cell_km: float, radio: float, method: str) -> None:
+    """Attach the worker to the arrays of the shared memory."""
+
+    blocks, arrays = [], {}
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)  # <- The processes share the resource tracker
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+    _worker['blocks'] = blocks  # <- Keep the reference, the arrays use its memory
+    _worker['index'] = GridIndex.from_arrays(arrays['lats'], arrays['lons'], arrays['keys'], arrays['positions'],
+                                             cell_km)
+    _worker['listings'] = {name[len('code_'):]: array for name, array in arrays.items() if name.startswith('code_')}
+    _worker['radio'] = radio
+    _worker['method'] = method
+
+
+def _run_chunk(chunk: dict, start: int) -> list:
+    """Find the comparables of a chunk of targets in the worker."""
+    return batch.chunk_pairs(_worker['index'], _worker['listings'], chunk, start, _worker['radio'],
+                             _worker['method'])
@@ -0,0 +1,204 @@
+"""partitions
+==========================================================
+Group index of the listings by (type_of_listing, type_of_offer, sector_inmo).
+
+The positions of the rows are sorted once by (type_of_listing, type_of_offer) and once by the three columns, so each
+group is a continuous block of the sorted positions. Get the rows of a group is a dictionary lookup and a slice (no
+boolean scan of the DataFrame). The coordinates are sorted in the same order, so each partition has its own
+coordinate arrays ready for the distances.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+Partition = namedtuple('Partition', ['positions', 'lats', 'lons'])
+
+
+class ListingPartitions:
+    """Sorted group index of a DataFrame of listings."""
+
+    def __init__(self, df: pd.core.frame.DataFrame, config: dict):
+        """Build the partitions of the DataFrame.
+
+        Parameters
+        ----------
+        df : DataFrame
+            Is the DataFrame of the listings. The positions returned are positions of this DataFrame.
+
+        config : dict
+            Is the 'config_columns' of the PerfectRadar
+        """
+
+        listing, offer, sector, lats, lons = _group_columns(df, config)
+
+        # Two sorted copies of the positions: by (listing, offer) and by (listing, offer, sector). Inside each block
+        # the positions keep the order of the DataFrame (like a boolean filter).
+        self.levels = {2: _sorted_blocks([listing, offer], lats, lons),
+                       3: _sorted_blocks([listing, offer, sector], lats, lons)}
+        self.n_rows = len(df)
+        self.config = config
+
+    def __len__(self):
+        return self.n_rows
+
+    def __repr__(self):
+        return f'ListingPartitions(listings={len(self)}, groups={len(self.keys())})'
+
+    def keys(self) -> list:
+        """Return the keys of the partitions: (listing, offer) and (listing, offer, sector)."""
+        return [key for level in self.levels.values() for key in level['blocks']]
+
+    def get(self, type_of_listing: str, type_of_offer: str, sector_inmo: str = None) -> Partition:
+        """Return the positions and coordinates of a partition. They are views, not copies.
+
+        Parameters
+        ----------
+        type_of_listing : str
+            Is the type of listing (Casa or Departamento).
+
+        type_of_offer : str
+            Is the type of offer (Buy or Rent).
+
+        sector_inmo : str
+            Is the sector_inmo (Example: 'Residencial'). (Default value = None, all the sectors)
+
+        Returns
+        -------
+        Partition -> (positions, lats, lons)
+        """
+
+        key = (type_of_listing, type_of_offer) if sector_inmo is None else \
+            (type_of_listing, type_of_offer, sector_inmo)
+        level = self.levels[len(key)]
+        start, stop = level['blocks'].get(key, (0, 0))
+
+        return Partition(level['order'][start:stop], level['lats'][start:stop], level['lons'][start:stop])
+
+    def copy(self) -> 'ListingPartitions':
+        """Return a copy that is not changed by the append and remove methods of this one (the arrays are shared, they
+        are replaced, never changed in place)."""
+
+        partitions = ListingPartitions.__new__(ListingPartitions)
+        partitions.levels = {depth: dict(level, blocks=dict(level['blocks'])) for depth, level in self.levels.items()}
+        partitions.n_rows = self.n_rows
+        partitions.config = self.config
+        return partitions
+
+    def append(self, df: pd.core.frame.DataFrame) -> None:
+        """Add new listings at the end of the positions (n_rows, n_rows + 1, ...).
+
+        Only the new rows are grouped; each block is the old block followed by the new positions, so the blocks keep
+        the order of the DataFrame.
+
+        Parameters
+        ----------
+        df : DataFrame
+            Are the new rows (with the same columns of the partitioned DataFrame)
+        """
+
+        listing, offer, sector, lats, lons = _group_columns(df, self.config)
+        new_levels = {2: _sorted_blocks([listing, offer], lats, lons),
+                      3: _sorted_blocks([listing, offer, sector], lats, lons)}
+
+        for depth, new_level in new_levels.items():
+            level = self.levels[depth]
+            keys = list(level['blocks']) + [key for key in new_level['blocks'] if key not in level['blocks']]
+
+            pieces = {'order': [], 'lats': [], 'lons': []}
+            blocks, start = {}, 0
+            for key in keys:
+                old_start, old_stop = level['blocks'].get(key, (0, 0))
+                new_start, new_stop = new_level['blocks'].get(key, (0, 0))
+                pieces['order'] += [level['order'][old_start:old_stop], new_level['order'][new_start:new_stop] +
+                                    self.n_rows]
+                for coord in ('lats', 'lons'):
+                    pieces[coord] += [level[coord][old_start:old_stop], new_level[coord][new_start:new_stop]]
+
+                stop = start + (old_stop - old_start) + (new_stop - new_start)
+                blocks[key] = (start, stop)
+                start = stop
+
+            level.update({name: np.concatenate(arrays) if arrays else level[name]
+                          for name, arrays in pieces.items()})
+            level['blocks'] = blocks
+
+        self.n_rows += len(df)
+
+    def remove(self, removed: np.ndarray) -> None:
+        """Remove listings from the partitions. The positions of the next listings move back (like a reset_index).
+
+        Parameters
+        ----------
+        removed : np.ndarray
+            Is a boolean mask over the positions of the listings, True for the removed ones.
+        """
+
+        removed = np.asarray(removed, dtype=bool)
+        new_positions = np.cumsum(~removed) - 1
+
+        for level in self.levels.values():
+            keep = ~removed[level['order']]
+            # The new start of each block is the number of rows kept before it.
+            kept_before = np.concatenate([[0], np.cumsum(keep)])
+            level['blocks'] = {key: (int(kept_before[start]), int(kept_before[stop]))
+                               for key, (start, stop) in level['blocks'].items()
+                               if kept_before[stop] > kept_before[start]}
+            level['order'] = new_positions[level['order'][keep]]
+            level['lats'] = level['lats'][keep]
+            level['lons'] = level['lons'][keep]
+
+        self.n_rows -= int(removed.sum())
+
+
+def _group_columns(df: pd.core.frame.DataFrame, config: dict) -> tuple:
+    """Return the factorized type of listing, type of offer and sector_inmo columns and the coordinates."""
+
+    listing = pd.factorize(df[config['TYPE_OF_LISTING']])
+    offer = pd.factorize(df[config['TYPE_OF_OFFER']])
+    sector = pd.factorize(df['sector_inmo'] if 'sector_inmo' in df else pd.Series('Unknown', index=df.index))
+    lats = df[config['LAT']].to_numpy(dtype=np.float64)
+    lons = df[config['LON']].to_numpy(dtype=np.float64)
+
+    return listing, offer, sector, lats, lons
+
+
+def _sorted_blocks(factorized: list, lats: np.ndarray, lons: np.ndarray) -> dict:
+    """Sort the positions by the codes of the columns and find the block (start, stop) of each group.
+
+    Parameters
+    ----------
+    factorized : list
+        Are the results of pd.factorize of each column: [(codes, values), ...]
+
+    lats : np.ndarray
+        Are the Latitudes of the listings
+
+    lons : np.ndarray
+        Are the Longitudes of the listings
+
+    Returns
+    -------
+    dict -> {'order', 'lats', 'lons', 'blocks'}
+    """
+
+    # lexsort uses the last key as the primary key
+    order = np.lexsort([codes for codes, _ in reversed(factorized)])
+    sorted_codes = [codes[order] for codes, _ in factorized]
+
+    changes = np.zeros(len(order), dtype=bool)
+    changes[:1] = True
+    for codes in sorted_codes:
+        changes[1:] |= codes[1:] != codes[:-1]
+
+    starts = np.flatnonzero(changes)
+    stops = np.append(starts[1:], len(order))
+
+    blocks = {}
+    for start, stop in zip(starts, stops):
+        key = tuple(values[codes[start]] if codes[start] >= 0 else None
+                    for codes, (_, values) in zip(sorted_codes, factorized))
+        blocks[key] = (start, stop)
+
+    return {'order': order, 'lats': lats[order], 'lons': lons[order], 'blocks': blocks}
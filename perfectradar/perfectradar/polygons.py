@@ -0,0 +1,108 @@
+"""polygons
+==========================================================
+Polygons of GeoJSON coordinates and a vectorized point-in-polygon test.
+
+The coordinates of GeoJSON are [longitude, latitude]. A polygon is a list of rings: the first one is the border and
+the others are holes. The test uses the even-odd rule (a point is inside if a ray from the point crosses the rings an
+odd number of times), computed for all the points at once with one array operation for each edge. The polygons are
+small (a colonia has tens or hundreds of vertices), so the cost is the number of edges times the candidates inside
+the bounding box.
+"""
+
+import numpy as np
+
+
+def polygon_rings(geometry) -> list:
+    """Convert a GeoJSON geometry to a list of polygons, each one a list of rings (arrays of [lon, lat]).
+
+    Parameters
+    ----------
+    geometry : dict or list
+        Is a GeoJSON Feature, Polygon or MultiPolygon (dict), or the coordinates of a Polygon (a list of rings) or a
+        single ring (a list of [lon, lat])
+
+    Returns
+    -------
+    list -> [[ring, hole, ...], ...]
+    """
+
+    if isinstance(geometry, dict):
+        if geometry.get('type') == 'Feature':
+            geometry = geometry.get('geometry') or {}
+        if geometry.get('type') == 'Polygon':
+            polygons = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiPolygon':
+            polygons = geometry['coordinates']
+        else:
+            raise ValueError(f'The geometry type {geometry.get("type")!r} is not supported, use Polygon or '
+                             f'MultiPolygon.')
+    elif np.ndim(geometry[0]) == 1:
+        polygons = [[geometry]]  # <- A single ring
+    else:
+        polygons = [geometry]
+
+    result = []
+    for polygon in polygons:
+        rings = []
+        for ring in polygon:
+            ring = np.asarray(ring, dtype=np.float64)[:, :2]
+            if len(ring) < 3:
+                raise ValueError('Each ring of the polygon needs at least 3 coordinates.')
+            rings.append(ring)
+        result.append(rings)
+
+    return result
+
+
+def polygons_bbox(polygons: list) -> tuple:
+    """Return the bounding box of the polygons: (lat_min, lat_max, lon_min, lon_max) (the order of bounding_box)."""
+
+    borders = np.concatenate([polygon[0] for polygon in polygons])
+    return borders[:, 1].min(), borders[:, 1].max(), borders[:, 0].min(), borders[:, 0].max()
+
+
+def polygons_center(polygons: list) -> tuple:
+    """Return the center of the bounding box of the polygons: (lat, lon)."""
+
+    lat_min, lat_max, lon_min, lon_max = polygons_bbox(polygons)
+    return (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+
+
+def points_in_polygons(lats: np.ndarray, lons: np.ndarray, polygons: list) -> np.ndarray:
+    """Return a boolean mask of the points inside any of the polygons (even-odd rule, the holes are outside).
+
+    Parameters
+    ----------
+    lats : np.ndarray
+        Are the Latitudes of the points
+
+    lons : np.ndarray
+        Are the Longitudes of the points
+
+    polygons : list
+        Is the result of 'polygon_rings'
+
+    Returns
+    -------
+    np.ndarray
+    """
+
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    inside = np.zeros(len(lats), dtype=bool)
+    for polygon in polygons:
+        crossings = np.zeros(len(lats), dtype=bool)
+        for ring in polygon:
+            # Each edge (x1, y1) -> (x2, y2), the ring is closed with the first vertex.
+            x1, y1 = ring[:, 0], ring[:, 1]
+            x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+            for edge in range(len(ring)):
+                # The edge crosses the horizontal line of the point at the right of the point
+                crosses = (y1[edge] > lats) != (y2[edge] > lats)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    x_cross = x1[edge] + (lats - y1[edge]) * (x2[edge] - x1[edge]) / (y2[edge] - y1[edge])
+                crossings ^= crosses & (lons < x_cross)
+        inside |= crossings
+
+    return inside
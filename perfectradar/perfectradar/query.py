@@ -0,0 +1,577 @@
+"""query
+==========================================================
+Query mode over row positions of one immutable DataFrame.
+
+It's the same result of the methods subset_by_type, set_subset_sector_inmo, mesure_df_distances, subset_by_km and
+rm_outliers, but each step only filters an array of row positions (and the distances). The DataFrame is never
+changed or copied: the rows are materialized with a single 'take' at the end. It doesn't change any attribute of the
+PerfectRadar, so many queries can run over the same DataFrame.
+
+The k nearest neighbours queries (radar_knn) select the k closest listings with a partial sort (np.argpartition),
+and with the spatial index they only mesure the listings of a circle that grows until it contains k listings.
+
+The area queries return the comparables inside a polygon (radar_polygon) or in concentric rings (radar_rings).
+"""
+
+import numpy as np
+import pandas as pd
+from ..perfectradar.col_creator import segment_sector_inmo
+from ..perfectradar.distances import distances_km, bounding_box, bbox_mask, MAX_DISTANCE_KM
+from ..perfectradar.outliers import Q_LOW, Q_HIGH, warn_ignored_columns
+from ..perfectradar.polygons import polygon_rings, polygons_bbox, polygons_center, points_in_polygons
+
+
+def type_positions(df: pd.core.frame.DataFrame, config: dict, type_of_listing: str, type_of_offer: str,
+                   sector_inmo: str = None, partitions=None) -> np.ndarray:
+    """Return the positions of the rows with the type of listing, type of offer and (optional) sector_inmo.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Is the DataFrame of the listings
+
+    config : dict
+        Is the 'config_columns' of the PerfectRadar
+
+    type_of_listing : str
+        Is the type of listing (Casa or Departamento).
+
+    type_of_offer : str
+        Is the type of offer (Buy or Rent).
+
+    sector_inmo : str
+        Is the sector_inmo. (Default value = None, all the sectors)
+
+    partitions : ListingPartitions
+        Are the partitions of the DataFrame. (Default value = None, it scans the columns)
+
+    Returns
+    -------
+    np.ndarray
+    """
+
+    if partitions is not None:
+        return partitions.get(type_of_listing, type_of_offer, sector_inmo).positions
+
+    mask = (df[config['TYPE_OF_LISTING']] == type_of_listing).to_numpy() & \
+        (df[config['TYPE_OF_OFFER']] == type_of_offer).to_numpy()
+    if sector_inmo is not None:
+        mask &= (df['sector_inmo'] == sector_inmo).to_numpy()
+
+    return np.flatnonzero(mask)
+
+
+def equals_mask(df: pd.core.frame.DataFrame, positions: np.ndarray, col: str, value) -> np.ndarray:
+    """Return a boolean mask of the positions where the column is equal to the value. It only reads the rows of the
+    positions."""
+    return (df[col].take(positions) == value).to_numpy()
+
+
+def radius_positions(df: pd.core.frame.DataFrame, config: dict, positions: np.ndarray, lat: float, lon: float,
+                     radio: float, method: str) -> tuple:
+    """Filter the positions inside the radio of the coordinate (bounding box first, then the exact distance).
+
+    Returns
+    -------
+    tuple -> (positions, distances)
+    """
+
+    lats = df[config['LAT']].take(positions).to_numpy(dtype=np.float64)
+    lons = df[config['LON']].take(positions).to_numpy(dtype=np.float64)
+
+    inside_box = bbox_mask(lats, lons, bounding_box(lat, lon, radio))
+    positions, lats, lons = positions[inside_box], lats[inside_box], lons[inside_box]
+
+    distances = distances_km(lat, lon, lats, lons, method)
+    inside = distances <= radio
+
+    return positions[inside], distances[inside]
+
+
+def outlier_positions(df: pd.core.frame.DataFrame, positions: np.ndarray, id_col: str,
+                      values_to_rm: tuple) -> np.ndarray:
+    """Return a boolean mask of the positions without outliers and without duplicated IDs (the same rows of
+    rm_outliers: only the limits of the first column remove rows)."""
+
+    warn_ignored_columns(values_to_rm)
+    keep = np.ones(len(positions), dtype=bool)
+    if not len(positions):
+        return keep
+
+    values = df[values_to_rm[0]].take(positions).to_numpy(dtype=np.float64)
+    # The same quantiles of pandas (linear interpolation, without missing values)
+    q_low, q_high = np.nanquantile(values, [Q_LOW, Q_HIGH]) if np.isfinite(values).any() else (np.nan, np.nan)
+    keep &= (values > q_low) & (values < q_high)
+
+    ids = df[id_col].take(positions[keep])
+    keep[np.flatnonzero(keep)[ids.duplicated(keep='first').to_numpy()]] = False
+
+    return keep
+
+
+def radar_query(df: pd.core.frame.DataFrame, config: dict, lat: float, lon: float, type_of_listing: str = 'Casa',
+                type_of_offer: str = 'Buy', price: float = None, radio: float = 1.5, values_to_rm: tuple = (),
+                method: str = 'vincenty', spatial_index=None, partitions=None) -> tuple:
+    """Find the main and rent comparables of a coordinate working only with arrays of positions.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Is the DataFrame of the listings (it's not changed)
+
+    config : dict
+        Is the 'config_columns' of the PerfectRadar
+
+    lat : float
+        Is the Latitude of the main location
+
+    lon : float
+        Is the Longitude of the main location
+
+    type_of_listing : str
+        Is the type of listing (Casa or Departamento). (Default value = 'Casa')
+
+    type_of_offer : str
+        Is the type of offer (Buy or Rent). (Default value = 'Buy')
+
+    price : float
+        Is the price of the simulated listing to select the sector_inmo of the rent comparables.
+        (Default value = None, all the sectors)
+
+    radio : float
+        Is the radio of the circle in kilometres. (Default value = 1.5)
+
+    values_to_rm : tuple
+        Are the names of the columns to remove the outliers. (Default value = (), doesn't remove outliers)
+
+    method : str
+        Is the method to mesure the distances. (Default value = 'vincenty')
+
+    spatial_index : GridIndex
+        Is the spatial index of the DataFrame. If it exists, only the listings near the coordinate are read.
+        (Default value = None)
+
+    partitions : ListingPartitions
+        Are the partitions of the DataFrame, used when there is no spatial index. (Default value = None)
+
+    Returns
+    -------
+    tuple -> (main DataFrame, rent DataFrame or None)
+    """
+
+    if spatial_index is not None:
+        near_positions, near_distances = spatial_index.query_radius(lat, lon, radio, method)
+
+    results = []
+    for offer, sector in query_sides(config, type_of_offer, price):
+        if spatial_index is not None:
+            positions, distances = filter_positions(df, config, near_positions, near_distances, type_of_listing,
+                                                    offer, sector)
+        else:
+            positions = type_positions(df, config, type_of_listing, offer, sector, partitions)
+            positions, distances = radius_positions(df, config, positions, lat, lon, radio, method)
+
+        results.append(side_result(df, config, positions, distances, values_to_rm))
+
+    if len(results) == 1:
+        results.append(None)
+
+    return results[0], results[1]
+
+
+def query_sides(config: dict, type_of_offer: str, price: float = None) -> list:
+    """Return the (type_of_offer, sector_inmo) of the main side and of the rent side (not for the Rent queries)."""
+
+    sides = [(type_of_offer, None)]
+    if type_of_offer != config['RENT']:
+        sides.append((config['RENT'], segment_sector_inmo('Buy', price) if price is not None else None))
+
+    return sides
+
+
+def filter_positions(df: pd.core.frame.DataFrame, config: dict, positions: np.ndarray, distances: np.ndarray,
+                     type_of_listing: str, type_of_offer: str, sector_inmo: str = None) -> tuple:
+    """Filter the positions of an area (and their distances) by type of listing, type of offer and sector_inmo.
+
+    Returns
+    -------
+    tuple -> (positions, distances)
+    """
+
+    for col, value in ((config['TYPE_OF_LISTING'], type_of_listing), (config['TYPE_OF_OFFER'], type_of_offer),
+                       ('sector_inmo', sector_inmo)):
+        if value is not None:
+            keep = equals_mask(df, positions, col, value)
+            positions, distances = positions[keep], distances[keep]
+
+    return positions, distances
+
+
+def side_result(df: pd.core.frame.DataFrame, config: dict, positions: np.ndarray, distances: np.ndarray,
+                values_to_rm: tuple = (), columns: dict = None) -> pd.core.frame.DataFrame:
+    """Remove the outliers of the positions and materialize the rows with the 'distancia' column.
+
+    Parameters
+    ----------
+    columns : dict
+        Are other columns of the result with a value for each position: {name: array}. (Default value = None)
+    """
+
+    columns = columns or {}
+    if values_to_rm:
+        keep = outlier_positions(df, positions, config.get('ID'), values_to_rm)
+        positions, distances = positions[keep], distances[keep]
+        columns = {name: values[keep] for name, values in columns.items()}
+
+    # The only copy of the rows
+    result = df.take(positions)
+    result['distancia'] = distances
+    for name, values in columns.items():
+        result[name] = values
+
+    return result
+
+
+def nearest(positions: np.ndarray, distances: np.ndarray, k: int) -> tuple:
+    """Select the k positions with the smallest distances, sorted by distance (and position in the ties).
+
+    It's a partial sort: only the k selected distances are sorted.
+
+    Returns
+    -------
+    tuple -> (positions, distances)
+    """
+
+    if len(positions) > k:
+        selected = np.argpartition(distances, k - 1)[:k]
+        positions, distances = positions[selected], distances[selected]
+
+    order = np.lexsort((positions, distances))
+    return positions[order], distances[order]
+
+
+def knn_positions(df: pd.core.frame.DataFrame, config: dict, lat: float, lon: float, k: int,
+                  type_of_listing: str, type_of_offer: str, sector_inmo: str = None, radio: float = None,
+                  method: str = 'vincenty', spatial_index=None, partitions=None, start_radio: float = 1.0) -> tuple:
+    """Find the positions of the k nearest listings of a type to the coordinate.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Is the DataFrame of the listings
+
+    config : dict
+        Is the 'config_columns' of the PerfectRadar
+
+    lat : float
+        Is the Latitude of the main location
+
+    lon : float
+        Is the Longitude of the main location
+
+    k : int
+        Is the number of listings
+
+    type_of_listing : str
+        Is the type of listing (Casa or Departamento).
+
+    type_of_offer : str
+        Is the type of offer (Buy or Rent).
+
+    sector_inmo : str
+        Is the sector_inmo. (Default value = None, all the sectors)
+
+    radio : float
+        Is the maximum distance in kilometres. (Default value = None, without limit)
+
+    method : str
+        Is the method to mesure the distances. (Default value = 'vincenty')
+
+    spatial_index : GridIndex
+        Is the spatial index of the DataFrame. (Default value = None, it mesures all the listings of the type)
+
+    partitions : ListingPartitions
+        Are the partitions of the DataFrame, used when there is no spatial index. (Default value = None)
+
+    start_radio : float
+        Is the first radio of the search with the spatial index, it's doubled until there are k listings.
+        (Default value = 1.0)
+
+    Returns
+    -------
+    tuple -> (positions, distances) sorted by distance
+    """
+
+    max_radio = MAX_DISTANCE_KM if radio is None else radio
+
+    if spatial_index is None:
+        positions = type_positions(df, config, type_of_listing, type_of_offer, sector_inmo, partitions)
+        if radio is None:
+            lats = df[config['LAT']].take(positions).to_numpy(dtype=np.float64)
+            lons = df[config['LON']].take(positions).to_numpy(dtype=np.float64)
+            distances = distances_km(lat, lon, lats, lons, method)
+            finite = ~np.isnan(distances)
+            positions, distances = positions[finite], distances[finite]
+        else:
+            positions, distances = radius_positions(df, config, positions, lat, lon, radio, method)
+        return nearest(positions, distances, k)
+
+    # The k nearest are inside the first circle that contains at least k listings of the type.
+    search_radio = min(start_radio, max_radio)
+    while True:
+        positions, distances = spatial_index.query_radius(lat, lon, search_radio, method)
+        for col, value in ((config['TYPE_OF_LISTING'], type_of_listing), (config['TYPE_OF_OFFER'], type_of_offer),
+                           ('sector_inmo', sector_inmo)):
+            if value is not None:
+                keep = equals_mask(df, positions, col, value)
+                positions, distances = positions[keep], distances[keep]
+
+        if len(positions) >= k or search_radio >= max_radio:
+            return nearest(positions, distances, k)
+
+        search_radio = min(search_radio * 2, max_radio)
+
+
+def radar_knn(df: pd.core.frame.DataFrame, config: dict, lat: float, lon: float, k: int = 10,
+              type_of_listing: str = 'Casa', type_of_offer: str = 'Buy', price: float = None, radio: float = None,
+              min_rent: int = None, method: str = 'vincenty', spatial_index=None, partitions=None) -> tuple:
+    """Find the k nearest main and rent comparables of a coordinate.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Is the DataFrame of the listings (it's not changed)
+
+    config : dict
+        Is the 'config_columns' of the PerfectRadar
+
+    lat : float
+        Is the Latitude of the main location
+
+    lon : float
+        Is the Longitude of the main location
+
+    k : int
+        Is the number of listings of each DataFrame. (Default value = 10)
+
+    type_of_listing : str
+        Is the type of listing (Casa or Departamento). (Default value = 'Casa')
+
+    type_of_offer : str
+        Is the type of offer (Buy or Rent). (Default value = 'Buy')
+
+    price : float
+        Is the price of the simulated listing to select the sector_inmo of the rent comparables.
+        (Default value = None, all the sectors)
+
+    radio : float
+        Is the maximum distance in kilometres. (Default value = None, without limit)
+
+    min_rent : int
+        Double the radio until the rent DataFrame has at least 'min_rent' rows (or the radio covers the Earth).
+        (Default value = None, the radio doesn't grow)
+
+    method : str
+        Is the method to mesure the distances. (Default value = 'vincenty')
+
+    spatial_index : GridIndex
+        Is the spatial index of the DataFrame. (Default value = None)
+
+    partitions : ListingPartitions
+        Are the partitions of the DataFrame, used when there is no spatial index. (Default value = None)
+
+    Returns
+    -------
+    tuple -> (main DataFrame, rent DataFrame or None) sorted by the column 'distancia'
+    """
+
+    if k < 1:
+        raise ValueError('The number of neighbours "k" must be at least 1.')
+
+    sector_inmo = segment_sector_inmo('Buy', price) if price is not None else None
+    want_rent = type_of_offer != config['RENT']
+    options = {'method': method, 'spatial_index': spatial_index, 'partitions': partitions}
+
+    rent = None
+    if want_rent:
+        rent = knn_positions(df, config, lat, lon, k, type_of_listing, config['RENT'], sector_inmo, radio, **options)
+        # Grow the radio until there is enough rent data (the rent DataFrame can't have more than k rows).
+        while min_rent is not None and radio is not None and len(rent[0]) < min(min_rent, k) and \
+                radio < MAX_DISTANCE_KM:
+            radio = min(radio * 2, MAX_DISTANCE_KM)
+            rent = knn_positions(df, config, lat, lon, k, type_of_listing, config['RENT'], sector_inmo, radio,
+                                 **options)
+
+    main = knn_positions(df, config, lat, lon, k, type_of_listing, type_of_offer, None, radio, **options)
+
+    results = []
+    for side in (main, rent):
+        if side is None:
+            results.append(None)
+            continue
+        result = df.take(side[0])
+        result['distancia'] = side[1]
+        results.append(result)
+
+    return results[0], results[1]
+
+
+def area_coordinates(df: pd.core.frame.DataFrame, config: dict, positions: np.ndarray, spatial_index=None) -> tuple:
+    """Return the Latitudes and Longitudes of the positions (from the arrays of the spatial index if it exists)."""
+
+    if spatial_index is not None:
+        return spatial_index.lats[positions], spatial_index.lons[positions]
+
+    return (df[config['LAT']].take(positions).to_numpy(dtype=np.float64),
+            df[config['LON']].take(positions).to_numpy(dtype=np.float64))
+
+
+def radar_polygon(df: pd.core.frame.DataFrame, config: dict, polygon, type_of_listing: str = 'Casa',
+                  type_of_offer: str = 'Buy', price: float = None, values_to_rm: tuple = (), lat: float = None,
+                  lon: float = None, method: str = 'vincenty', spatial_index=None) -> tuple:
+    """Find the main and rent comparables inside a polygon (Example: the boundary of a colonia).
+
+    The candidates are the listings inside the bounding box of the polygon (the cells of the spatial index if it
+    exists), and then the vectorized point-in-polygon test of the polygons module.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Is the DataFrame of the listings (it's not changed)
+
+    config : dict
+        Is the 'config_columns' of the PerfectRadar
+
+    polygon : dict or list
+        Is a GeoJSON Feature, Polygon or MultiPolygon, or the coordinates of a Polygon ([lon, lat] like GeoJSON)
+
+    type_of_listing : str
+        Is the type of listing (Casa or Departamento). (Default value = 'Casa')
+
+    type_of_offer : str
+        Is the type of offer (Buy or Rent). (Default value = 'Buy')
+
+    price : float
+        Is the price of the simulated listing to select the sector_inmo of the rent comparables.
+        (Default value = None, all the sectors)
+
+    values_to_rm : tuple
+        Are the names of the columns to remove the outliers. (Default value = (), doesn't remove outliers)
+
+    lat : float
+        Is the Latitude to mesure the column 'distancia'. (Default value = None, the center of the polygon)
+
+    lon : float
+        Is the Longitude to mesure the column 'distancia'. (Default value = None, the center of the polygon)
+
+    method : str
+        Is the method to mesure the distances. (Default value = 'vincenty')
+
+    spatial_index : GridIndex
+        Is the spatial index of the DataFrame. (Default value = None, it reads all the coordinates)
+
+    Returns
+    -------
+    tuple -> (main DataFrame, rent DataFrame or None)
+    """
+
+    polygons = polygon_rings(polygon)
+    box = polygons_bbox(polygons)
+    if lat is None or lon is None:
+        lat, lon = polygons_center(polygons)
+
+    if spatial_index is not None:
+        positions = np.sort(spatial_index.candidates_box(box))
+    else:
+        positions = np.arange(len(df))
+
+    lats, lons = area_coordinates(df, config, positions, spatial_index)
+    inside_box = bbox_mask(lats, lons, box)
+    positions, lats, lons = positions[inside_box], lats[inside_box], lons[inside_box]
+
+    inside = points_in_polygons(lats, lons, polygons)
+    positions = positions[inside]
+    distances = distances_km(lat, lon, lats[inside], lons[inside], method)
+
+    results = []
+    for offer, sector in query_sides(config, type_of_offer, price):
+        side_positions, side_distances = filter_positions(df, config, positions, distances, type_of_listing, offer,
+                                                          sector)
+        results.append(side_result(df, config, side_positions, side_distances, values_to_rm))
+
+    if len(results) == 1:
+        results.append(None)
+
+    return results[0], results[1]
+
+
+def radar_rings(df: pd.core.frame.DataFrame, config: dict, lat: float, lon: float, rings: tuple = (1, 2, 3),
+                type_of_listing: str = 'Casa', type_of_offer: str = 'Buy', price: float = None,
+                values_to_rm: tuple = (), method: str = 'vincenty', spatial_index=None) -> tuple:
+    """Find the main and rent comparables of concentric rings around a coordinate.
+
+    The distances are mesured once for the biggest circle and the rows are assigned to the rings with a single
+    np.digitize. The column 'ring' is the number of the ring of each row: the ring i contains the distances in
+    (rings[i - 1], rings[i]] (the ring 0 starts in 0 km). The outliers are removed over all the rings of each side.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Is the DataFrame of the listings (it's not changed)
+
+    config : dict
+        Is the 'config_columns' of the PerfectRadar
+
+    lat : float
+        Is the Latitude of the main location
+
+    lon : float
+        Is the Longitude of the main location
+
+    rings : tuple
+        Are the outer radios of the rings in kilometres, in increasing order. (Default value = (1, 2, 3))
+
+    type_of_listing : str
+        Is the type of listing (Casa or Departamento). (Default value = 'Casa')
+
+    type_of_offer : str
+        Is the type of offer (Buy or Rent). (Default value = 'Buy')
+
+    price : float
+        Is the price of the simulated listing to select the sector_inmo of the rent comparables.
+        (Default value = None, all the sectors)
+
+    values_to_rm : tuple
+        Are the names of the columns to remove the outliers. (Default value = (), doesn't remove outliers)
+
+    method : str
+        Is the method to mesure the distances. (Default value = 'vincenty')
+
+    spatial_index : GridIndex
+        Is the spatial index of the DataFrame. (Default value = None, it reads all the coordinates)
+
+    Returns
+    -------
+    tuple -> (main DataFrame, rent DataFrame or None) with the columns 'distancia' and 'ring'
+    """
+
+    radios = np.asarray(rings, dtype=np.float64)
+    if not len(radios) or radios[0] <= 0 or (np.diff(radios) <= 0).any():
+        raise ValueError('The rings must be positive radios in increasing order (Example: (1, 2, 3)).')
+
+    if spatial_index is not None:
+        positions, distances = spatial_index.query_radius(lat, lon, radios[-1], method)
+    else:
+        positions, distances = radius_positions(df, config, np.arange(len(df)), lat, lon, radios[-1], method)
+
+    results = []
+    for offer, sector in query_sides(config, type_of_offer, price):
+        side_positions, side_distances = filter_positions(df, config, positions, distances, type_of_listing, offer,
+                                                          sector)
+        ring = np.digitize(side_distances, radios, right=True)  # <- (rings[i - 1], rings[i]] -> i
+        results.append(side_result(df, config, side_positions, side_distances, values_to_rm, {'ring': ring}))
+
+    if len(results) == 1:
+        results.append(None)
+
+    return results[0], results[1]
@@ -1,8 +1,20 @@
 import csv
-from geopy import distance
+import importlib.util
+import os
+import numpy as np
 import pandas as pd
 from typing import Union
-from ..perfectradar.col_creator import segment_sector_inmo, avg_price_m2, avg_price_m2_const
+from ..perfectradar.col_creator import segment_sector_inmo, segment_sector_inmo_codes, avg_price_m2_const_array, \
+    SECTOR_INMO_LABELS, UNKNOWN_SECTOR_INMO, HOUSE_LISTINGS
+from ..perfectradar.distances import distances_km, bounding_box, bbox_mask
+from ..perfectradar.spatial_index import GridIndex
+from ..perfectradar.partitions import ListingPartitions
+from ..perfectradar import batch, df_cache, query
+from ..perfectradar.outliers import quantile_bounds, outliers_mask, warn_ignored_columns
+from ..perfectradar.result_cache import ResultCache, copy_result
+from ..perfectradar.instrument import Instrumentation, instrumented
+from ..perfectradar.dataset import PreparedDataset
+from ..perfectradar.zone_stats import ZoneStats
 
 float_int = Union[float, int]
 
@@ -11,6 +23,7 @@ class PerfectRadar:
 
     RADIO = 1.5  # <- Is the distance it will be calculated between The main location and other.
     RENTAL_MINIMAL_DATA = 5 # <- Is the minimal amount of rows in Rent DataFrame to accepts.
+    DISTANCE_METHOD = 'vincenty'  # <- Is the method to mesure the distances: 'haversine', 'vincenty' or 'geodesic'.
 
     def __init__(self, project_name: str, *cvs_file_path: csv):
         """This are the initialize values to create a instance.
@@ -29,13 +42,84 @@ class PerfectRadar:
         """
         self.project_name = project_name
         self.csv = cvs_file_path  # <- Can add multiple paths of Listings CVS
+        self.result_cache = None
         self.df = None
         self.lat = None
         self.long = None
+        self.spatial_index = None
+        self.partitions = None
+        self.instrumentation = None
+        self.zone_stats = None
 
     def __repr__(self):
         return self.project_name
 
+    @property
+    def df(self) -> pd.core.frame.DataFrame:
+        """Is the DataFrame of the listings, with the pending updates of append_rows and remove_rows applied."""
+        if self._pending_rows or self._removed_ids:
+            self.apply_updates()
+        return self._df
+
+    @df.setter
+    def df(self, df: pd.core.frame.DataFrame) -> None:
+        self._df = df
+        self._pending_rows, self._removed_ids = [], set()  # <- A new DataFrame discards the pending updates
+        self.clear_result_cache()
+
+    @property
+    def spatial_index(self) -> GridIndex:
+        """Is the GridIndex of build_spatial_index, with the pending updates applied."""
+        if self._pending_rows or self._removed_ids:
+            self.apply_updates()
+        return self._spatial_index
+
+    @spatial_index.setter
+    def spatial_index(self, spatial_index: GridIndex) -> None:
+        self._spatial_index = spatial_index
+
+    @property
+    def partitions(self) -> ListingPartitions:
+        """Are the ListingPartitions of build_partitions, with the pending updates applied."""
+        if self._pending_rows or self._removed_ids:
+            self.apply_updates()
+        return self._partitions
+
+    @partitions.setter
+    def partitions(self, partitions: ListingPartitions) -> None:
+        self._partitions = partitions
+
+    def enable_instrumentation(self, callback=None, track_memory: bool = False) -> Instrumentation:
+        """Record the wall time, the input and output rows and (optional) the memory growth of each method call.
+
+        The records are CallStats (instrument module) saved in the 'instrumentation' attribute. Use its 'summary'
+        method to see the totals of each method. While it's disabled the methods only check the attribute.
+
+        Parameters
+        ----------
+        callback : callable
+            Is a function called with the CallStats of each call (Example: send it to the metrics system).
+            (Default value = None)
+
+        track_memory : bool
+            Mesure the memory growth of each call with tracemalloc (it makes slower the code).
+            (Default value = False)
+
+        Returns
+        ----------
+        Instrumentation
+        """
+
+        self.disable_instrumentation()  # <- Stop the tracemalloc of the previous one
+        self.instrumentation = Instrumentation(callback, track_memory)
+        return self.instrumentation
+
+    def disable_instrumentation(self) -> None:
+        """Stop recording the method calls (and stop tracemalloc if enable_instrumentation started it)."""
+        if self.instrumentation is not None:
+            self.instrumentation.stop()
+        self.instrumentation = None
+
     def config_columns(self, id: str, lat_col: str, lon_col: str, type_of_listing_col: str,
                        type_of_offer_col: str, price_col: str, land_size_col: str, rent_value: str) -> None:
         """Setup the value names of the columns inside the DataFrame Table.
@@ -82,6 +166,7 @@ class PerfectRadar:
         self.config_columns['LAND_SIZE'] = land_size_col
         self.config_columns['RENT'] = rent_value  # <-This is not a Column Name. It refers a Value inside a Column Val.
 
+    @instrumented()
     def set_coordinates(self, main_lat: float, main_lon: float) -> None:
         """Set the main coordinates of the point you want to analyze.
 
@@ -110,29 +195,616 @@ class PerfectRadar:
         self.lat = main_lat
         self.long = main_lon
 
-    def cvs_to_df(self) -> pd.core.frame.DataFrame:
+    @instrumented()
+    def cvs_to_df(self, *extra_cols: str, prune: bool = False,
+                  compact_coordinates: bool = False) -> pd.core.frame.DataFrame:
         """Convert a CSV to a DataFrame
 
+        By default it reads all the columns of the CSV with the types inferred by pandas. With 'prune' (and the
+        method config_columns applied before) it only reads the configured columns and the extra_cols with compact
+        types: categorical type of listing and type of offer and integer prices (when the prices don't have decimals
+        or missing values). It uses the pyarrow parser if it's installed.
+
+        Parameters
+        ----------
+        *extra_cols : str :
+            Are the names of other columns to read with 'prune'. For example the columns to remove the outliers
+            (Example: 'm2_construccion_name')
+
+        prune : bool
+            Read only the configured columns and the extra_cols with compact types.
+            (Default value = False)
+
+        compact_coordinates : bool
+            Read the coordinates as float32 with 'prune'. It saves memory, but it adds ~1 metre of error to the
+            coordinates. (Default value = False, float64)
+
+        Returns
+        ----------
+        DataFrame -> pd.core.frame.DataFrame
+        """
+
+        read_options = {}
+        config = self.config_columns if isinstance(self.config_columns, dict) else None
+
+        if prune:
+            if config is None:
+                raise ValueError('You must setup the config_columns values to read only the configured columns.')
+            read_options = self.read_csv_options(*extra_cols, compact_coordinates=compact_coordinates)
+
+        list_csv = [pd.read_csv(csv, **read_options) for csv in self.csv]
+        self.df = pd.concat(list_csv, ignore_index=True)  # <- The index is the position of the row (Spatial Index)
+
+        if read_options:
+            self.compact_df()
+
+        self.reset_indexes()  # <- The indexes of the old DataFrame are not valid anymore
+        return self.df
+
+    @instrumented()
+    def stream_subset_by_type(self, type_of_listing: str = 'Casa', type_of_offer: str = 'Buy', *extra_cols: str,
+                              chunksize: int = 200000) -> pd.core.frame.DataFrame:
+        """Read the CSV files by chunks and keep only the rows of subset_by_type inside the bounding box of the RADIO.
+
+        It's for CSV files bigger than the memory. Each chunk is filtered by the type of listing, the type of offer
+        (and the Rent offer) and the bounding box of the main coordinates, so the memory depends on the chunk size and
+        the result, not in the size of the files. Then it creates the columns of prepare_df only for the rows kept and
+        applies subset_by_type and subset_by_bbox. It only reads the configured columns and the extra_cols, so the
+        result is the same of the in-memory methods with prune=True (with the same index), but the attribute 'df'
+        only contains the rows kept.
+
+        Parameters
+        ----------
+        type_of_listing : str
+            Is the type of listing inside the column self.config['type_of_listing_col'] (Casa or Departamento).
+            (Default value = 'Casa')
+
+        type_of_offer : str
+            Is the type of offer of the listing inside the column self.config['type_of_offer_col'] (Buy or rent).
+            (Default value = 'Buy')
+
+        *extra_cols : str :
+            Are the names of other columns to read (see cvs_to_df).
+
+        chunksize : int
+            Is the number of rows of each chunk.
+            (Default value = 200000)
+
+        Returns
+        -------
+        DataFrame -> The main subset and the rent subset (like subset_by_type)
+        """
+
+        if not isinstance(self.config_columns, dict):
+            raise ValueError('You must setup the config_columns values of the DataFrame Columns names. '
+                             'Use the config_columns method to do this!!!.')
+
+        if self.lat is None or self.long is None:
+            raise ValueError('You need to add the main coordinates. Apply "set_coordinates" function to do that =)')
+
+        config = self.config_columns
+        read_options = self.read_csv_options(*extra_cols)
+        read_options.pop('engine', None)  # <- The pyarrow parser doesn't read by chunks
+        box = bounding_box(self.lat, self.long, self.RADIO)
+
+        offers = [type_of_offer] if type_of_offer == config['RENT'] else [type_of_offer, config['RENT']]
+
+        kept, offset = [], 0
+        for csv in self.csv:
+            for chunk in pd.read_csv(csv, chunksize=chunksize, **read_options):
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))  # <- Same index of cvs_to_df
+                offset += len(chunk)
+
+                mask = (chunk[config['TYPE_OF_LISTING']] == type_of_listing).to_numpy() & \
+                    chunk[config['TYPE_OF_OFFER']].isin(offers).to_numpy()
+                mask &= bbox_mask(chunk[config['LAT']].to_numpy(dtype=float),
+                                  chunk[config['LON']].to_numpy(dtype=float), box)
+                kept.append(chunk[mask])
+
+        self.df = pd.concat(kept) if kept else pd.DataFrame(columns=read_options['usecols'])
+        self.compact_df()
+        self.reset_indexes()
+
+        self.set_col_sector_inmo()
+        self.set_avg_price_cols()
+
+        PerfectRadar.subset_by_type(self, type_of_listing, type_of_offer)
+        return self.subset_by_bbox()
+
+    def read_csv_options(self, *extra_cols: str, compact_coordinates: bool = False) -> dict:
+        """Create the options of pd.read_csv to read only the configured columns with compact types.
+
+        Parameters
+        ----------
+        *extra_cols : str :
+            Are the names of other columns to read.
+
+        compact_coordinates : bool
+            Read the coordinates as float32 (~1 metre of error). (Default value = False, float64)
+
+        Returns
+        ----------
+        dict
+        """
+
+        config = self.config_columns
+        usecols = list(dict.fromkeys([col for key, col in config.items() if key != 'RENT'] + list(extra_cols)))
+        dtype = {
+            config['LAT']: 'float32' if compact_coordinates else 'float64',
+            config['LON']: 'float32' if compact_coordinates else 'float64',
+            config['TYPE_OF_LISTING']: 'category',
+            config['TYPE_OF_OFFER']: 'category',
+            config['PRICE']: 'float64',  # <- Converted to integer by compact_df if it's possible
+            config['LAND_SIZE']: 'float64',
+        }
+
+        read_options = {'usecols': usecols, 'dtype': dtype}
+        if importlib.util.find_spec('pyarrow') is not None:
+            read_options['engine'] = 'pyarrow'
+
+        return read_options
+
+    @instrumented()
+    def compact_df(self) -> pd.core.frame.DataFrame:
+        """Apply the compact types to the columns after concatenate the CSV files.
+
+        The price is converted to integer only if it doesn't have decimals or missing values.
+
+        Returns
+        ----------
+        DataFrame -> pd.core.frame.DataFrame
+        """
+
+        df = self.df
+        config = self.config_columns
+
+        # pd.concat returns an object column when the categories of the files are different.
+        for col in [config['TYPE_OF_LISTING'], config['TYPE_OF_OFFER']]:
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype('category')
+
+        price = df[config['PRICE']].to_numpy()
+        if np.isfinite(price).all() and (price % 1 == 0).all():
+            df[config['PRICE']] = price.astype(np.int64)
+
+        return df
+
+    @instrumented()
+    def prepare_df(self, *extra_cols: str, cache_dir: str = None, prune: bool = False,
+                   compact_coordinates: bool = False) -> pd.core.frame.DataFrame:
+        """Convert the CSV to a DataFrame and create the columns 'sector_inmo', 'avg_price_m2' and 'avg_price_const'.
+
+        It's the same that apply the methods cvs_to_df, set_col_sector_inmo, set_avg_pricem2_col and
+        set_avg_priceconst_col. With 'cache_dir' the prepared DataFrame is saved in a binary cache (df_cache module)
+        and the next runs load it directly (memory-mapped) while the CSV files and the config_columns don't change.
+
         Parameters
         ----------
+        *extra_cols : str :
+            Are the names of other columns to read with 'prune' (see cvs_to_df).
+
+        cache_dir : str
+            Is the directory of the binary cache.
+            (Default value = None, doesn't use the cache)
+
+        prune : bool
+            Read only the configured columns and the extra_cols (see cvs_to_df). (Default value = False)
+
+        compact_coordinates : bool
+            Read the coordinates as float32 with 'prune' (see cvs_to_df). (Default value = False)
 
         Returns
         ----------
         DataFrame -> pd.core.frame.DataFrame
         """
 
-        list_csv = [pd.read_csv(csv) for csv in self.csv]
-        self.df = pd.concat(list_csv)
+        cache_path = None
+        if cache_dir is not None:
+            key = df_cache.cache_key(self.csv, self.config_columns, extra_cols,
+                                     {'prune': prune, 'compact_coordinates': compact_coordinates})
+            cache_path = os.path.join(cache_dir, key)
+
+            if df_cache.is_cached(cache_path):
+                self.df = df_cache.load_df(cache_path)
+                self.reset_indexes()  # <- The indexes of the old DataFrame are not valid anymore
+                return self.df
+
+        self.cvs_to_df(*extra_cols, prune=prune, compact_coordinates=compact_coordinates)
+        self.set_col_sector_inmo()
+        self.set_avg_price_cols()
+
+        if cache_path is not None:
+            df_cache.save_df(self.df, cache_path, source=df_cache.source_key(self.csv))
+
         return self.df
 
-    def set_col_sector_inmo(self) -> pd.core.frame.DataFrame:
-        """Create a new column call it 'sector_inmo'. This column contain a string of the socioeconomic real estate
-         segment.
+    @instrumented()
+    def build_spatial_index(self, cell_km: float = 1.0) -> GridIndex:
+        """Build a grid index over the coordinates of the DataFrame to make radius queries.
+
+        It's built only once from the LAT and LON columns of 'config_columns'. After this, the method 'radius_query'
+        only check the listings that are near of the coordinate.
+
+        Parameters
+        ----------
+        cell_km : float
+            Is the size of the cells of the grid in kilometres. Use a value close to the RADIO.
+            (Default value = 1.0)
+
+        Returns
+        ----------
+        GridIndex
+        """
+
+        # Validate if the method csv_to_df was applied before.
+        if self.df is None:
+            raise ValueError('You need to apply the method csv_to_df first to make this action')
+
+        lat = self.config_columns.get('LAT')  # <- The name of the Lat Col
+        long = self.config_columns.get('LON')  # <- The name of the Long Col
+
+        self.spatial_index = GridIndex(self.df[lat].to_numpy(dtype=float), self.df[long].to_numpy(dtype=float),
+                                       cell_km)
+        return self.spatial_index
+
+    @instrumented()
+    def build_partitions(self) -> ListingPartitions:
+        """Partition the DataFrame by (type_of_listing, type_of_offer, sector_inmo) to make faster the subsets.
+
+        After this, subset_by_type and query get the rows of the partition with a lookup, without comparing all the
+        rows of the DataFrame.
+
+        Returns
+        ----------
+        ListingPartitions
+        """
+
+        # Validate if the method csv_to_df was applied before.
+        if self.df is None:
+            raise ValueError('You need to apply the method csv_to_df first to make this action')
+
+        self.partitions = ListingPartitions(self.df, self.config_columns)
+        return self.partitions
+
+    @instrumented()
+    def to_dataset(self, build_index: bool = True) -> PreparedDataset:
+        """Create an immutable snapshot of the prepared DataFrame, the spatial index and the partitions.
+
+        The queries of the PreparedDataset (dataset module) don't save anything, so a pool of threads can use the
+        same dataset. The later changes of this instance don't change the dataset.
+
+        Parameters
+        ----------
+        build_index : bool
+            Build the spatial index if it doesn't exist. (Default value = True)
+
+        Returns
+        ----------
+        PreparedDataset
+        """
+
+        return PreparedDataset.from_radar(self, build_index)
+
+    @instrumented()
+    def build_zone_stats(self, cell_km: float = 0.5, accuracy: float = 0.01) -> ZoneStats:
+        """Precompute the statistics of the listings by cell and (type_of_listing, type_of_offer, sector_inmo) to
+        make instant zone summaries (zone_stats module).
+
+        Parameters
+        ----------
+        cell_km : float
+            Is the size of the cells in kilometres. Use a value smaller than the radio of the summaries.
+            (Default value = 0.5)
+
+        accuracy : float
+            Is the relative error of the quantiles. (Default value = 0.01)
+
+        Returns
+        ----------
+        ZoneStats
+        """
+
+        # Validate if the method csv_to_df was applied before.
+        if self.df is None:
+            raise ValueError('You need to apply the method csv_to_df first to make this action')
+
+        self.zone_stats = ZoneStats(self.df, self.config_columns, cell_km, accuracy)
+        return self.zone_stats
+
+    @instrumented()
+    def zone_summary(self, lat: float = None, long: float = None, radio: float = None, type_of_listing: str = None,
+                     type_of_offer: str = None, sector_inmo: str = None, by_group: bool = False,
+                     quantiles: tuple = (0.25, 0.5, 0.75)):
+        """Return the approximate statistics (count, mean and quantiles of the price, avg_price_m2 and
+        avg_price_const) of the listings around a coordinate, without reading the listings.
+
+        The zone is the cells of build_zone_stats with the center inside the circle, so the border of the zone has the
+        precision of the cell size. Use radius_query and rm_outliers for the exact rows.
+
+        Parameters
+        ----------
+        lat : float
+            Is the Latitude of the location. (Default value = None, it uses the main coordinates)
+
+        long : float
+            Is the Longitude of the location. (Default value = None, it uses the main coordinates)
+
+        radio : float
+            Is the radio of the zone in kilometres. (Default value = None, it uses the RADIO attribute)
+
+        type_of_listing : str
+            Filter by the type of listing (Casa or Departamento). (Default value = None, all)
+
+        type_of_offer : str
+            Filter by the type of offer (Buy or Rent). (Default value = None, all)
+
+        sector_inmo : str
+            Filter by the sector_inmo. It's ignored with by_group. (Default value = None, all)
+
+        by_group : bool
+            Return a DataFrame with the statistics of each (type_of_listing, type_of_offer, sector_inmo) instead of a
+            dict with the statistics of all the listings of the filters. (Default value = False)
+
+        quantiles : tuple
+            Are the quantiles of each metric. (Default value = (0.25, 0.5, 0.75))
+
+        Returns
+        -------
+        dict or DataFrame
+        """
+
+        lat = self.lat if lat is None else lat
+        long = self.long if long is None else long
+        radio = self.RADIO if radio is None else radio
+
+        if lat is None or long is None:
+            raise ValueError('You need to add the main coordinates. Apply "set_coordinates" function to do that =)')
+
+        # Build the statistics only the first time
+        if self.zone_stats is None:
+            self.build_zone_stats()
+
+        if by_group:
+            return self.zone_stats.summary_by_group(lat, long, radio, type_of_listing, type_of_offer, quantiles)
+
+        return self.zone_stats.summary(lat, long, radio, type_of_listing, type_of_offer, sector_inmo, quantiles)
+
+    def reset_indexes(self) -> None:
+        """Remove the spatial index, the partitions, the zone statistics and the cached results. Use it if you change
+        the rows of the DataFrame."""
+        self.spatial_index = None
+        self.partitions = None
+        self.zone_stats = None
+        self.clear_result_cache()
+
+    def enable_result_cache(self, max_entries: int = 256, max_bytes: int = 256 * 2 ** 20,
+                            precision: int = 4) -> ResultCache:
+        """Save the results of the method 'query' in a LRU cache (result_cache module).
+
+        The key uses the coordinate rounded to 'precision' decimals, so the near coordinates (same neighbourhood)
+        return the same result (and the distances of the first coordinate). The cache is cleared when a new DataFrame
+        is assigned to 'df', the columns are created again or the rows change (append_rows, remove_rows). The in
+        place changes of the DataFrame (Example: p.df['precio_name'] = ...) can't be seen by the cache: call
+        'clear_result_cache' after them.
+
+        Parameters
+        ----------
+        max_entries : int
+            Is the maximum number of results. (Default value = 256)
+
+        max_bytes : int
+            Is the maximum memory of the cached DataFrames. (Default value = 256 MB)
+
+        precision : int
+            Is the number of decimals of the coordinates in the key. 4 decimals are ~11 metres. (Default value = 4)
+
+        Returns
+        ----------
+        ResultCache -> Use its 'stats' method to see the hits and misses.
+        """
+
+        self.result_cache = ResultCache(max_entries, max_bytes, precision)
+        return self.result_cache
+
+    def clear_result_cache(self) -> None:
+        """Remove the cached results of the method 'query'."""
+        if self.result_cache is not None:
+            self.result_cache.clear()
+
+    @instrumented(rows_in='arg')
+    def append_rows(self, rows: pd.core.frame.DataFrame) -> pd.core.frame.DataFrame:
+        """Add new listings at the end of the DataFrame without reading the CSV files again.
+
+        Only the new rows are enriched with the columns 'sector_inmo', 'avg_price_m2' and 'avg_price_const' (if the
+        DataFrame has them). The enriched rows wait in a buffer, so the cost of a delta is the cost of its own rows:
+        they are merged in the DataFrame, the spatial index and the partitions (only the new rows are indexed) the
+        next time one of them is used (see apply_updates). The categorical columns keep their type.
+
+        Parameters
+        ----------
+        rows : DataFrame
+            Are the new listings, with the columns of the CSV files.
+
+        Returns
+        ----------
+        DataFrame -> The enriched new rows
+        """
+
+        # Validate if the method csv_to_df was applied before.
+        if self._df is None:
+            raise ValueError('You need to apply the method csv_to_df first to make this action')
+
+        columns = self._df.columns
+        rows = rows.reset_index(drop=True)
+
+        # Only the new rows are enriched
+        if 'sector_inmo' in columns:
+            self.set_col_sector_inmo(rows)
+        if 'avg_price_m2' in columns or 'avg_price_const' in columns:
+            self.set_avg_price_cols('avg_price_m2' in columns, 'avg_price_const' in columns, rows)
+
+        self._pending_rows.append(rows[[col for col in columns if col in rows]])
+
+        self.zone_stats = None  # <- Built again by the next zone_summary
+        self.clear_result_cache()
+        return rows
+
+    @instrumented()
+    def remove_rows(self, *ids) -> None:
+        """Remove the listings with the IDs (the 'id' column of config_columns) without reading the CSV files again.
+
+        The rows of append_rows that are still in the buffer are removed at once. The other IDs wait in the buffer like
+        the new rows: they are removed from the DataFrame, the spatial index and the partitions (without building them
+        again) the next time one of them is used (see apply_updates).
+
+        Parameters
+        ----------
+        *ids :
+            Are the IDs of the listings to remove (Example: 'sku-1', 'sku-2')
+        """
+
+        # Validate if the method csv_to_df was applied before.
+        if self._df is None:
+            raise ValueError('You need to apply the method csv_to_df first to make this action')
+
+        id_col = self.config_columns['ID']
+        self._pending_rows = [rows[~rows[id_col].isin(ids)] for rows in self._pending_rows]
+        self._removed_ids.update(ids)
+
+        self.zone_stats = None  # <- Built again by the next zone_summary
+        self.clear_result_cache()
+
+    @instrumented()
+    def apply_updates(self) -> None:
+        """Merge the pending updates of append_rows and remove_rows in the DataFrame, the spatial index and the
+        partitions. It's called when the attributes 'df', 'spatial_index' or 'partitions' are used, so all the deltas
+        since the last query are merged at once. It's instrumented: the merge is recorded as its own call (an inner
+        call of the method that used the attribute).
+        """
+
+        if not self._pending_rows and not self._removed_ids:
+            return
+
+        df, pending_rows, removed_ids = self._df, self._pending_rows, self._removed_ids
+        self._pending_rows, self._removed_ids = [], set()
+
+        if removed_ids:
+            removed = df[self.config_columns['ID']].isin(list(removed_ids)).to_numpy()
+            if removed.any():
+                df = df[~removed].reset_index(drop=True)
+                if self._spatial_index is not None:
+                    self._spatial_index.remove(removed)
+                if self._partitions is not None:
+                    self._partitions.remove(removed)
+
+        rows = pd.concat(pending_rows, ignore_index=True) if pending_rows else None
+        if rows is not None and len(rows):
+            # The same categories in both DataFrames, so the concat keeps the categorical columns (without new
+            # codes), and the same float types (float32 coordinates of cvs_to_df with compact_coordinates).
+            for col in df.columns:
+                if col in rows and df[col].dtype.kind == 'f':
+                    rows[col] = rows[col].astype(df[col].dtype)
+                elif isinstance(df[col].dtype, pd.CategoricalDtype) and col in rows:
+                    categories = df[col].cat.categories
+                    new_categories = pd.Index(rows[col].dropna().unique()).difference(categories)
+                    if len(new_categories):
+                        df[col] = df[col].cat.add_categories(new_categories)
+                    rows[col] = pd.Categorical(rows[col], categories=df[col].cat.categories)
+
+            df = pd.concat([df, rows], ignore_index=True)
+
+            if self._spatial_index is not None:
+                self._spatial_index.append(rows[self.config_columns['LAT']].to_numpy(dtype=float),
+                                           rows[self.config_columns['LON']].to_numpy(dtype=float))
+            if self._partitions is not None:
+                self._partitions.append(rows)
+
+        self._df = df
+
+    @instrumented(rows_in='arg')
+    def update_rows(self, rows: pd.core.frame.DataFrame) -> pd.core.frame.DataFrame:
+        """Replace the listings with the same IDs of the rows (the old rows are removed and the new ones are added at
+        the end of the DataFrame). The rows with new IDs are added.
+
+        Parameters
+        ----------
+        rows : DataFrame
+            Are the new values of the listings, with the columns of the CSV files.
+
+        Returns
+        ----------
+        DataFrame -> The enriched new rows
+        """
+
+        self.remove_rows(*rows[self.config_columns['ID']])
+        return self.append_rows(rows)
+
+    @instrumented()
+    def radius_query(self, lat: float = None, long: float = None, radio: float = None,
+                     type_of_listing: str = None, type_of_offer: str = None) -> pd.core.frame.DataFrame:
+        """Find all the listings of the DataFrame within the radio of a coordinate using the spatial index.
+
+        It doesn't need the subset_by_type and mesure_df_distances methods. The result contains the column
+        'distancia' (km).
+
+        Parameters
+        ----------
+        lat : float
+            Is the Latitude of the location. (Default value = None, it uses the main coordinates)
+
+        long : float
+            Is the Longitude of the location. (Default value = None, it uses the main coordinates)
+
+        radio : float
+            Is the radio of the circle in kilometres. (Default value = None, it uses the RADIO attribute)
+
+        type_of_listing : str
+            Filter the result by the type of listing (Casa or Departamento). (Default value = None, all)
+
+        type_of_offer : str
+            Filter the result by the type of offer (Buy or Rent). (Default value = None, all)
+
+        Returns
+        -------
+        DataFrame
+        """
+
+        lat = self.lat if lat is None else lat
+        long = self.long if long is None else long
+        radio = self.RADIO if radio is None else radio
+
+        if lat is None or long is None:
+            raise ValueError('You need to add the main coordinates. Apply "set_coordinates" function to do that =)')
+
+        # Build the index only the first time
+        if self.spatial_index is None:
+            self.build_spatial_index()
+
+        positions, distances = self.spatial_index.query_radius(lat, long, radio, self.DISTANCE_METHOD)
+
+        result = self.df.take(positions)
+        result['distancia'] = distances
+
+        # Filter only the candidates, never the whole DataFrame
+        if type_of_listing is not None:
+            result = result[result[self.config_columns['TYPE_OF_LISTING']] == type_of_listing]
+
+        if type_of_offer is not None:
+            result = result[result[self.config_columns['TYPE_OF_OFFER']] == type_of_offer]
+
+        return result
+
+    @instrumented()
+    def set_col_sector_inmo(self, dataframe: pd.core.frame.DataFrame = None) -> pd.core.frame.DataFrame:
+        """Create a new column call it 'sector_inmo'. This column contain a category of the socioeconomic real estate
+         segment. It's calculated for the whole column at once (see segment_sector_inmo_codes).
 
          This segmentation apply in Mexico.
 
         Parameters
         ----------
+        dataframe : DataFrame
+            Is the DataFrame to change. (Default value = None, the DataFrame of the instance)
 
         Returns
         ----------
@@ -140,19 +812,26 @@ class PerfectRadar:
         """
 
 
-        df = self.df
+        df = self.df if dataframe is None else dataframe
         type_of_offer_col = self.config_columns['TYPE_OF_OFFER'] # <- Just for make more readable the code
         price_col = self.config_columns['PRICE']
 
         # Validate if the method csv_to_df was applied before.
         if df is None:
-            raise 'You need to apply the method csv_to_df first to make this action'
-
-        # Create the Column that contain the category by price of the listing.
-        df['sector_inmo'] = df.apply(lambda row: segment_sector_inmo(row.loc[type_of_offer_col],
-                                                                     row.loc[price_col]), axis=1)
+            raise ValueError('You need to apply the method csv_to_df first to make this action')
+
+        # Create the Column that contain the category by price of the listing (The code -1 is Unknown).
+        codes = segment_sector_inmo_codes(df[type_of_offer_col].to_numpy(), df[price_col].to_numpy())
+        df['sector_inmo'] = pd.Categorical.from_codes(np.where(codes < 0, len(SECTOR_INMO_LABELS), codes),
+                                                      categories=SECTOR_INMO_LABELS + [UNKNOWN_SECTOR_INMO])
+        if dataframe is None:
+            self.zone_stats = None
+            self.clear_result_cache()  # <- The cached results have the old column
+            if self.partitions is not None:
+                self.build_partitions()  # <- The blocks of the sectors have the old column
         return df
 
+    @instrumented()
     def set_avg_pricem2_col(self) -> pd.core.frame.DataFrame:
         """Set a new column that contains the Average Price of the construction of a property.
 
@@ -161,45 +840,69 @@ class PerfectRadar:
         pd.core.frame.DataFrame
         """
 
-        df = self.df
+        return self.set_avg_price_cols(const=False)
 
-        land_size_m2 = self.config_columns['LAND_SIZE']
-        price = self.config_columns['PRICE']
-        type_of_listing_col = self.config_columns['TYPE_OF_LISTING']
+    @instrumented()
+    def set_avg_priceconst_col(self) -> pd.core.frame.DataFrame:
+        """Set a new column that contains the average price of construction of a property.
 
-        # Validate the existence of a DataFrame
-        if df is None:
-            raise 'You need to apply the method csv_to_df first to make this action'
+        Returns
+        ----------
+        pd.core.frame.DataFrame
+        """
 
-        # Crete the Column with the average price of land size
-        df['avg_price_m2'] = df.apply(lambda row: avg_price_m2(row.loc[price],
-                                                               row.loc[land_size_m2],
-                                                               row.loc[type_of_listing_col]), axis=1)
+        return self.set_avg_price_cols(m2=False)
 
-        return df
+    @instrumented()
+    def set_avg_price_cols(self, m2: bool = True, const: bool = True,
+                           dataframe: pd.core.frame.DataFrame = None) -> pd.core.frame.DataFrame:
+        """Set the columns 'avg_price_m2' and 'avg_price_const' in a single pass over the price and land size columns.
 
-    def set_avg_priceconst_col(self) -> pd.core.frame.DataFrame:
-        """Set a new column that contains the average price of construction of a property.
+        It's the vectorized version of the functions avg_price_m2 and avg_price_m2_const: The zero divisions, the
+        missing values and the Departments (in avg_price_m2) are 0.
+
+        Parameters
+        ----------
+        m2 : bool
+            Create the column 'avg_price_m2'. (Default value = True)
+
+        const : bool
+            Create the column 'avg_price_const'. (Default value = True)
+
+        dataframe : DataFrame
+            Is the DataFrame to change. (Default value = None, the DataFrame of the instance)
 
         Returns
         ----------
         pd.core.frame.DataFrame
         """
 
-        df = self.df
+        df = self.df if dataframe is None else dataframe
 
         land_size_m2 = self.config_columns['LAND_SIZE']
         price = self.config_columns['PRICE']
+        type_of_listing_col = self.config_columns['TYPE_OF_LISTING']
 
         # Validate the existence of a DataFrame
         if df is None:
-            raise 'You need to apply the method csv_to_df first to make this action'
+            raise ValueError('You need to apply the method csv_to_df first to make this action')
 
-        # Create the column with the average price
-        df['avg_price_const'] = df.apply(lambda row: avg_price_m2_const(row.loc[price], row.loc[land_size_m2]), axis=1)
+        # Both columns are the price divided by the land size (avg_price_m2 only for Houses).
+        avg_price = avg_price_m2_const_array(df[price].to_numpy(), df[land_size_m2].to_numpy())
 
+        if const:
+            df['avg_price_const'] = avg_price
+
+        if m2:
+            is_house = df[type_of_listing_col].isin(HOUSE_LISTINGS).to_numpy()
+            df['avg_price_m2'] = np.where(is_house, avg_price, 0)
+
+        if dataframe is None:
+            self.zone_stats = None
+            self.clear_result_cache()  # <- The cached results have the old columns
         return df
 
+    @instrumented()
     def set_sim_val(self, price: float_int, m2_terr: float_int,
                     m2_const: float_int, rooms: int, bathrooms: int, cars: int) -> None:
         """Assign information values to the attributes  to simulates a Listing.
@@ -240,6 +943,7 @@ class PerfectRadar:
         # Change this Global Value to true to apply the simulation
         self.sim_data = True
 
+    @instrumented()
     def subset_by_type(self, type_of_listing: str = 'Casa', type_of_offer: str = 'Buy') -> pd.core.frame.DataFrame:
         """Create a Subset of the DataFrame by type of listing and type of offer.
         
@@ -289,6 +993,15 @@ class PerfectRadar:
             raise ('You must setup the config_columns values of the DataFrame Columns names. '
                    'Use the config_columns method to do this!!!.')
 
+        # With partitions: take only the rows of the partition (it's already a new DataFrame)
+        if self.partitions is not None:
+            self.subset_by_type = self.df.take(self.partitions.get(type_of_listing, type_of_offer).positions)
+            self.subset_by_type_rent = None
+            if type_of_offer != rent_val:
+                self.subset_by_type_rent = self.df.take(self.partitions.get(type_of_listing, rent_val).positions)
+
+            return self.subset_by_type, self.subset_by_type_rent  # <- Sales and Rental Result
+
         # Create a General Subset: Sale / Rent
         self.subset_by_type = self.df[
             (self.df[get_type_listing] == type_of_listing) &
@@ -310,6 +1023,7 @@ class PerfectRadar:
 
         return self.subset_by_type, self.subset_by_type_rent  # <- Sales and Rental Result
 
+    @instrumented('subset')
     def set_subset_sector_inmo(self) -> pd.core.frame.DataFrame:
         """Validate if the Rent Subset have enough data to be significant to create a Subset with this data.
 
@@ -339,12 +1053,385 @@ class PerfectRadar:
         self.sector_inmo = segment_sector_inmo('Buy', self.price)
 
 
-        # Create the subset
+        # Create the subset (sector_inmo is categorical: the filter compares the small integer codes)
         self.subset_by_type_rent = rent_subset[rent_subset['sector_inmo'] == self.sector_inmo]
 
         return self.subset_by_type_rent
 
-    def mesure_distance(self, lat: float = None, long: float = None) -> distance.geodesic:
+    @instrumented('subset')
+    def subset_by_bbox(self, show_removed: bool = False) -> pd.core.frame.DataFrame:
+        """Remove the listings outside the bounding box of the circle of the main coordinates.
+
+        It's a cheap filter by latitude and longitude limits (derived from the RADIO) to apply before the
+        mesure_df_distances method. Then the exact distance is only calculated for the listings near the main
+        coordinates, with any distance method. The box is a little bigger than the circle, so it never removes a
+        listing inside the RADIO. The number of removed rows is saved in the attribute 'bbox_removed'.
+
+        Parameters
+        ----------
+        show_removed : bool
+            Print the number of rows removed by the box.
+            (Default value = False)
+
+        Returns
+        -------
+        DataFrame
+        """
+
+        main_subset = self.subset_by_type
+        rent_subset = self.subset_by_type_rent
+        lat = self.config_columns.get('LAT')  # <- The name of the Lat Col
+        long = self.config_columns.get('LON')  # <- The name of the Long Col
+
+        # Validate Main subset exist
+        if main_subset is None:
+            raise ValueError('Apply the subset_by_type function first.')
+
+        if self.lat is None or self.long is None:
+            raise ValueError('You need to add the main coordinates. Apply "set_coordinates" function to do that =)')
+
+        box = bounding_box(self.lat, self.long, self.RADIO)
+        self.bbox_removed = {'main': 0, 'rent': 0}
+
+        mask = bbox_mask(main_subset[lat].to_numpy(dtype=float), main_subset[long].to_numpy(dtype=float), box)
+        self.bbox_removed['main'] = int(len(mask) - mask.sum())
+        self.subset_by_type = main_subset[mask].copy()
+
+        # Validate if Rent Subset exist
+        if rent_subset is not None:
+            mask = bbox_mask(rent_subset[lat].to_numpy(dtype=float), rent_subset[long].to_numpy(dtype=float), box)
+            self.bbox_removed['rent'] = int(len(mask) - mask.sum())
+            self.subset_by_type_rent = rent_subset[mask].copy()
+
+        if show_removed:
+            print(f'The bounding box removed {self.bbox_removed["main"]} rows of the main subset and '
+                  f'{self.bbox_removed["rent"]} rows of the rent subset.')
+
+        return self.subset_by_type, self.subset_by_type_rent
+
+    @instrumented()
+    def query(self, type_of_listing: str = 'Casa', type_of_offer: str = 'Buy', *values_to_rm: str,
+              lat: float = None, long: float = None, price: float_int = None,
+              radio: float = None) -> pd.core.frame.DataFrame:
+        """Find the main and rent comparables of a coordinate without copies of the DataFrame.
+
+        It's the same result of the methods subset_by_type, set_subset_sector_inmo, mesure_df_distances, subset_by_km
+        and rm_outliers, but each step only filters an array of row positions over the DataFrame (see the query
+        module) and the rows are copied only once at the end. It doesn't change the attributes of the instance
+        (subset_by_type, subset_by_type_rent...). It uses the spatial index or the partitions if they were built, and
+        the result cache if it was enabled (enable_result_cache).
+
+        Parameters
+        ----------
+        type_of_listing : str
+            Is the type of listing (Casa or Departamento). (Default value = 'Casa')
+
+        type_of_offer : str
+            Is the type of offer (Buy or Rent). (Default value = 'Buy')
+
+        *values_to_rm : str :
+            Are the names of the columns to remove the outliers (like rm_outliers).
+
+        lat : float
+            Is the Latitude of the location. (Default value = None, it uses the main coordinates)
+
+        long : float
+            Is the Longitude of the location. (Default value = None, it uses the main coordinates)
+
+        price : float_int
+            Is the price of the simulated listing to select the sector_inmo of the rent comparables.
+            (Default value = None, it uses the price of set_sim_val if it was applied)
+
+        radio : float
+            Is the radio of the circle in kilometres. (Default value = None, it uses the RADIO attribute)
+
+        Returns
+        -------
+        DataFrame -> The main and rent DataFrames (rent is None for Rent queries)
+        """
+
+        lat = self.lat if lat is None else lat
+        long = self.long if long is None else long
+        price = getattr(self, 'price', None) if price is None else price
+
+        if lat is None or long is None:
+            raise ValueError('You need to add the main coordinates. Apply "set_coordinates" function to do that =)')
+
+        # Validate if the method csv_to_df was applied before.
+        if self.df is None:
+            raise ValueError('You need to apply the method csv_to_df first to make this action')
+
+        radio = self.RADIO if radio is None else radio
+        cache = self.result_cache
+
+        if cache is not None:
+            cache.bind(self.df)  # <- Clear the results of an old DataFrame
+            sector_inmo = segment_sector_inmo('Buy', price) if price is not None else None
+            key = cache.make_key(lat, long, type_of_listing, type_of_offer, radio, sector_inmo, values_to_rm,
+                                 self.DISTANCE_METHOD)
+            result = cache.get(key)
+            if result is not None:
+                return copy_result(result)
+
+        result = query.radar_query(self.df, self.config_columns, lat, long, type_of_listing, type_of_offer, price,
+                                   radio, values_to_rm, self.DISTANCE_METHOD, self.spatial_index, self.partitions)
+
+        if cache is not None:
+            cache.put(key, result)
+            result = copy_result(result)
+
+        return result
+
+    @instrumented()
+    def polygon_query(self, polygon, type_of_listing: str = 'Casa', type_of_offer: str = 'Buy', *values_to_rm: str,
+                      price: float_int = None, lat: float = None, long: float = None) -> tuple:
+        """Find the main and rent comparables inside a polygon (Example: the boundary of a colonia).
+
+        The listings are filtered by the bounding box of the polygon (with the spatial index if it was built) and then
+        by a vectorized point-in-polygon test (see the polygons module). The result has the same columns of
+        subset_by_km and it doesn't change the attributes of the instance.
+
+        Parameters
+        ----------
+        polygon : dict or list
+            Is a GeoJSON Feature, Polygon or MultiPolygon, or the coordinates of a Polygon ([lon, lat] like GeoJSON)
+
+        type_of_listing : str
+            Is the type of listing (Casa or Departamento). (Default value = 'Casa')
+
+        type_of_offer : str
+            Is the type of offer (Buy or Rent). (Default value = 'Buy')
+
+        *values_to_rm : str :
+            Are the names of the columns to remove the outliers (like rm_outliers).
+
+        price : float_int
+            Is the price of the simulated listing to select the sector_inmo of the rent comparables.
+            (Default value = None, it uses the price of set_sim_val if it was applied)
+
+        lat : float
+            Is the Latitude to mesure the column 'distancia'. (Default value = None, the main coordinates or the
+            center of the polygon)
+
+        long : float
+            Is the Longitude to mesure the column 'distancia'. (Default value = None, the main coordinates or the
+            center of the polygon)
+
+        Returns
+        -------
+        tuple -> The main and rent DataFrames (rent is None for Rent queries)
+        """
+
+        # Validate if the method csv_to_df was applied before.
+        if self.df is None:
+            raise ValueError('You need to apply the method csv_to_df first to make this action')
+
+        lat = self.lat if lat is None else lat
+        long = self.long if long is None else long
+        price = getattr(self, 'price', None) if price is None else price
+
+        return query.radar_polygon(self.df, self.config_columns, polygon, type_of_listing, type_of_offer, price,
+                                   values_to_rm, lat, long, self.DISTANCE_METHOD, self.spatial_index)
+
+    @instrumented()
+    def ring_query(self, rings: tuple = (1, 2, 3), type_of_listing: str = 'Casa', type_of_offer: str = 'Buy',
+                   *values_to_rm: str, lat: float = None, long: float = None, price: float_int = None) -> tuple:
+        """Find the main and rent comparables of concentric rings (Example: 0-1 km, 1-2 km and 2-3 km).
+
+        The distances are mesured once for the biggest circle and the column 'ring' is the number of the ring of each
+        listing (0 for the first ring), so the statistics of the rings are a groupby('ring'). The result has the same
+        columns of subset_by_km and it doesn't change the attributes of the instance.
+
+        Parameters
+        ----------
+        rings : tuple
+            Are the outer radios of the rings in kilometres, in increasing order. (Default value = (1, 2, 3))
+
+        type_of_listing : str
+            Is the type of listing (Casa or Departamento). (Default value = 'Casa')
+
+        type_of_offer : str
+            Is the type of offer (Buy or Rent). (Default value = 'Buy')
+
+        *values_to_rm : str :
+            Are the names of the columns to remove the outliers of all the rings (like rm_outliers).
+
+        lat : float
+            Is the Latitude of the location. (Default value = None, it uses the main coordinates)
+
+        long : float
+            Is the Longitude of the location. (Default value = None, it uses the main coordinates)
+
+        price : float_int
+            Is the price of the simulated listing to select the sector_inmo of the rent comparables.
+            (Default value = None, it uses the price of set_sim_val if it was applied)
+
+        Returns
+        -------
+        tuple -> The main and rent DataFrames (rent is None for Rent queries) with the column 'ring'
+        """
+
+        lat = self.lat if lat is None else lat
+        long = self.long if long is None else long
+        price = getattr(self, 'price', None) if price is None else price
+
+        if lat is None or long is None:
+            raise ValueError('You need to add the main coordinates. Apply "set_coordinates" function to do that =)')
+
+        # Validate if the method csv_to_df was applied before.
+        if self.df is None:
+            raise ValueError('You need to apply the method csv_to_df first to make this action')
+
+        return query.radar_rings(self.df, self.config_columns, lat, long, rings, type_of_listing, type_of_offer,
+                                 price, values_to_rm, self.DISTANCE_METHOD, self.spatial_index)
+
+    @instrumented()
+    def knn_query(self, k: int = 10, type_of_listing: str = 'Casa', type_of_offer: str = 'Buy',
+                  lat: float = None, long: float = None, price: float_int = None, radio: float = None,
+                  grow_radio: bool = False) -> pd.core.frame.DataFrame:
+        """Find the k nearest main and rent comparables of a coordinate (instead of all the listings in the RADIO).
+
+        The k nearest are selected with a partial sort, and with the spatial index (build_spatial_index) only the
+        listings of a circle that grows until it has k listings are mesured. It doesn't change the attributes of the
+        instance.
+
+        Parameters
+        ----------
+        k : int
+            Is the number of listings of each DataFrame. (Default value = 10)
+
+        type_of_listing : str
+            Is the type of listing (Casa or Departamento). (Default value = 'Casa')
+
+        type_of_offer : str
+            Is the type of offer (Buy or Rent). (Default value = 'Buy')
+
+        lat : float
+            Is the Latitude of the location. (Default value = None, it uses the main coordinates)
+
+        long : float
+            Is the Longitude of the location. (Default value = None, it uses the main coordinates)
+
+        price : float_int
+            Is the price of the simulated listing to select the sector_inmo of the rent comparables.
+            (Default value = None, it uses the price of set_sim_val if it was applied)
+
+        radio : float
+            Is the maximum distance in kilometres. (Default value = None, without limit; the RADIO with grow_radio)
+
+        grow_radio : bool
+            Double the radio until the rent DataFrame has RENTAL_MINIMAL_DATA rows (or k rows if k is smaller).
+            (Default value = False)
+
+        Returns
+        -------
+        DataFrame -> The main and rent DataFrames sorted by 'distancia' (rent is None for Rent queries)
+        """
+
+        lat = self.lat if lat is None else lat
+        long = self.long if long is None else long
+        price = getattr(self, 'price', None) if price is None else price
+
+        if lat is None or long is None:
+            raise ValueError('You need to add the main coordinates. Apply "set_coordinates" function to do that =)')
+
+        # Validate if the method csv_to_df was applied before.
+        if self.df is None:
+            raise ValueError('You need to apply the method csv_to_df first to make this action')
+
+        if grow_radio and radio is None:
+            radio = self.RADIO
+
+        return query.radar_knn(self.df, self.config_columns, lat, long, k, type_of_listing, type_of_offer, price,
+                               radio, self.RENTAL_MINIMAL_DATA if grow_radio else None, self.DISTANCE_METHOD,
+                               self.spatial_index, self.partitions)
+
+    @instrumented()
+    def batch_query(self, targets, radio: float = None, *values_to_rm: str, workers: int = 1,
+                    chunk_size: int = 2000) -> pd.core.frame.DataFrame:
+        """Find the sale and rent comparables of many target coordinates in a single call.
+
+        The DataFrame is prepared only once (prepare_df) and the distances of all the targets are mesured with the
+        spatial index. It doesn't change the attributes of a single query (subset_by_type, lat, long...).
+
+        The result is a long DataFrame keyed by 'target_id' with the column 'side': 'main' are the listings with the
+        type of listing and type of offer of the target, 'rent' are the rent listings of the same 'sector_inmo' of the
+        target price (like set_subset_sector_inmo).
+
+        Parameters
+        ----------
+        targets : DataFrame or list
+            Is a list of rows (lat, lon[, type_of_listing, type_of_offer, price]) or a DataFrame with this columns
+            (and optional 'target_id'). By default type_of_listing = 'Casa', type_of_offer = 'Buy' and no price
+            (the rent listings are not filtered by 'sector_inmo').
+
+        radio : float
+            Is the radio of the circle in kilometres. (Default value = None, it uses the RADIO attribute)
+
+        *values_to_rm : str :
+            Are the names of the columns to remove the outliers for each target and side (like rm_outliers).
+
+        workers : int
+            Is the number of processes to split the targets. With more than one it uses the parallel module (the
+            listings arrays are shared, not copied). None uses all the CPUs.
+            (Default value = 1)
+
+        chunk_size : int
+            Is the number of targets processed in each array operation (or task of the processes).
+            (Default value = 2000)
+
+        Returns
+        -------
+        DataFrame
+        """
+
+        if self.df is None:
+            self.prepare_df(*values_to_rm)
+
+        if workers is None or workers > 1:
+            from ..perfectradar import parallel  # <- multiprocessing is imported only when it's used
+            return parallel.parallel_batch_query(self, targets, radio, values_to_rm, workers, chunk_size)
+
+        return batch.batch_query(self, targets, radio, values_to_rm, chunk_size)
+
+    @instrumented()
+    def estimate_yields(self, targets, radio: float = None, rm_outliers: bool = True, expense_ratio: float = None,
+                        chunk_size: int = 2000) -> pd.core.frame.DataFrame:
+        """Estimate the monthly rent and the gross yield of many simulated listings in a single call.
+
+        It's the result of set_sim_val, set_subset_sector_inmo and rm_outliers over the Rent comparables for each
+        target, but the comparables of all the targets are found with the spatial index and summarized with array
+        operations (batch.estimate_yields). It doesn't change the attributes of a single query (sim_data, price...).
+
+        Parameters
+        ----------
+        targets : DataFrame or list
+            Is a list of rows (lat, lon[, type_of_listing, type_of_offer, price]) or a DataFrame with this columns and
+            the optional 'm2_terr' (land size) to estimate the rent by m2 too.
+
+        radio : float
+            Is the radio of the circle in kilometres. (Default value = None, it uses the RADIO attribute)
+
+        rm_outliers : bool
+            Remove the outliers of the rent prices of each target. (Default value = True)
+
+        expense_ratio : float
+            Is the part of the rent spent in expenses to estimate the 'cap_rate'. (Default value = None)
+
+        chunk_size : int
+            Is the number of targets processed in each array operation. (Default value = 2000)
+
+        Returns
+        -------
+        DataFrame -> One row for each target with 'rent_count', 'rent_median', 'gross_yield', 'enough_rent'...
+        """
+
+        if self.df is None:
+            self.prepare_df()
+
+        return batch.estimate_yields(self, targets, radio, rm_outliers, expense_ratio, chunk_size)
+
+    def mesure_distance(self, lat: float = None, long: float = None) -> 'distance.geodesic':
         """Mesure the distance between one to one coordinates.
         
         Apply the distance formula to mesure the distance between the main latitude and longitude with
@@ -369,18 +1456,26 @@ class PerfectRadar:
         if self.lat is None and self.long is None:
             raise 'You need to add the main coordinates. Apply "set_coordinates" function to do that =)'
 
+        from geopy import distance  # <- Slow import, only when it's used
+
         return distance.distance((self.lat, self.long), (lat, long))
 
-    def mesure_df_distances(self) -> pd.core.frame.DataFrame:
+    @instrumented('subset')
+    def mesure_df_distances(self, method: str = None) -> pd.core.frame.DataFrame:
         """Mesure the distance between one to many coordinates.
         
-        Apply the 'Mesure distance function' on multiple rows of the self.subset_by_type (DataFrame) and create
-        a new Column named: Distancia. Each result represent the distance of the main coordinates with a single
-        listing in the Data.
+        Mesure the distance of the main coordinates with all the rows of the self.subset_by_type (DataFrame) in a single
+        array operation and create a new Column named: Distancia. Each result represent the distance in kilometres
+        (float) of the main coordinates with a single listing in the Data.
 
         Parameters
         ----------
 
+        method : str
+            Is the method to mesure the distances: 'haversine', 'vincenty' or 'geodesic'. See the distances module
+            to know the error of each one.
+            (Default value = None, it uses the DISTANCE_METHOD attribute)
+
         Returns
         -------
         DataFrame
@@ -390,21 +1485,26 @@ class PerfectRadar:
         rent_subset = self.subset_by_type_rent if self.subset_by_type_rent is not None else None # Validate if Rent DF
         lat = self.config_columns.get('LAT')  # <- The name of the Lat Col
         long = self.config_columns.get('LON')  # <- The name of the Long Col
+        method = method or self.DISTANCE_METHOD
 
         # Validate Main subset exist
         if main_subset is None:
-            raise 'Apply the subset_by_type function first.'
+            raise ValueError('Apply the subset_by_type function first.')
+
+        if self.lat is None or self.long is None:
+            raise ValueError('You need to add the main coordinates. Apply "set_coordinates" function to do that =)')
 
-        main_subset['distancia'] = main_subset.apply(
-            lambda row: self.mesure_distance(row.loc[lat], row.loc[long]), axis=1)
+        main_subset['distancia'] = distances_km(self.lat, self.long, main_subset[lat].to_numpy(dtype=float),
+                                                main_subset[long].to_numpy(dtype=float), method)
 
         # Validate if Rent Subset exist
         if rent_subset is not None:
-            rent_subset['distancia'] = rent_subset.apply(
-                lambda row: self.mesure_distance(row.loc[lat], row.loc[long]), axis=1)
+            rent_subset['distancia'] = distances_km(self.lat, self.long, rent_subset[lat].to_numpy(dtype=float),
+                                                    rent_subset[long].to_numpy(dtype=float), method)
 
         return main_subset, rent_subset
 
+    @instrumented('subset')
     def subset_by_km(self) -> pd.core.frame.DataFrame:
         """Crete a new subset base on the nearest distance of the main coordinates an the listings.
         
@@ -429,14 +1529,42 @@ class PerfectRadar:
 
         return self.subset_by_type, self.subset_by_type_rent
 
+    @instrumented('arg')
+    def outlier_bounds(self, dataframe: pd.core.frame.DataFrame, *values_to_rm: str) -> dict:
+        """Calculate the limits (quantiles 0.01 and 0.99) of the outliers of the columns.
+
+        The result can be used in the 'bounds' argument of rm_outliers to apply the same limits in other queries
+        (rm_outliers only applies the limits of the first column).
+
+        Parameters
+        ----------
+        dataframe : pd.core.frame.DataFrame :
+            This is the attribute that contains the DataFrame to calculate the limits
+            (Example: self.subset_by_type')
+
+        *values_to_rm : str :
+            This is a list of the names of columns.
+
+        Returns
+        -------
+        dict -> {column: (min, max)}
+        """
+
+        return quantile_bounds(dataframe, *values_to_rm)
+
+    @instrumented('arg')
     def rm_outliers(self, dataframe: pd.core.frame.DataFrame,
-                    show_describe: bool = False, *values_to_rm: str) -> pd.core.frame.DataFrame:
+                    show_describe: bool = False, *values_to_rm: str, bounds: dict = None) -> pd.core.frame.DataFrame:
         """Remove the Outliers values in the DataFrame.
         
         The most commune values to remove are: price, land size and
         construction size. By default it suggests to delete the price of the DataFrame, because the prices is one of
         the most sensitive information for the user.
 
+        It's the same result of the original concat of the filtered tables and drop_duplicates (the rows inside the
+        limits of the first column, without duplicated IDs), made with a single boolean mask. The limits of the other
+        columns are not calculated and a UserWarning says they don't change the result.
+
         Parameters
         ----------
         show_describe : boolean "
@@ -450,33 +1578,41 @@ class PerfectRadar:
         *values_to_rm : str :
             This is a list of the names of columns values that will be removed from the Subset DataFrame.
 
+        bounds : dict
+            Are the limits of the columns calculated before with outlier_bounds: {column: (min, max)}. If the first
+            column doesn't have limits they are calculated. (Default value = None)
+
         Returns
         -------
         DataFrame
         """
 
-        if not values_to_rm:  # <- Validate if is a empty list
-            raise ('You need to add Values to the "rm_outliers" function. For example: price,'
-                   'land_size or construction_size')
+        bounds = dict(bounds or {})
 
-        df_without_outliers = []
-        for val in values_to_rm:
-            val_to_rm = dataframe[val]
+        if not values_to_rm and not bounds:  # <- Validate if is a empty list
+            raise ValueError('You need to add Values to the "rm_outliers" function. For example: price,'
+                             'land_size or construction_size')
 
-            # Create a Subset of the Outliers values (Min and Max).
-            q_low = val_to_rm.quantile(0.01)
-            q_high = val_to_rm.quantile(0.99)
+        columns = list(values_to_rm or bounds)
+        missing = [val for val in columns if val not in dataframe.columns]
+        if missing:
+            raise KeyError(f'The columns {missing} are not in the DataFrame.')
 
-            # Concatenate The subset to have all rows DF
-            dataframe = dataframe[(val_to_rm < q_high) & (val_to_rm > q_low)]
+        # Each filter of the original method was applied over the rows of the previous one, so the concat and the
+        # drop_duplicates kept the rows of the first filter. Only the limits of the first column remove rows.
+        warn_ignored_columns(columns)
+        first = columns[0]
+        if first not in bounds:
+            bounds.update(quantile_bounds(dataframe, first))
 
-            df_without_outliers.append(dataframe)
+        mask = outliers_mask(dataframe, {first: bounds[first]})
 
-        # Because it creates a new Table for each value introduced before is important to concat all tables.
-        dataframe = pd.concat(df_without_outliers)
+        dataframe = dataframe[mask]
 
         # And Drop the duplicate values for is ID (Example: SKU).
-        dataframe = dataframe.drop_duplicates(subset=self.config_columns.get('ID'), keep='first')
+        duplicated = dataframe[self.config_columns.get('ID')].duplicated(keep='first').to_numpy()
+        if duplicated.any():
+            dataframe = dataframe[~duplicated]
 
         # Show the a resume of the data result.
         if show_describe:
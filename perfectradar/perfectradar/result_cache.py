@@ -0,0 +1,117 @@
+"""result_cache
+==========================================================
+LRU cache of the results of the radar queries.
+
+The key is the main coordinate rounded to a number of decimals (near coordinates share the same result), the types of
+listing and offer, the radio, the sector_inmo and the columns used to remove the outliers. The cache is limited by the
+number of results and by the memory of the DataFrames; the least recently used results are removed first.
+"""
+
+from collections import OrderedDict
+
+import pandas as pd
+
+
+class ResultCache:
+    """Least recently used cache of (main DataFrame, rent DataFrame) results."""
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 256 * 2 ** 20, precision: int = 4):
+        """Create an empty cache.
+
+        Parameters
+        ----------
+        max_entries : int
+            Is the maximum number of results. (Default value = 256)
+
+        max_bytes : int
+            Is the maximum memory of the DataFrames of all the results. (Default value = 256 MB)
+
+        precision : int
+            Is the number of decimals of the coordinates in the key. 4 decimals are ~11 metres.
+            (Default value = 4)
+        """
+
+        if max_entries < 1 or max_bytes < 1:
+            raise ValueError('The cache needs at least one entry and one byte.')
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.precision = precision
+        self.source = None  # <- The DataFrame of the cached results
+        self.entries = OrderedDict()  # <- key: (result, nbytes), the last one is the most recently used
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f'ResultCache(entries={len(self)}, nbytes={self.nbytes}, hits={self.hits}, misses={self.misses})'
+
+    def make_key(self, lat: float, lon: float, type_of_listing: str, type_of_offer: str, radio: float,
+                 sector_inmo: str, values_to_rm: tuple, method: str) -> tuple:
+        """Create the key of a query. The coordinates are rounded to integers of 'precision' decimals."""
+        scale = 10 ** self.precision
+        return (round(lat * scale), round(lon * scale), type_of_listing, type_of_offer, float(radio), sector_inmo,
+                tuple(values_to_rm), method)
+
+    def get(self, key: tuple):
+        """Return the result of the key (and mark it as recently used) or None if it's not in the cache."""
+
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: tuple, result: tuple) -> None:
+        """Save a result. The results bigger than max_bytes are not saved."""
+
+        nbytes = sum(result_nbytes(df) for df in result)
+        if nbytes > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1]
+
+        self.entries[key] = (result, nbytes)
+        self.nbytes += nbytes
+
+        while len(self.entries) > self.max_entries or self.nbytes > self.max_bytes:
+            _, (_, old_nbytes) = self.entries.popitem(last=False)
+            self.nbytes -= old_nbytes
+            self.evictions += 1
+
+    def bind(self, df) -> None:
+        """Clear the cache if the results are of another DataFrame (for example after a reload)."""
+        if self.source is not df:
+            self.clear()
+            self.source = df
+
+    def clear(self) -> None:
+        """Remove all the results (the counters are kept)."""
+        self.entries.clear()
+        self.nbytes = 0
+
+    def stats(self) -> dict:
+        """Return the counters of the cache."""
+        return {'entries': len(self), 'nbytes': self.nbytes, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+
+def result_nbytes(df) -> int:
+    """Return the memory of a DataFrame of a result (0 for None)."""
+    if df is None:
+        return 0
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def copy_result(result: tuple) -> tuple:
+    """Return deep copies of the DataFrames of a result, so the caller can't change the cached ones (a shallow copy
+    shares the values without copy-on-write)."""
+    return tuple(df.copy() if isinstance(df, pd.DataFrame) else df for df in result)
@@ -0,0 +1,299 @@
+"""service
+==========================================================
+Asyncio HTTP/JSON service over one resident PerfectRadar dataset.
+
+The DataFrame is prepared, indexed and encoded only once when the service starts, and the queries never change it
+(there is no state of the method chain like subset_by_type). The concurrent queries are collected for 'max_wait'
+seconds (or until 'max_batch' queries) and solved together in an executor with the functions of the batch module:
+the distances of all the queries of a micro-batch are mesured in a single array operation.
+
+Endpoints:
+    GET  /health    -> {"status": "ok", "listings": 1000000}
+    POST /query     <- {"lat": 20.69, "lon": -103.41, "type_of_listing": "Casa", "type_of_offer": "Buy",
+                        "price": 6500000, "radio": 1.5, "outliers": ["precio_name"]}
+                    -> {"main": [{...listing...}, ...], "rent": [...]}
+
+Usage:
+    python -m perfectradar.perfectradar.service --csv ./demo_data/casa_venta ./demo_data/casa_renta \\
+        --outliers precio_name m2_terreno_name --port 8080
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+from ..perfectradar import batch
+
+MAX_BODY_BYTES = 2 ** 20
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+
+
+class RadarService:
+    """Answer the radius queries of many concurrent clients over one prepared PerfectRadar."""
+
+    def __init__(self, radar, max_batch: int = 256, max_wait: float = 0.005, executor=None):
+        """Prepare the service. The DataFrame of the radar must not change while the service is running.
+
+        Parameters
+        ----------
+        radar : PerfectRadar
+            Is the instance with the prepared DataFrame (prepare_df). The spatial index is built if it doesn't exist.
+
+        max_batch : int
+            Is the maximum number of queries solved together. (Default value = 256)
+
+        max_wait : float
+            Is the time in seconds that a query waits for other queries to make a micro-batch. (Default value = 0.005)
+
+        executor : concurrent.futures.Executor
+            Is the executor of the micro-batches. (Default value = None, the default executor of the event loop)
+        """
+
+        if radar.df is None:
+            raise ValueError('You need to apply the method prepare_df first to start the service')
+
+        if radar.spatial_index is None:
+            radar.build_spatial_index()
+
+        self.radar = radar
+        self.listings, self.values = batch.encode_listings(radar.df, radar.config_columns)  # <- Only once
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.executor = executor
+        self.queue = None
+        self.batcher = None
+        self.solving = set()  # <- The tasks of the groups in the executor
+        self.requests = 0
+        self.batches = 0
+
+    async def start(self) -> None:
+        """Start the task that solves the micro-batches (it's started by the first query)."""
+        if self.batcher is None:
+            self.queue = asyncio.Queue()
+            self.batcher = asyncio.create_task(self.run_batches())
+
+    async def stop(self) -> None:
+        """Stop the task of the micro-batches. The groups already in the executor are answered."""
+        if self.batcher is not None:
+            self.batcher.cancel()
+            try:
+                await self.batcher
+            except asyncio.CancelledError:
+                pass
+            self.batcher = None
+        await asyncio.gather(*self.solving)
+
+    async def query(self, lat: float, lon: float, type_of_listing: str = 'Casa', type_of_offer: str = 'Buy',
+                    price: float = None, radio: float = None, outliers: tuple = ()) -> tuple:
+        """Find the main and rent comparables of a coordinate (the same result of PerfectRadar.query).
+
+        Returns
+        -------
+        tuple -> (main DataFrame, rent DataFrame or None)
+        """
+
+        await self.start()
+        target = {'lat': float(lat), 'lon': float(lon), 'type_of_listing': type_of_listing,
+                  'type_of_offer': type_of_offer, 'price': np.nan if price is None else float(price)}
+        key = (self.radar.RADIO if radio is None else float(radio), tuple(outliers))
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((key, target, future))
+        self.requests += 1
+        return await future
+
+    async def run_batches(self) -> None:
+        """Collect the queries in micro-batches and solve them in the executor."""
+
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(pending) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # The queries with the same radio and outliers are solved together.
+            groups = {}
+            for key, target, future in pending:
+                groups.setdefault(key, []).append((target, future))
+
+            # Each group is a task and the loop goes back to the queue: a slow group doesn't make wait the other
+            # groups or the next micro-batches (the executor limits the groups solved at the same time).
+            for (radio, outliers), group in groups.items():
+                task = asyncio.create_task(self.solve_group(group, radio, outliers))
+                self.solving.add(task)  # <- A reference, the event loop only keeps weak references of the tasks
+                task.add_done_callback(self.solving.discard)
+
+    async def solve_group(self, group: list, radio: float, outliers: tuple) -> None:
+        """Solve the queries of a group in the executor and set the result of their futures.
+
+        Parameters
+        ----------
+        group : list
+            Are the queries with the same radio and outliers: [(target, future), ...]
+
+        radio : float
+            Is the radio of the queries in kilometres
+
+        outliers : tuple
+            Are the columns to remove the outliers
+        """
+
+        loop = asyncio.get_running_loop()
+        targets = pd.DataFrame([target for target, _ in group])
+        futures = [future for _, future in group]
+        try:
+            results = await loop.run_in_executor(self.executor, self.solve, targets, radio, outliers)
+        except Exception as exception:
+            results = [exception] * len(futures)
+
+        for future, result in zip(futures, results):
+            if future.done():  # <- The client cancelled the query
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        self.batches += 1
+
+    def solve(self, targets: pd.core.frame.DataFrame, radio: float, outliers: tuple) -> list:
+        """Solve a micro-batch (it runs in the executor). It only reads the shared DataFrame and arrays.
+
+        Returns
+        -------
+        list -> [(main DataFrame, rent DataFrame or None), ...] in the order of the targets
+        """
+
+        radar = self.radar
+        config = radar.config_columns
+        targets = batch.targets_to_df(targets)
+
+        encoded = batch.encode_targets(targets, self.values, config)
+        pairs = batch.chunk_pairs(radar.spatial_index, self.listings, encoded, 0, radio, radar.DISTANCE_METHOD)
+        result = batch.build_result(radar.df, targets, pairs, config.get('ID'), outliers, keep_index=True)
+
+        groups = result.groupby(['target_id', 'side'], sort=False).indices
+        empty = result.iloc[:0].drop(columns=['target_id', 'side'])
+
+        answers = []
+        for target_id, type_of_offer in zip(targets['target_id'], targets['type_of_offer']):
+            sides = []
+            for side in ('main', 'rent'):
+                positions = groups.get((target_id, side))
+                sides.append(empty if positions is None else
+                             result.iloc[positions].drop(columns=['target_id', 'side']))
+            answers.append((sides[0], None if type_of_offer == config['RENT'] else sides[1]))
+
+        return answers
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer one HTTP request of a connection (the connection is closed after the response)."""
+
+        try:
+            status, payload = await self.dispatch(reader)
+        except ValueError as exception:
+            status, payload = 400, json.dumps({'error': str(exception)})
+        except Exception as exception:
+            status, payload = 500, json.dumps({'error': type(exception).__name__})
+
+        body = payload.encode()
+        writer.write(f'HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n'
+                     f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def dispatch(self, reader: asyncio.StreamReader) -> tuple:
+        """Read the HTTP request and return the status and the JSON of the response."""
+
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if len(request_line) != 3:
+            raise ValueError('Invalid HTTP request.')
+        method, path, _ = request_line
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY_BYTES:
+            return 413, json.dumps({'error': 'The body is too large.'})
+        body = await reader.readexactly(length) if length else b''
+
+        if path == '/health':
+            return 200, json.dumps({'status': 'ok', 'listings': len(self.radar.df), 'requests': self.requests,
+                                    'batches': self.batches})
+        if path != '/query':
+            return 404, json.dumps({'error': f'Unknown path {path}'})
+        if method != 'POST':
+            return 405, json.dumps({'error': 'Use POST /query'})
+
+        request = json.loads(body or b'{}')
+        if not isinstance(request, dict) or 'lat' not in request or 'lon' not in request:
+            raise ValueError('The query needs "lat" and "lon".')
+
+        unknown = [col for col in request.get('outliers', []) if col not in self.radar.df]
+        if unknown:
+            raise ValueError(f'The columns {unknown} are not in the listings.')
+
+        main_df, rent_df = await self.query(request['lat'], request['lon'], request.get('type_of_listing', 'Casa'),
+                                            request.get('type_of_offer', 'Buy'), request.get('price'),
+                                            request.get('radio'), tuple(request.get('outliers', [])))
+
+        # to_json converts the numpy and pandas types
+        rent_json = 'null' if rent_df is None else rent_df.to_json(orient='records')
+        return 200, f'{{"main": {main_df.to_json(orient="records")}, "rent": {rent_json}}}'
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8080) -> asyncio.AbstractServer:
+        """Start the HTTP server (use port 0 to choose a free port) and return it."""
+        await self.start()
+        return await asyncio.start_server(self.handle, host, port)
+
+
+def main(argv: list = None) -> int:
+    """Load the listings once and serve the queries until the process stops."""
+
+    from ..perfectradar import cli
+
+    parser = argparse.ArgumentParser(description='HTTP/JSON service of the PerfectRadar queries.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--outliers', nargs='*', default=[], help='Columns to load to remove the outliers')
+    parser.add_argument('--max-batch', type=int, default=256, help='Queries of each micro-batch (default: 256)')
+    parser.add_argument('--max-wait', type=float, default=0.005,
+                        help='Seconds that a query waits for a micro-batch (default: 0.005)')
+    cli.add_radar_arguments(parser)
+    args = parser.parse_args(argv)
+
+    service = RadarService(cli.load_radar(args, 'perfectradar-service'), args.max_batch, args.max_wait)
+
+    async def serve_forever():
+        server = await service.serve(args.host, args.port)
+        print(f'Serving {len(service.radar.df)} listings on http://{args.host}:{args.port}')
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""spatial_index
+==========================================================
+Grid of cells over the coordinates of the listings to answer radius queries.
+
+The listings are grouped in cells of 'cell_km' size. A radius query only reads the cells that touch the bounding box
+of the circle, and mesure the exact distance of those candidates. The cost of the query depends on the number of
+listings near the main coordinate and not in the size of the table.
+"""
+
+import numpy as np
+from ..perfectradar.distances import distances_km, bounding_box, lon_ranges, KM_PER_DEGREE_LAT, KM_PER_DEGREE_LON
+
+
+class GridIndex:
+    """Bucket map of the listings by geographic cell."""
+
+    def __init__(self, lats: np.ndarray, lons: np.ndarray, cell_km: float = 1.0):
+        """Build the index from the coordinates of the listings.
+
+        Parameters
+        ----------
+        lats : np.ndarray
+            Are the Latitudes of the listings. The position of each value is the position returned by the queries.
+
+        lons : np.ndarray
+            Are the Longitudes of the listings
+
+        cell_km : float
+            Is the size of the cells (kilometres in the latitude axis). Use a value close to the radio of the queries.
+            (Default value = 1.0)
+        """
+
+        if cell_km <= 0:
+            raise ValueError('The "cell_km" of the GridIndex must be a positive number.')
+
+        self.cell_km = cell_km
+        self.cell_deg = cell_km / KM_PER_DEGREE_LAT
+        self.n_cols = int(np.ceil(360 / self.cell_deg)) + 1
+
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+
+        # The listings without coordinates are not indexed.
+        positions = np.flatnonzero(np.isfinite(self.lats) & np.isfinite(self.lons))
+        keys = self.cell_keys(self.lats[positions], self.lons[positions])
+
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.positions = positions[order]
+
+    @classmethod
+    def from_arrays(cls, lats: np.ndarray, lons: np.ndarray, keys: np.ndarray, positions: np.ndarray,
+                    cell_km: float) -> 'GridIndex':
+        """Create the index from the arrays of other index (lats, lons, keys and positions) without sorting again.
+
+        It's used to attach the index of the shared memory in the workers of the parallel module.
+        """
+
+        index = cls.__new__(cls)
+        index.cell_km = cell_km
+        index.cell_deg = cell_km / KM_PER_DEGREE_LAT
+        index.n_cols = int(np.ceil(360 / index.cell_deg)) + 1
+        index.lats, index.lons = lats, lons
+        index.keys, index.positions = keys, positions
+        return index
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __repr__(self):
+        return f'GridIndex(listings={len(self)}, cell_km={self.cell_km})'
+
+    def copy(self) -> 'GridIndex':
+        """Return a copy that is not changed by the append and remove methods of this one (the arrays are shared, they
+        are replaced, never changed in place)."""
+        return GridIndex.from_arrays(self.lats, self.lons, self.keys, self.positions, self.cell_km)
+
+    def append(self, lats: np.ndarray, lons: np.ndarray) -> None:
+        """Add new listings at the end of the positions (len(self.lats), len(self.lats) + 1, ...).
+
+        The new keys are merged in the sorted keys (after the equal keys), it doesn't sort the whole index again.
+
+        Parameters
+        ----------
+        lats : np.ndarray
+            Are the Latitudes of the new listings
+
+        lons : np.ndarray
+            Are the Longitudes of the new listings
+        """
+
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+
+        positions = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons))
+        keys = self.cell_keys(lats[positions], lons[positions])
+        order = np.argsort(keys, kind='stable')
+        keys, positions = keys[order], positions[order] + len(self.lats)
+
+        where = np.searchsorted(self.keys, keys, side='right')
+        self.keys = np.insert(self.keys, where, keys)
+        self.positions = np.insert(self.positions, where, positions)
+        self.lats = np.concatenate([self.lats, lats])
+        self.lons = np.concatenate([self.lons, lons])
+
+    def remove(self, removed: np.ndarray) -> None:
+        """Remove listings from the index. The positions of the next listings move back (like a reset_index).
+
+        Parameters
+        ----------
+        removed : np.ndarray
+            Is a boolean mask over the positions of the listings, True for the removed ones.
+        """
+
+        removed = np.asarray(removed, dtype=bool)
+        new_positions = np.cumsum(~removed) - 1
+
+        keep = ~removed[self.positions]
+        self.keys = self.keys[keep]
+        self.positions = new_positions[self.positions[keep]]
+        self.lats = self.lats[~removed]
+        self.lons = self.lons[~removed]
+
+    def cell_rows(self, lats: np.ndarray) -> np.ndarray:
+        """Return the row of the cells of the Latitudes."""
+        return np.floor((np.asarray(lats, dtype=np.float64) + 90) / self.cell_deg).astype(np.int64)
+
+    def cell_cols(self, lons: np.ndarray) -> np.ndarray:
+        """Return the column of the cells of the Longitudes."""
+        return np.floor((np.asarray(lons, dtype=np.float64) + 180) / self.cell_deg).astype(np.int64)
+
+    def cell_keys(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        """Return the unique key of the cells of the coordinates."""
+        return self.cell_rows(lats) * self.n_cols + self.cell_cols(lons)
+
+    def candidates(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Return the positions of the listings in the cells that touch the bounding box of the circle.
+
+        Parameters
+        ----------
+        lat : float
+            Is the Latitude of the main location
+
+        lon : float
+            Is the Longitude of the main location
+
+        radius_km : float
+            Is the radio of the circle in kilometres
+
+        Returns
+        -------
+        np.ndarray
+        """
+
+        return self.candidates_box(bounding_box(lat, lon, radius_km))
+
+    def candidates_box(self, box: tuple) -> np.ndarray:
+        """Return the positions of the listings in the cells that touch a bounding box.
+
+        Parameters
+        ----------
+        box : tuple
+            Is the box (lat_min, lat_max, lon_min, lon_max), like the result of the function 'bounding_box'
+
+        Returns
+        -------
+        np.ndarray
+        """
+
+        lat_min, lat_max, lon_min, lon_max = box
+        rows = np.arange(self.cell_rows(lat_min), self.cell_rows(lat_max) + 1)
+
+        # Each row of cells is a continuous range of keys, so it only needs two binary searches.
+        slices = []
+        for range_min, range_max in lon_ranges(lon_min, lon_max):
+            first = np.searchsorted(self.keys, rows * self.n_cols + self.cell_cols(range_min), side='left')
+            last = np.searchsorted(self.keys, rows * self.n_cols + self.cell_cols(range_max), side='right')
+            slices.extend(self.positions[start:stop] for start, stop in zip(first, last) if stop > start)
+
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+
+        return np.concatenate(slices)
+
+    def query_radius(self, lat: float, lon: float, radius_km: float, method: str = 'vincenty') -> tuple:
+        """Find all the listings within 'radius_km' of the main coordinate.
+
+        Parameters
+        ----------
+        lat : float
+            Is the Latitude of the main location
+
+        lon : float
+            Is the Longitude of the main location
+
+        radius_km : float
+            Is the radio of the circle in kilometres
+
+        method : str
+            Is the method to mesure the distances: 'haversine', 'vincenty' or 'geodesic'.
+            (Default value = 'vincenty')
+
+        Returns
+        -------
+        tuple -> (positions, distances) sorted by position
+        """
+
+        positions = np.sort(self.candidates(lat, lon, radius_km))
+        distances = distances_km(lat, lon, self.lats[positions], self.lons[positions], method)
+
+        inside = distances <= radius_km
+        return positions[inside], distances[inside]
+
+    def candidates_many(self, lats: np.ndarray, lons: np.ndarray, radius_km: float) -> tuple:
+        """Return the candidates of many coordinates at the same time as pairs (target, listing).
+
+        The cells of all the targets are searched with a single binary search. The targets near the poles or the
+        antimeridian use the 'candidates' method one by one.
+
+        Parameters
+        ----------
+        lats : np.ndarray
+            Are the Latitudes of the targets
+
+        lons : np.ndarray
+            Are the Longitudes of the targets
+
+        radius_km : float
+            Is the radio of the circle in kilometres
+
+        Returns
+        -------
+        tuple -> (targets, positions) where 'targets' is the position of the target of each pair
+        """
+
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+
+        d_lat = radius_km / KM_PER_DEGREE_LAT
+        lat_min, lat_max = lats - d_lat, lats + d_lat
+        with np.errstate(divide='ignore'):
+            d_lon = radius_km / (KM_PER_DEGREE_LON * np.cos(np.radians(np.maximum(np.abs(lat_min), np.abs(lat_max)))))
+        lon_min, lon_max = lons - d_lon, lons + d_lon
+
+        # The boxes that include a Pole or cross the antimeridian are solved one by one.
+        simple = (lat_min > -90) & (lat_max < 90) & (lon_min >= -180) & (lon_max <= 180)
+        special = np.flatnonzero(~simple & np.isfinite(lats) & np.isfinite(lons))
+        simple = np.flatnonzero(simple)
+
+        # One range of keys for each row of cells of each target.
+        rows_min = self.cell_rows(lat_min[simple])
+        n_rows = self.cell_rows(lat_max[simple]) - rows_min + 1
+        range_target = np.repeat(simple, n_rows)
+        rows = np.repeat(rows_min, n_rows) + _ranges(np.zeros(len(n_rows), dtype=np.int64), n_rows)
+
+        first = np.searchsorted(self.keys, rows * self.n_cols + self.cell_cols(lon_min[range_target]), side='left')
+        last = np.searchsorted(self.keys, rows * self.n_cols + self.cell_cols(lon_max[range_target]), side='right')
+        counts = last - first
+
+        targets = [np.repeat(range_target, counts)]
+        positions = [self.positions[_ranges(first, counts)]]
+        for target in special:
+            found = self.candidates(lats[target], lons[target], radius_km)
+            targets.append(np.full(len(found), target, dtype=np.int64))
+            positions.append(found)
+
+        return np.concatenate(targets), np.concatenate(positions)
+
+
+def _ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Concatenate the ranges [start, start + count) without a python loop."""
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(counts.sum(), dtype=np.int64)
@@ -0,0 +1,258 @@
+"""zone_stats
+==========================================================
+Precomputed market statistics of the listings by geographic cell.
+
+Each listing is assigned to a cell of the grid of the spatial index ('cell_km' size). For each cell and group
+(type_of_listing, type_of_offer, sector_inmo) it saves the count, the sums of the metrics (price, avg_price_m2 and
+avg_price_const) and a quantile sketch of each metric. All of them are mergeable: the statistics of a zone are the
+sums of the statistics of its cells, so a radius query only adds the arrays of the cells inside the circle without
+reading the listings.
+
+The quantile sketch is a histogram of logarithmic buckets: the bucket b contains the values in (gamma^(b-1), gamma^b]
+with gamma = (1 + accuracy) / (1 - accuracy), so any quantile has a relative error smaller than 'accuracy'. The values
+<= 0 are not in the statistics of a metric (Example: the avg_price_m2 of the Departamentos is 0).
+"""
+
+import numpy as np
+import pandas as pd
+from ..perfectradar.distances import bounding_box, lon_ranges, haversine_km
+from ..perfectradar.spatial_index import GridIndex, _ranges
+
+
+class ZoneStats:
+    """Mergeable statistics of the listings by (cell, type_of_listing, type_of_offer, sector_inmo)."""
+
+    def __init__(self, df: pd.core.frame.DataFrame, config: dict, cell_km: float = 0.5, accuracy: float = 0.01):
+        """Compute the statistics of all the cells.
+
+        Parameters
+        ----------
+        df : DataFrame
+            Is the prepared DataFrame of the listings (with the columns of prepare_df)
+
+        config : dict
+            Is the 'config_columns' of the PerfectRadar
+
+        cell_km : float
+            Is the size of the cells in kilometres. Use a value smaller than the radio of the queries, the zone of a
+            query is the cells with the center inside the circle. (Default value = 0.5)
+
+        accuracy : float
+            Is the relative error of the quantiles. (Default value = 0.01)
+        """
+
+        if not 0 < accuracy < 1:
+            raise ValueError('The "accuracy" of the ZoneStats must be between 0 and 1.')
+
+        self.config = config
+        self.accuracy = accuracy
+        self.log_gamma = np.log((1 + accuracy) / (1 - accuracy))
+        self.metrics = [col for col in (config['PRICE'], 'avg_price_m2', 'avg_price_const') if col in df]
+
+        # The cell of each listing (the listings without coordinates are not in the index).
+        self.grid = GridIndex(df[config['LAT']].to_numpy(dtype=float), df[config['LON']].to_numpy(dtype=float),
+                              cell_km)
+        positions = self.grid.positions
+
+        group_cols = [col for col in (config['TYPE_OF_LISTING'], config['TYPE_OF_OFFER'], 'sector_inmo') if col in df]
+        group_codes, groups = pd.MultiIndex.from_frame(df[group_cols].astype(object).take(positions)).factorize()
+        self.groups = groups.set_names(group_cols)  # <- The (type_of_listing, type_of_offer, sector_inmo) of each code
+        self.group_values = [groups.get_level_values(level).to_numpy() for level in range(len(group_cols))]
+        self.n_groups = max(len(groups), 1)
+
+        # Sorted key of each (cell, group): the groups of a cell are a continuous block.
+        combos, inverse = np.unique(self.grid.keys * self.n_groups + group_codes, return_inverse=True)
+        self.combos = combos
+        self.cells = np.unique(combos // self.n_groups)  # <- The sorted keys of the cells with listings
+        self.counts = np.bincount(inverse, minlength=len(combos))
+
+        self.sums, self.metric_counts, metric_rows, metric_buckets = {}, {}, [], []
+        for metric in self.metrics:
+            values = df[metric].to_numpy(dtype=np.float64)[positions]
+            valid = np.isfinite(values) & (values > 0)
+            self.sums[metric] = np.bincount(inverse[valid], values[valid], minlength=len(combos))
+            self.metric_counts[metric] = np.bincount(inverse[valid], minlength=len(combos))
+            metric_rows.append(inverse[valid])
+            metric_buckets.append(self.buckets(values[valid]))
+
+        # The sketch bucket of all the metrics is a single number: metric code * bucket_span + bucket - bucket_min
+        buckets = np.concatenate(metric_buckets + [np.empty(0, dtype=np.int64)])
+        self.bucket_min = int(buckets.min()) if len(buckets) else 0
+        self.bucket_span = int(buckets.max()) - self.bucket_min + 1 if len(buckets) else 1
+        sketch = np.concatenate([code * self.bucket_span + metric_buckets[code] - self.bucket_min
+                                 for code in range(len(self.metrics))] + [np.empty(0, dtype=np.int64)])
+
+        # Rows of the sketches (combo position, sketch bucket, count) sorted by combo position.
+        keys, counts = np.unique(np.concatenate(metric_rows + [np.empty(0, dtype=np.int64)]) *
+                                 (len(self.metrics) * self.bucket_span) + sketch, return_counts=True)
+        sketch_combo = keys // (len(self.metrics) * self.bucket_span)
+        self.sketch_bucket = keys % (len(self.metrics) * self.bucket_span)
+        self.sketch_count = counts
+        self.sketch_starts = np.searchsorted(sketch_combo, np.arange(len(combos) + 1))  # <- Rows of each combo
+
+    def __len__(self):
+        return len(self.combos)
+
+    def __repr__(self):
+        return f'ZoneStats(cells={len(np.unique(self.combos // self.n_groups))}, groups={len(self.groups)})'
+
+    def buckets(self, values: np.ndarray) -> np.ndarray:
+        """Return the logarithmic bucket of each value (the values must be > 0)."""
+        return np.ceil(np.log(values) / self.log_gamma).astype(np.int64)
+
+    def bucket_values(self, buckets: np.ndarray) -> np.ndarray:
+        """Return the estimated value of each bucket (the value with the smallest relative error of the bucket)."""
+        return 2 * np.exp(buckets * self.log_gamma) / (np.exp(self.log_gamma) + 1)
+
+    def zone_cells(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Return the keys of the cells with listings and the center inside the circle (or the cell of the coordinate).
+
+        Only the cells with listings are checked: the keys of each row of cells of the bounding box are a range of the
+        sorted keys, so the cost is the number of rows of the box plus the cells with listings inside it.
+        """
+
+        grid = self.grid
+        lat_min, lat_max, lon_min, lon_max = bounding_box(lat, lon, radius_km)
+        rows = np.arange(grid.cell_rows(lat_min), grid.cell_rows(lat_max) + 1)
+
+        positions = []
+        for range_min, range_max in lon_ranges(lon_min, lon_max):
+            starts = np.searchsorted(self.cells, rows * grid.n_cols + grid.cell_cols(range_min))
+            stops = np.searchsorted(self.cells, rows * grid.n_cols + grid.cell_cols(range_max), side='right')
+            positions.append(_ranges(starts, stops - starts))
+        cells = self.cells[np.concatenate(positions)]
+
+        centers_lat = (cells // grid.n_cols + 0.5) * grid.cell_deg - 90
+        centers_lon = (cells % grid.n_cols + 0.5) * grid.cell_deg - 180
+        inside = haversine_km(lat, lon, centers_lat, centers_lon) <= radius_km
+
+        if not inside.any() and not self.any_center_inside(lat, lon, radius_km):
+            return grid.cell_keys(np.array([lat]), np.array([lon]))  # <- A radio smaller than the cells
+
+        return cells[inside]
+
+    def any_center_inside(self, lat: float, lon: float, radius_km: float) -> bool:
+        """Return True if the center of any cell (with or without listings) is inside the circle. The nearest centers
+        are the 4 centers around the coordinate."""
+
+        cell_deg = self.grid.cell_deg
+        rows = np.floor((lat + 90) / cell_deg - 0.5) + np.array([0, 0, 1, 1])
+        cols = np.floor((lon + 180) / cell_deg - 0.5) + np.array([0, 1, 0, 1])
+        return bool((haversine_km(lat, lon, (rows + 0.5) * cell_deg - 90, (cols + 0.5) * cell_deg - 180)
+                     <= radius_km).any())
+
+    def select(self, lat: float, lon: float, radius_km: float, type_of_listing: str = None,
+               type_of_offer: str = None, sector_inmo: str = None) -> np.ndarray:
+        """Return the positions of the (cell, group) statistics of the zone and the filters."""
+
+        cells = self.zone_cells(lat, lon, radius_km)
+        starts = np.searchsorted(self.combos, cells * self.n_groups)
+        stops = np.searchsorted(self.combos, (cells + 1) * self.n_groups)
+        selected = _ranges(starts, stops - starts)
+
+        # Filter by the values of the groups (the filter is made over the groups, not over the cells)
+        keep_groups = np.ones(self.n_groups, dtype=bool)
+        for values, value in zip(self.group_values, (type_of_listing, type_of_offer, sector_inmo)):
+            if value is not None:
+                keep_groups &= values == value
+
+        return selected[keep_groups[self.combos[selected] % self.n_groups]]
+
+    def merge_sketches(self, selected: np.ndarray) -> np.ndarray:
+        """Merge the sketches of the (cell, group) positions.
+
+        Returns
+        -------
+        np.ndarray -> The cumulative counts of the buckets of each metric (shape: metrics x bucket_span)
+        """
+
+        starts = self.sketch_starts[selected]
+        rows = _ranges(starts, self.sketch_starts[selected + 1] - starts)
+        counts = np.bincount(self.sketch_bucket[rows], self.sketch_count[rows],
+                             minlength=len(self.metrics) * self.bucket_span)
+        return np.cumsum(counts.reshape(len(self.metrics), self.bucket_span), axis=1)
+
+    def quantiles(self, cumulative: np.ndarray, quantiles: tuple) -> list:
+        """Return the estimated quantiles of the cumulative counts of the buckets of a metric."""
+
+        if not cumulative[-1]:
+            return [np.nan] * len(quantiles)
+
+        ranks = np.asarray(quantiles) * (cumulative[-1] - 1)
+        buckets = np.searchsorted(cumulative, ranks, side='right') + self.bucket_min
+        return self.bucket_values(buckets).tolist()
+
+    def metric_stats(self, selected: np.ndarray, cumulative: np.ndarray, quantiles: tuple) -> dict:
+        """Return the mean and the quantiles of each metric of the (cell, group) positions."""
+
+        stats = {}
+        for code, metric in enumerate(self.metrics):
+            count = self.metric_counts[metric][selected].sum()
+            stats[metric] = {'mean': float(self.sums[metric][selected].sum() / count) if count else np.nan}
+            stats[metric].update(zip([f'q{q:g}' for q in quantiles], self.quantiles(cumulative[code], quantiles)))
+
+        return stats
+
+    def summary(self, lat: float, lon: float, radius_km: float, type_of_listing: str = None,
+                type_of_offer: str = None, sector_inmo: str = None, quantiles: tuple = (0.25, 0.5, 0.75)) -> dict:
+        """Return the approximate statistics of the listings of a zone.
+
+        Parameters
+        ----------
+        lat : float
+            Is the Latitude of the center of the zone
+
+        lon : float
+            Is the Longitude of the center of the zone
+
+        radius_km : float
+            Is the radio of the zone in kilometres (the cells with the center inside the circle)
+
+        type_of_listing : str
+            Filter by the type of listing. (Default value = None, all)
+
+        type_of_offer : str
+            Filter by the type of offer. (Default value = None, all)
+
+        sector_inmo : str
+            Filter by the sector_inmo. (Default value = None, all)
+
+        quantiles : tuple
+            Are the quantiles of each metric. (Default value = (0.25, 0.5, 0.75))
+
+        Returns
+        -------
+        dict -> {'count', 'cells', metric: {'mean', 'q0.25', 'q0.5', 'q0.75'}, ...}
+        """
+
+        selected = self.select(lat, lon, radius_km, type_of_listing, type_of_offer, sector_inmo)
+
+        result = {'count': int(self.counts[selected].sum()),
+                  'cells': len(np.unique(self.combos[selected] // self.n_groups))}
+        result.update(self.metric_stats(selected, self.merge_sketches(selected), quantiles))
+        return result
+
+    def summary_by_group(self, lat: float, lon: float, radius_km: float, type_of_listing: str = None,
+                         type_of_offer: str = None, quantiles: tuple = (0.5,)) -> pd.core.frame.DataFrame:
+        """Return the approximate statistics of each (type_of_listing, type_of_offer, sector_inmo) of a zone (Example:
+        the average rent of each sector). The parameters are the same of 'summary'.
+
+        Returns
+        -------
+        DataFrame -> One row for each group with the count and the mean and quantiles of each metric
+        """
+
+        selected = self.select(lat, lon, radius_km, type_of_listing, type_of_offer)
+        group_codes = self.combos[selected] % self.n_groups
+
+        rows = []
+        for code in np.unique(group_codes):
+            in_group = selected[group_codes == code]
+            row = dict(zip(self.groups.names, self.groups[code]))
+            row['count'] = int(self.counts[in_group].sum())
+            for metric, stats in self.metric_stats(in_group, self.merge_sketches(in_group), quantiles).items():
+                row.update({f'{metric}_{name}': value for name, value in stats.items()})
+            rows.append(row)
+
+        return pd.DataFrame(rows, columns=list(self.groups.names) + ['count'] + [
+            f'{metric}_{name}' for metric in self.metrics for name in ['mean'] + [f'q{q:g}' for q in quantiles]])
@@ -4,7 +4,9 @@ setup(
     author='Alberto Ortiz Ascencio',
     name='perfectradar',
     description='Tool to find closest points between two points in an area by distances',
-    install_requires=['pandas', 'geopy'],
+    install_requires=['pandas', 'geopy', 'numpy'],
+    extras_require={'fast': ['pyarrow']},
+    entry_points={'console_scripts': ['perfectradar=perfectradar.perfectradar.cli:main']},
     python_requires= '>=3.9.5',
     version='0.1.0'
 )
@@ -40,6 +40,9 @@ def perfect_factory():
     # 6.2) Create a subset by the type of socioeconomically segment of the rents table.
     p.set_subset_sector_inmo()
 
+    # 6.3) Remove the listings outside the bounding box of the RADIO (it makes faster the next step)
+    p.subset_by_bbox()
+
     # 7) Create a new Column in the DataFrame to compare the distance between properties
     p.mesure_df_distances()
 
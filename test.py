@@ -1,5 +1,41 @@
+import json
+import os
+import numpy as np
 import pytest
-from perfectradar.perfectradar.col_creator import segment_sector_inmo, avg_price_m2, avg_price_m2_const
+from perfectradar.perfectradar.col_creator import segment_sector_inmo, avg_price_m2, avg_price_m2_const, \
+    segment_sector_inmo_array, avg_price_m2_array, avg_price_m2_const_array
+from perfectradar.perfectradar.distances import distances_km, bounding_box, bbox_mask
+from perfectradar.perfectradar.spatial_index import GridIndex
+from perfectradar.perfectradar.radar import PerfectRadar
+from perfectradar.perfectradar.partitions import ListingPartitions
+from perfectradar.perfectradar import df_cache
+import pandas as pd
+
+
+def _radar(n: int = 2000, seed: int = 11) -> PerfectRadar:
+    """Create a PerfectRadar with a random DataFrame around Guadalajara (The columns of run.py)"""
+    rng = np.random.default_rng(seed)
+    is_rent = rng.random(n) < 0.5
+    df = pd.DataFrame({
+        'sku_nombre': [f'sku-{i}' for i in range(n)],
+        'lat_name': 20.6953967 + rng.normal(0, 0.02, n),
+        'long_name': -103.4134952 + rng.normal(0, 0.02, n),
+        'tipo_inmueble': rng.choice(['Casa', 'Departamento'], n),
+        'tipo_oferta_nombre': np.where(is_rent, 'Rent', 'Buy'),
+        'precio_name': np.where(is_rent, rng.integers(3000, 40000, n), rng.integers(500000, 20000000, n)),
+        'm2_terreno_name': rng.integers(0, 400, n),
+        'm2_construccion_name': rng.integers(40, 500, n),
+    })
+
+    p = PerfectRadar('Test_project')
+    p.config_columns(id='sku_nombre', lat_col='lat_name', lon_col='long_name', type_of_listing_col='tipo_inmueble',
+                     type_of_offer_col='tipo_oferta_nombre', price_col='precio_name',
+                     land_size_col='m2_terreno_name', rent_value='Rent')
+    p.df = df
+    p.set_col_sector_inmo()
+    p.set_avg_pricem2_col()
+    p.set_avg_priceconst_col()
+    return p
 
 def test_segment_sector_inmo_interes_social():
     """Test the sector_inmo works well when it creates the new columns
@@ -116,6 +152,19 @@ def test_segment_sector_inmo_premium():
     # Renta
     assert segment_sector_inmo('Renta', 30001) == 'Premium'
 
+def test_segment_sector_inmo_array():
+    """Test the vectorized sector_inmo returns the same labels of segment_sector_inmo"""
+    limits = [1, 5000, 5000.5, 5001, 10000, 10001, 15000, 15001, 30000, 30001, 1000000, 1000000.5, 1000001,
+              3000000, 3000001, 7000000, 7000001, 15000000, 15000001, 0, -10, np.nan]
+    offers = ['Buy', 'Venta', 'Rent', 'Renta', '']
+
+    type_of_offer = np.repeat(offers, len(limits))
+    price = np.tile(limits, len(offers))
+    expected = [segment_sector_inmo(offer, value) for offer, value in zip(type_of_offer, price)]
+
+    assert segment_sector_inmo_array(type_of_offer, price).tolist() == expected
+
+
 def test_avg_price_m2_house():
     """Test the create average column creator"""
     
@@ -145,9 +194,778 @@ def test_avg_price_m2_no_value():
     """Test when the listing don't have any type of property type"""
     assert avg_price_m2(6500000, 150, '') == 0
     
+def test_avg_price_m2_arrays():
+    """Test the vectorized average prices returns the same values of the functions by row"""
+    price = [6500000, 6500000, 0, 6500000, 6500001, 6500002, 6500000, 6500000]
+    size = [150, 140, 140, 0, 2, 4, 150, 150]
+    listing = ['Casa', 'House', 'Casa', 'Casa', 'Casa', 'House', 'Departamento', '']
+
+    assert avg_price_m2_array(price, size, listing).tolist() == \
+           [avg_price_m2(*values) for values in zip(price, size, listing)]
+    assert avg_price_m2_const_array(price, size).tolist() == \
+           [avg_price_m2_const(*values) for values in zip(price, size)]
+    # Missing values
+    assert avg_price_m2_const_array([np.nan, 100], [10, np.nan]).tolist() == [0, 0]
+
+
 def test_avg_price_m2_const():
     """Test the function create new col avg construction price"""
     # Expected information
     assert avg_price_m2_const(6500000, 150) == 43333
     # ZeroDivision Error expected
-    assert avg_price_m2_const(0, 150) == 0
\ No newline at end of file
+    assert avg_price_m2_const(0, 150) == 0
+
+def test_distances_km_vs_geopy():
+    """Test the vectorized distances stay within the stated error of geopy"""
+    from geopy import distance
+    main = (20.6953967, -103.4134952)
+    lats = np.array([20.6953967, 20.70, 20.60, 21.5, -33.45])
+    lons = np.array([-103.4134952, -103.40, -103.30, -100.0, -70.66])
+    expected = np.array([distance.distance(main, (lat, lon)).km for lat, lon in zip(lats, lons)])
+
+    # Vincenty: 1 millimeter
+    assert np.abs(distances_km(*main, lats, lons, 'vincenty') - expected).max() < 1e-6
+    # Haversine: 0.6 %
+    haversine = distances_km(*main, lats, lons, 'haversine')
+    assert np.all(np.abs(haversine - expected) <= expected * 0.006)
+    # Missing coordinates
+    assert np.isnan(distances_km(*main, np.array([np.nan]), np.array([-103.4]))[0])
+
+
+def test_grid_index_query_radius():
+    """Test the spatial index finds the same listings than a full scan"""
+    rng = np.random.default_rng(7)
+    lats = 20.69 + rng.normal(0, 0.05, 5000)
+    lons = -103.41 + rng.normal(0, 0.05, 5000)
+    lats[3] = np.nan  # <- Listing without coordinates
+
+    index = GridIndex(lats, lons, cell_km=0.7)
+    positions, distances = index.query_radius(20.69, -103.41, 1.5)
+
+    full_scan = distances_km(20.69, -103.41, lats, lons)
+    assert np.array_equal(positions, np.flatnonzero(full_scan <= 1.5))
+    assert np.allclose(distances, full_scan[positions])
+
+    # Near the antimeridian
+    index = GridIndex(np.array([0.0, 0.0, 0.0]), np.array([179.995, -179.995, 170.0]))
+    assert index.query_radius(0.0, 180.0, 1.5)[0].tolist() == [0, 1]
+
+
+def test_bounding_box_contains_circle():
+    """Test the bounding box never removes a listing inside the radio"""
+    rng = np.random.default_rng(3)
+    for lat, lon in [(20.69, -103.41), (-60.0, 0.0), (0.0, 179.999)]:
+        lats = lat + rng.uniform(-0.05, 0.05, 20000)
+        lons = ((lon + rng.uniform(-0.05, 0.05, 20000)) + 180) % 360 - 180
+        inside = distances_km(lat, lon, lats, lons, 'haversine') <= 1.5
+        inside |= distances_km(lat, lon, lats, lons, 'vincenty') <= 1.5
+
+        mask = bbox_mask(lats, lons, bounding_box(lat, lon, 1.5))
+        assert mask[inside].all()
+        assert mask.sum() < len(mask)
+
+
+def test_set_col_sector_inmo_needs_the_dataframe():
+    """Test the column sector_inmo can't be created before csv_to_df"""
+    p = PerfectRadar('Test_project')
+    p.config_columns(id='sku_nombre', lat_col='lat_name', lon_col='long_name', type_of_listing_col='tipo_inmueble',
+                     type_of_offer_col='tipo_oferta_nombre', price_col='precio_name',
+                     land_size_col='m2_terreno_name', rent_value='Rent')
+
+    with pytest.raises(ValueError):
+        p.set_col_sector_inmo()
+
+
+def test_methods_chain_needs_both_coordinates():
+    """Test the methods of the chain raise a ValueError when only one main coordinate is set"""
+    p = _radar()
+    p.subset_by_type('Casa', 'Buy')
+    p.lat = 20.70  # <- Without the Longitude
+
+    with pytest.raises(ValueError):
+        p.subset_by_bbox()
+    with pytest.raises(ValueError):
+        p.mesure_df_distances()
+
+
+def test_batch_query_same_as_single_query():
+    """Test the batch query returns the same listings of the methods chain for each target"""
+    p = _radar()
+    targets = [(20.70, -103.41, 'Casa', 'Buy', 6500000), (20.69, -103.42, 'Departamento', 'Rent')]
+    result = p.batch_query(targets)
+
+    assert set(result['side'][result['target_id'] == 1]) == {'main'}  # <- Rent targets don't have rent side
+
+    for target_id, target in enumerate(targets):
+        q = _radar()
+        q.set_coordinates(target[0], target[1])
+        q.subset_by_type(target[2], target[3])
+        if len(target) == 5:
+            q.set_sim_val(target[4], 150, 150, 3, 3, 2)
+            q.set_subset_sector_inmo()
+        q.mesure_df_distances()
+        main_df, rent_df = q.subset_by_km()
+
+        result_target = result[result['target_id'] == target_id]
+        assert sorted(result_target['sku_nombre'][result_target['side'] == 'main']) == sorted(main_df['sku_nombre'])
+        if rent_df is not None:
+            assert sorted(result_target['sku_nombre'][result_target['side'] == 'rent']) == \
+                   sorted(rent_df['sku_nombre'])
+
+
+def test_parallel_batch_query_same_as_serial():
+    """Test the process pool returns the same result (and order) of the serial batch query"""
+    p = _radar()
+    targets = [(20.70, -103.41, 'Casa', 'Buy', 6500000), (20.69, -103.42, 'Departamento', 'Rent'),
+               (20.68, -103.40, 'Casa', 'Buy', 2000000)]
+
+    serial = p.batch_query(targets, None, 'precio_name')
+    parallel = p.batch_query(targets, None, 'precio_name', workers=2, chunk_size=1)
+    pd.testing.assert_frame_equal(serial, parallel)
+
+
+def test_cvs_to_df_compact_types(tmp_path):
+    """Test the CSV ingestion with 'prune' only reads the configured columns with compact types, and the default
+    ingestion reads all the columns with float64 coordinates"""
+    df = _radar(200).df
+    df.iloc[:100].to_csv(tmp_path / 'casa.csv', index=False)
+    df.iloc[100:].assign(tipo_inmueble='Departamento').to_csv(tmp_path / 'deptos.csv', index=False)
+
+    p = PerfectRadar('Test_project', tmp_path / 'casa.csv', tmp_path / 'deptos.csv')
+    p.config_columns(id='sku_nombre', lat_col='lat_name', lon_col='long_name', type_of_listing_col='tipo_inmueble',
+                     type_of_offer_col='tipo_oferta_nombre', price_col='precio_name',
+                     land_size_col='m2_terreno_name', rent_value='Rent')
+    result = p.cvs_to_df('m2_construccion_name', prune=True)
+
+    assert list(result.columns) == ['sku_nombre', 'lat_name', 'long_name', 'tipo_inmueble', 'tipo_oferta_nombre',
+                                    'precio_name', 'm2_terreno_name', 'm2_construccion_name']
+    assert result['lat_name'].dtype == np.float64
+    assert isinstance(result['tipo_inmueble'].dtype, pd.CategoricalDtype)
+    assert set(result['tipo_inmueble']) == {'Casa', 'Departamento'}
+    assert result['precio_name'].dtype == np.int64
+    assert list(result.index) == list(range(200))
+
+    assert p.cvs_to_df(prune=True, compact_coordinates=True)['lat_name'].dtype == np.float32
+
+    # The default reads all the columns, so the methods chain can use the columns that are not configured
+    result = p.cvs_to_df()
+    assert 'sector_inmo' in result and result['lat_name'].dtype == np.float64
+    assert len(p.rm_outliers(result, False, 'm2_construccion_name'))
+
+
+def test_prepare_df_binary_cache(tmp_path):
+    """Test the prepared DataFrame is loaded from the cache while the CSV doesn't change"""
+    df = _radar(300).df.drop(columns=['sector_inmo', 'avg_price_m2', 'avg_price_const'])
+    df.loc[3, 'sku_nombre'] = None
+    df.to_csv(tmp_path / 'listings.csv', index=False)
+
+    def prepare():
+        p = PerfectRadar('Test_project', tmp_path / 'listings.csv')
+        p.config_columns(id='sku_nombre', lat_col='lat_name', lon_col='long_name',
+                         type_of_listing_col='tipo_inmueble', type_of_offer_col='tipo_oferta_nombre',
+                         price_col='precio_name', land_size_col='m2_terreno_name', rent_value='Rent')
+        return p.prepare_df('m2_construccion_name', cache_dir=tmp_path / 'cache')
+
+    first = prepare()
+    assert len(list((tmp_path / 'cache').iterdir())) == 1
+    second = prepare()
+    pd.testing.assert_frame_equal(first, second)
+
+    # A change in the CSV creates a new cache and removes the old one
+    old_cache = next((tmp_path / 'cache').iterdir())
+    df.iloc[:100].to_csv(tmp_path / 'listings.csv', index=False)
+    assert len(prepare()) == 100
+    caches = list((tmp_path / 'cache').iterdir())
+    assert len(caches) == 1 and caches != [old_cache]
+
+
+def test_df_cache_without_pickle(tmp_path):
+    """Test the mixed object columns are saved without pickle and loaded with the same values"""
+    df = pd.DataFrame({'mixed': ['a', 1, None, 2.5, 'a', True], 'text': ['x', None, 'y', 'x', 'z', 'y']})
+    df_cache.save_df(df, tmp_path / 'cache')
+    for path in (tmp_path / 'cache').glob('*.npy'):
+        np.load(path, allow_pickle=False)  # <- Raises ValueError if the file needs pickle
+
+    result = df_cache.load_df(tmp_path / 'cache')
+    assert result['mixed'].tolist() == ['a', 1, None, 2.5, 'a', True]
+    assert result['text'].isna().tolist() == df['text'].isna().tolist()
+
+
+def test_stream_subset_by_type_same_as_in_memory(tmp_path):
+    """Test the chunked ingestion returns the same subsets of the in-memory methods"""
+    df = _radar(3000).df.drop(columns=['sector_inmo', 'avg_price_m2', 'avg_price_const'])
+    df['lat_name'] += np.linspace(0, 0.2, len(df))  # <- Many listings out of the radio
+    df.iloc[:1000].to_csv(tmp_path / 'a.csv', index=False)
+    df.iloc[1000:].to_csv(tmp_path / 'b.csv', index=False)
+
+    def radar():
+        p = PerfectRadar('Test_project', tmp_path / 'a.csv', tmp_path / 'b.csv')
+        p.config_columns(id='sku_nombre', lat_col='lat_name', lon_col='long_name',
+                         type_of_listing_col='tipo_inmueble', type_of_offer_col='tipo_oferta_nombre',
+                         price_col='precio_name', land_size_col='m2_terreno_name', rent_value='Rent')
+        p.set_coordinates(20.72, -103.41)
+        return p
+
+    p = radar()
+    p.prepare_df('m2_construccion_name', prune=True)  # <- The same columns of the chunks
+    p.subset_by_type('Casa', 'Buy')
+    expected = p.subset_by_bbox()
+
+    q = radar()
+    result = q.stream_subset_by_type('Casa', 'Buy', 'm2_construccion_name', chunksize=250)
+    assert len(q.df) < len(p.df)
+
+    for result_df, expected_df in zip(result, expected):
+        pd.testing.assert_frame_equal(result_df.astype({'tipo_inmueble': str, 'tipo_oferta_nombre': str}),
+                                      expected_df.astype({'tipo_inmueble': str, 'tipo_oferta_nombre': str}))
+
+
+def test_rm_outliers_single_mask():
+    """Test the single mask gives the same rows of the original concat + drop_duplicates, and the precomputed limits
+    give the same result"""
+    p = _radar()
+    df = pd.concat([p.df, p.df.iloc[:5]])  # <- Duplicated IDs
+    with pytest.warns(UserWarning, match='m2_construccion_name'):  # <- Only the first column removes rows
+        result = p.rm_outliers(df, False, 'precio_name', 'm2_construccion_name')
+
+    # The original method
+    tables, expected = [], df
+    for val in ['precio_name', 'm2_construccion_name']:
+        val_to_rm = expected[val]
+        expected = expected[(val_to_rm < val_to_rm.quantile(0.99)) & (val_to_rm > val_to_rm.quantile(0.01))]
+        tables.append(expected)
+    expected = pd.concat(tables).drop_duplicates(subset='sku_nombre', keep='first')
+
+    pd.testing.assert_frame_equal(result, expected)
+
+    bounds = p.outlier_bounds(df, 'precio_name', 'm2_construccion_name')
+    with pytest.warns(UserWarning):
+        pd.testing.assert_frame_equal(p.rm_outliers(df, False, bounds=bounds), result)
+
+    with pytest.raises(KeyError):
+        p.rm_outliers(df, False, 'precio_name', 'unknown_column')
+
+
+def test_partitions_same_subsets():
+    """Test the subsets with partitions are the same of the subsets with the boolean filters"""
+    expected, result = _radar(), _radar()
+    result.build_partitions()
+
+    for p in (expected, result):
+        p.subset_by_type('Casa', 'Buy')
+        p.set_sim_val(6500000, 150, 150, 3, 3, 2)
+        p.set_subset_sector_inmo()
+
+    pd.testing.assert_frame_equal(result.subset_by_type, expected.subset_by_type)
+    pd.testing.assert_frame_equal(result.subset_by_type_rent, expected.subset_by_type_rent)
+
+    partition = result.partitions.get('Casa', 'Rent', 'Residencial')
+    assert np.array_equal(partition.positions, expected.subset_by_type_rent.index)
+    assert np.array_equal(partition.lats, expected.subset_by_type_rent['lat_name'])
+
+
+def test_partitions_methods_chain_keeps_columns():
+    """Test the documented methods chain with partitions keeps the columns created before set_subset_sector_inmo"""
+    expected, result = _radar(), _radar()
+    result.build_partitions()
+
+    for p in (expected, result):
+        p.set_coordinates(20.70, -103.41)
+        p.subset_by_type('Casa', 'Buy')
+        p.mesure_df_distances()
+        p.set_sim_val(6500000, 150, 150, 3, 3, 2)
+        p.set_subset_sector_inmo()
+        p.subset_by_km()
+
+    pd.testing.assert_frame_equal(result.subset_by_type, expected.subset_by_type)
+    pd.testing.assert_frame_equal(result.subset_by_type_rent, expected.subset_by_type_rent)
+    assert len(result.subset_by_type_rent)
+
+
+def test_partitions_sector_subset_with_repeated_index():
+    """Test the Rent subset of the sector with partitions when the index has repeated labels (concat of files)"""
+    p = _radar()
+    p.df = pd.concat([p.df.iloc[:1000], p.df.iloc[1000:].reset_index(drop=True)])
+    p.build_partitions()
+    p.subset_by_type('Casa', 'Buy')
+    p.set_sim_val(6500000, 150, 150, 3, 3, 2)
+    rent_df = p.set_subset_sector_inmo()
+
+    expected = p.df[(p.df['tipo_inmueble'] == 'Casa') & (p.df['tipo_oferta_nombre'] == 'Rent') &
+                    (p.df['sector_inmo'] == 'Residencial')]
+    assert len(rent_df) == len(expected) and set(rent_df['sector_inmo']) == {'Residencial'}
+    np.testing.assert_array_equal(rent_df['sku_nombre'], expected['sku_nombre'])
+
+
+def test_partitions_follow_the_new_sector_inmo():
+    """Test the partitions are built again when the column sector_inmo is calculated again"""
+    expected, result = _radar(), _radar()
+    result.build_partitions()
+
+    for p in (expected, result):
+        p.df['precio_name'] = p.df['precio_name'] // 2
+        p.set_col_sector_inmo()
+        p.subset_by_type('Casa', 'Buy')
+        p.set_sim_val(6500000, 150, 150, 3, 3, 2)
+        p.set_subset_sector_inmo()
+
+    pd.testing.assert_frame_equal(result.subset_by_type_rent, expected.subset_by_type_rent)
+    assert len(result.subset_by_type_rent)
+    for args in (('Casa', 'Rent', 'Residencial'), ('Departamento', 'Buy', 'Interés Social')):
+        np.testing.assert_array_equal(result.partitions.get(*args).positions,
+                                      ListingPartitions(expected.df, expected.config_columns).get(*args).positions)
+
+
+def test_query_same_as_methods_chain():
+    """Test the query over positions returns the same DataFrames of the methods chain"""
+    expected = _radar()
+    expected.set_coordinates(20.70, -103.41)
+    expected.subset_by_type('Casa', 'Buy')
+    expected.set_sim_val(6500000, 150, 150, 3, 3, 2)
+    expected.set_subset_sector_inmo()
+    expected.mesure_df_distances()
+    main_df, rent_df = expected.subset_by_km()
+    main_df = expected.rm_outliers(main_df, False, 'precio_name', 'm2_terreno_name')
+    rent_df = expected.rm_outliers(rent_df, False, 'precio_name', 'm2_terreno_name')
+
+    p = _radar()
+    df = p.df.copy()
+    for build in (None, p.build_partitions, p.build_spatial_index):
+        if build is not None:
+            build()
+        result = p.query('Casa', 'Buy', 'precio_name', 'm2_terreno_name', lat=20.70, long=-103.41, price=6500000)
+        pd.testing.assert_frame_equal(result[0], main_df)
+        pd.testing.assert_frame_equal(result[1], rent_df)
+
+    pd.testing.assert_frame_equal(p.df, df)  # <- The DataFrame doesn't change
+
+
+def test_query_result_cache():
+    """Test the result cache returns the same result for near coordinates and it's cleared on reload"""
+    p = _radar()
+    cache = p.enable_result_cache(max_entries=2, precision=3)
+    expected = p.query('Casa', 'Buy', 'precio_name', lat=20.70, long=-103.41, price=6500000)
+
+    result = p.query('Casa', 'Buy', 'precio_name', lat=20.70004, long=-103.41003, price=6500000)
+    assert (cache.hits, cache.misses) == (1, 1)
+    pd.testing.assert_frame_equal(result[0], expected[0])
+    pd.testing.assert_frame_equal(result[1], expected[1])
+
+    result[0]['distancia'] = 0  # <- The cached result doesn't change
+    pd.testing.assert_frame_equal(p.query('Casa', 'Buy', 'precio_name', lat=20.70, long=-103.41,
+                                          price=6500000)[0], expected[0])
+
+    # Other filters are other keys, and the least recently used is removed
+    p.query('Casa', 'Buy', 'm2_terreno_name', lat=20.70, long=-103.41, price=6500000)
+    p.query('Departamento', 'Rent', lat=20.70, long=-103.41)
+    assert len(cache) == 2 and cache.evictions == 1
+
+    p.df = p.df.iloc[::2].reset_index(drop=True)  # <- Reload
+    assert len(cache) == 0
+    p.query('Departamento', 'Rent', lat=20.70, long=-103.41)
+    assert cache.stats()['misses'] == 4 and len(cache) == 1
+
+    # An in place change of the DataFrame needs clear_result_cache
+    p.df['precio_name'] = p.df['precio_name'] * 2
+    p.clear_result_cache()
+    result = p.query('Departamento', 'Rent', lat=20.70, long=-103.41)
+    pd.testing.assert_series_equal(result[0]['precio_name'], p.df.loc[result[0].index, 'precio_name'])
+
+
+def test_append_and_remove_rows_same_as_rebuild():
+    """Test the incremental updates of the DataFrame, the spatial index and the partitions are the same of a rebuild"""
+    full = _radar()
+    raw_columns = ['sku_nombre', 'lat_name', 'long_name', 'tipo_inmueble', 'tipo_oferta_nombre', 'precio_name',
+                   'm2_terreno_name', 'm2_construccion_name']
+
+    p = _radar()
+    new_rows = p.df.iloc[1800:][raw_columns]
+    p.df = p.df.iloc[:1800].copy()
+    p.build_spatial_index()
+    p.build_partitions()
+    p.append_rows(new_rows)
+    p.remove_rows('sku-3', 'sku-1900', 'sku-404')
+
+    full.remove_rows('sku-3', 'sku-1900', 'sku-404')
+    full.build_spatial_index()
+    full.build_partitions()
+
+    # The updates wait in the buffer ('sku-1900' is removed from it) until the index or the DataFrame are used
+    assert len(p._df) == 1800 and len(p._pending_rows[0]) == 199
+    np.testing.assert_array_equal(p.spatial_index.keys, full.spatial_index.keys)
+    pd.testing.assert_frame_equal(p.df, full.df)
+    np.testing.assert_array_equal(p.spatial_index.positions, full.spatial_index.positions)
+    np.testing.assert_array_equal(p.spatial_index.lats, full.spatial_index.lats)
+    assert sorted(p.partitions.keys()) == sorted(full.partitions.keys())
+    for key in full.partitions.keys():
+        for result, expected in zip(p.partitions.get(*key), full.partitions.get(*key)):
+            np.testing.assert_array_equal(result, expected)
+
+    # Update: the old row is removed and the new one is at the end
+    row = new_rows[new_rows['sku_nombre'] == 'sku-1999'].assign(precio_name=1000)
+    p.update_rows(row)
+    assert len(p.df) == len(full.df) and p.df.iloc[-1]['precio_name'] == 1000
+    assert p.df.iloc[-1]['sector_inmo'] == 'Interés Social'
+
+
+def test_knn_query_same_as_full_sort():
+    """Test the k nearest comparables are the first rows of all the listings sorted by distance"""
+    p = _radar()
+    p.set_coordinates(20.70, -103.41)
+    p.subset_by_type('Casa', 'Buy')
+    p.set_sim_val(6500000, 150, 150, 3, 3, 2)
+    p.set_subset_sector_inmo()
+    main_df, rent_df = p.mesure_df_distances()
+    main_df = main_df.sort_values('distancia', kind='stable').head(7)
+    rent_df = rent_df.sort_values('distancia', kind='stable').head(7)
+
+    for build in (None, p.build_partitions, p.build_spatial_index):
+        if build is not None:
+            build()
+        result = p.knn_query(7, 'Casa', 'Buy')
+        pd.testing.assert_frame_equal(result[0], main_df)
+        pd.testing.assert_frame_equal(result[1], rent_df)
+
+        # The radio limits the distance, and it grows until there is enough rent data
+        assert len(p.knn_query(7, radio=0.001)[1]) == 0
+        assert len(p.knn_query(7, radio=0.001, grow_radio=True)[1]) >= p.RENTAL_MINIMAL_DATA
+
+
+def test_instrumentation_records_the_calls():
+    """Test the instrumentation records the time and rows of each method call and sends them to the callback"""
+    import tracemalloc
+
+    p = _radar()
+    received = []
+    tracing = tracemalloc.is_tracing()
+    instrumentation = p.enable_instrumentation(callback=received.append, track_memory=True)
+
+    p.set_coordinates(20.70, -103.41)
+    p.set_avg_pricem2_col()
+    p.subset_by_type('Casa', 'Buy')
+    p.mesure_df_distances()
+    main_df, rent_df = p.subset_by_km()
+    p.rm_outliers(main_df, False, 'precio_name')
+
+    assert received == instrumentation.records
+    assert [stats.method for stats in received] == ['set_coordinates', 'set_avg_price_cols', 'set_avg_pricem2_col',
+                                                    'subset_by_type', 'mesure_df_distances', 'subset_by_km',
+                                                    'rm_outliers']
+    assert received[1].depth == 1 and received[2].depth == 0  # <- set_avg_price_cols is called by set_avg_pricem2_col
+    assert received[3].rows_in == len(p.df) and received[5].rows_out == len(main_df) + len(rent_df)
+    assert received[6].rows_in == len(main_df)
+    assert all(stats.seconds >= 0 and stats.memory_bytes is not None and stats.error is None for stats in received)
+
+    summary = instrumentation.summary()
+    assert 'set_avg_price_cols' not in summary and summary['subset_by_km']['calls'] == 1
+
+    # The merge of the buffer of append_rows is recorded as an inner call of the method that uses the DataFrame
+    p.append_rows(p.df.iloc[:10].drop(columns=['sector_inmo', 'avg_price_m2', 'avg_price_const']))
+    del received[:]
+    p.query('Casa', 'Buy', lat=20.70, long=-103.41)
+    assert [(stats.method, stats.depth) for stats in received] == [('apply_updates', 1), ('query', 0)]
+    p.query('Casa', 'Buy', lat=20.70, long=-103.41)
+    assert [stats.method for stats in received[2:]] == ['query']  # <- Without updates there is no merge
+
+    calls = len(instrumentation)
+    p.disable_instrumentation()
+    p.set_avg_pricem2_col()
+    assert len(instrumentation) == calls
+    assert tracemalloc.is_tracing() == tracing  # <- Started by enable_instrumentation, stopped by disable_instrumentation
+
+
+def test_instrumentation_depth_by_thread():
+    """Test a call of other thread made while a method is running is a top level call (depth 0)"""
+    import threading
+
+    p = _radar()
+
+    def callback(stats):
+        if stats.method == 'set_avg_price_cols':  # <- set_avg_pricem2_col is still running in the main thread
+            thread = threading.Thread(target=p.set_col_sector_inmo)
+            thread.start()
+            thread.join()
+
+    instrumentation = p.enable_instrumentation(callback=callback)
+    p.set_avg_pricem2_col()
+
+    assert [(stats.method, stats.depth) for stats in instrumentation.records] == [
+        ('set_avg_price_cols', 1), ('set_col_sector_inmo', 0), ('set_avg_pricem2_col', 0)]
+    assert instrumentation.summary()['set_col_sector_inmo']['calls'] == 1
+
+
+def test_lazy_imports():
+    """Test the col_creator helpers don't import pandas and the PerfectRadar doesn't import geopy"""
+    import subprocess
+    import sys
+
+    code = ("import sys; from perfectradar.perfectradar.col_creator import segment_sector_inmo; "
+            "print('pandas' in sys.modules, 'geopy' in sys.modules); "
+            "from perfectradar.perfectradar import PerfectRadar; print('geopy' in sys.modules)")
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    assert output.split() == ['False', 'False', 'False']
+
+
+def test_cli_batch_mode_and_resume(tmp_path):
+    """Test the command line batch mode writes a part file for each batch and continues after the checkpoint"""
+    from perfectradar.perfectradar import cli
+
+    p = _radar()
+    listings = tmp_path / 'listings.csv'
+    p.df.drop(columns=['sector_inmo', 'avg_price_m2', 'avg_price_const']).to_csv(listings, index=False)
+
+    rng = np.random.default_rng(3)
+    targets = pd.DataFrame({'lat': 20.70 + rng.normal(0, 0.01, 7), 'lon': -103.41 + rng.normal(0, 0.01, 7),
+                            'type_of_listing': 'Casa', 'type_of_offer': 'Buy', 'price': 6500000, 'rooms': 3})
+    targets.to_csv(tmp_path / 'targets.csv', index=False)
+
+    output = tmp_path / 'result'
+    argv = ['--csv', str(listings), '--targets', str(tmp_path / 'targets.csv'), '--output', str(output),
+            '--batch-size', '3', '--outliers', 'precio_name', '--quiet']
+    assert cli.main(argv) == 0
+
+    parts = sorted(os.listdir(output / 'comparables'))
+    assert parts == ['part-00000.csv', 'part-00001.csv', 'part-00002.csv']
+    comparables = pd.concat([pd.read_csv(output / 'comparables' / part) for part in parts], ignore_index=True)
+    expected = p.batch_query(targets, None, 'precio_name')
+    np.testing.assert_array_equal(comparables['sku_nombre'], expected['sku_nombre'])
+    np.testing.assert_array_equal(comparables['target_id'], expected['target_id'])
+
+    summary = pd.concat([pd.read_csv(output / 'summary' / part) for part in parts], ignore_index=True)
+    assert summary['target_id'].tolist() == list(range(7))
+    assert summary['main_count'].tolist() == expected[expected['side'] == 'main'].groupby('target_id').size().tolist()
+
+    # Crash after the first batch: only the next batches are processed again
+    checkpoint = json.loads((output / 'checkpoint.json').read_text())
+    checkpoint['completed_batches'] = 1
+    (output / 'checkpoint.json').write_text(json.dumps(checkpoint))
+    (output / 'comparables' / 'part-00002.csv').unlink()
+    assert cli.run(cli.build_parser().parse_args(argv)) == 4
+    assert sorted(os.listdir(output / 'comparables')) == parts
+
+    # Other listings or other columns are other job
+    other_columns = argv + ['--price-col', 'm2_construccion_name']
+    with pytest.raises(ValueError):
+        cli.run(cli.build_parser().parse_args(other_columns))
+    os.utime(listings, (0, 0))
+    with pytest.raises(ValueError):
+        cli.run(cli.build_parser().parse_args(argv))
+
+
+def test_service_micro_batches_same_as_query():
+    """Test the HTTP service answers concurrent queries in micro-batches with the same result of query"""
+    import asyncio
+    from perfectradar.perfectradar.service import RadarService
+
+    p = _radar()
+    service = RadarService(p, max_wait=0.05)
+    rng = np.random.default_rng(5)
+    requests = [{'lat': 20.70 + rng.normal(0, 0.01), 'lon': -103.41 + rng.normal(0, 0.01), 'price': 6500000,
+                 'outliers': ['precio_name']} for _ in range(12)]
+
+    async def post(port: int, path: str, body: dict) -> tuple:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        content = json.dumps(body).encode()
+        writer.write(f'POST {path} HTTP/1.1\r\nContent-Length: {len(content)}\r\n\r\n'.encode() + content)
+        response = await reader.read()
+        writer.close()
+        head, _, body = response.partition(b'\r\n\r\n')
+        return int(head.split()[1]), json.loads(body)
+
+    async def run_queries():
+        server = await service.serve(port=0)
+        port = server.sockets[0].getsockname()[1]
+        responses = await asyncio.gather(*[post(port, '/query', request) for request in requests])
+        error = await post(port, '/query', {'lat': 20.7})
+        server.close()
+        await service.stop()
+        return responses, error
+
+    responses, error = asyncio.run(run_queries())
+
+    assert error[0] == 400
+    assert service.requests == 12 and service.batches < 12  # <- The concurrent queries are solved together
+    for request, (status, response) in zip(requests, responses):
+        main_df, rent_df = p.query('Casa', 'Buy', 'precio_name', lat=request['lat'], long=request['lon'],
+                                   price=6500000)
+        assert status == 200
+        assert [row['sku_nombre'] for row in response['main']] == main_df['sku_nombre'].tolist()
+        assert [row['sku_nombre'] for row in response['rent']] == rent_df['sku_nombre'].tolist()
+
+    # The DataFrames of solve are the DataFrames of query (with the index of the listings)
+    targets = pd.DataFrame(requests).drop(columns='outliers').assign(type_of_listing='Casa', type_of_offer='Buy')
+    for request, (main_df, rent_df) in zip(requests, service.solve(targets, p.RADIO, ('precio_name',))):
+        expected = p.query('Casa', 'Buy', 'precio_name', lat=request['lat'], long=request['lon'], price=6500000)
+        pd.testing.assert_frame_equal(main_df, expected[0])
+        pd.testing.assert_frame_equal(rent_df, expected[1])
+
+
+def test_service_groups_run_at_the_same_time():
+    """Test a slow group of a micro-batch (other radio) doesn't make wait the other groups and micro-batches"""
+    import asyncio
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from perfectradar.perfectradar.service import RadarService
+
+    executor = ThreadPoolExecutor(2)
+    service = RadarService(_radar(), max_wait=0.05, executor=executor)
+    release = threading.Event()
+    solve = service.solve
+
+    def slow_solve(targets, radio, outliers):
+        if radio == 3:
+            release.wait(5)  # <- The slow group waits until the fast one is answered
+        return solve(targets, radio, outliers)
+
+    service.solve = slow_solve
+
+    async def run_queries():
+        slow = asyncio.create_task(service.query(20.70, -103.41, price=6500000, radio=3))
+        await asyncio.sleep(0)
+        fast = await service.query(20.70, -103.41, price=6500000, radio=1.5)  # <- The same micro-batch
+        await asyncio.sleep(0.1)
+        later = await service.query(20.71, -103.41, price=6500000, radio=1.5)  # <- The next micro-batch
+        slow_done = slow.done()
+        release.set()
+        await slow
+        await service.stop()
+        return fast, later, slow_done
+
+    (main_df, _), (later_df, _), slow_done = asyncio.run(run_queries())
+    executor.shutdown()
+
+    assert not slow_done and service.batches == 3
+    assert len(main_df) and len(later_df)
+
+
+def test_prepared_dataset_thread_pool():
+    """Test the queries of the immutable dataset in a pool of threads are the same of query, and the dataset doesn't
+    change with the changes of the PerfectRadar"""
+    p = _radar()
+    p.build_partitions()
+    dataset = p.to_dataset()
+
+    rng = np.random.default_rng(9)
+    queries = [{'lat': 20.70 + rng.normal(0, 0.01), 'lon': -103.41 + rng.normal(0, 0.01), 'price': 6500000,
+                'values_to_rm': ('precio_name',)} for _ in range(16)]
+    expected = [p.query('Casa', 'Buy', 'precio_name', lat=q['lat'], long=q['lon'], price=q['price']) for q in queries]
+
+    # Changes of the PerfectRadar after the snapshot
+    p.append_rows(p.df.iloc[:500].drop(columns=['sector_inmo', 'avg_price_m2', 'avg_price_const'])
+                  .assign(sku_nombre=lambda df: df['sku_nombre'] + '-new'))
+    p.df['precio_name'] = 0
+
+    for result, (main_df, rent_df) in zip(dataset.query_many(queries, workers=4), expected):
+        pd.testing.assert_frame_equal(result[0], main_df)
+        pd.testing.assert_frame_equal(result[1], rent_df)
+
+    with pytest.raises(AttributeError):
+        dataset.radio = 3
+
+
+def test_zone_summary_same_as_rows():
+    """Test the zone statistics of the cells are close to the statistics of the rows"""
+    p = _radar(5000)
+    p.build_zone_stats(cell_km=0.25, accuracy=0.01)
+    df = p.df
+
+    # A zone with all the listings: the same count and mean, the quantiles with the error of the sketch
+    summary = p.zone_summary(20.6953967, -103.4134952, 100, 'Casa', 'Rent')
+    rows = df[(df['tipo_inmueble'] == 'Casa') & (df['tipo_oferta_nombre'] == 'Rent')]
+    assert summary['count'] == len(rows)
+    assert summary['precio_name']['mean'] == pytest.approx(rows['precio_name'].mean())
+    for q in (0.25, 0.5, 0.75):
+        assert summary['precio_name'][f'q{q:g}'] == pytest.approx(rows['precio_name'].quantile(q), rel=0.03)
+
+    avg_price_m2 = rows.loc[rows['avg_price_m2'] > 0, 'avg_price_m2']  # <- The zeros are not in the statistics
+    assert summary['avg_price_m2']['q0.5'] == pytest.approx(avg_price_m2.median(), rel=0.03)
+
+    # A big radio only checks the cells with listings (not all the cells of the bounding box)
+    assert p.zone_summary(20.6953967, -103.4134952, 3000)['count'] == len(df)
+    assert len(p.zone_stats.zone_cells(20.6953967, -103.4134952, 3000)) == len(p.zone_stats.cells)
+
+    # A small zone: the cells with the center inside the circle, the border has the error of the cell size
+    p.set_coordinates(20.70, -103.41)
+    summary = p.zone_summary(radio=1.5)
+    distances = p.radius_query(radio=1.5 + 0.2)['distancia']
+    assert (distances <= 1.5 - 0.2).sum() <= summary['count'] <= len(distances)
+
+    by_group = p.zone_summary(radio=1.5, by_group=True)
+    assert by_group['count'].sum() == summary['count']
+    assert set(by_group['tipo_oferta_nombre']) == {'Buy', 'Rent'}
+    sector = by_group.iloc[0]
+    assert p.zone_summary(radio=1.5, type_of_listing=sector['tipo_inmueble'],
+                          type_of_offer=sector['tipo_oferta_nombre'],
+                          sector_inmo=sector['sector_inmo'])['count'] == sector['count']
+
+    # The statistics are built again after the rows change
+    p.remove_rows(*df['sku_nombre'].iloc[:100])
+    assert p.zone_stats is None
+    assert p.zone_summary(20.6953967, -103.4134952, 100)['count'] == len(p.df)
+
+
+def test_estimate_yields_same_as_batch_query():
+    """Test the vectorized rent estimation is the summary of the rent comparables of batch_query"""
+    p = _radar()
+    rng = np.random.default_rng(4)
+    targets = pd.DataFrame({'lat': 20.70 + rng.normal(0, 0.02, 200), 'lon': -103.41 + rng.normal(0, 0.02, 200),
+                            'price': rng.integers(500000, 20000000, 200), 'm2_terr': rng.integers(80, 400, 200)})
+
+    yields = p.estimate_yields(targets, 1.5, expense_ratio=0.3)
+    result = p.batch_query(targets, 1.5, 'precio_name')
+    rent = result[result['side'] == 'rent'].groupby('target_id')['precio_name']
+
+    assert len(yields) == len(targets)
+    assert (yields['rent_count'] == rent.size().reindex(yields['target_id'], fill_value=0).to_numpy()).all()
+    np.testing.assert_allclose(yields['rent_median'], rent.median().reindex(yields['target_id']).to_numpy())
+    np.testing.assert_allclose(yields['gross_yield'], yields['rent_median'] * 12 / targets['price'])
+    assert 'est_rent' not in yields
+    np.testing.assert_allclose(yields['cap_rate'], yields['gross_yield'] * 0.7)
+    assert (yields['enough_rent'] == (yields['rent_count'] >= p.RENTAL_MINIMAL_DATA)).all()
+    assert yields['est_rent_m2'].notna().any()
+    assert not hasattr(p, 'sim_data')  # <- The instance doesn't change
+
+
+def test_polygon_and_ring_queries():
+    """Test the polygon query is the same of the coordinates inside the polygon, with and without the spatial index,
+    and the ring query is the query of the biggest radio with the ring of each distance"""
+    p = _radar()
+    df = p.df
+    lats, lons = df['lat_name'], df['long_name']
+
+    # A square with a square hole: the GeoJSON coordinates are [lon, lat]
+    square = [[-103.43, 20.68], [-103.39, 20.68], [-103.39, 20.72], [-103.43, 20.72], [-103.43, 20.68]]
+    hole = [[-103.42, 20.69], [-103.40, 20.69], [-103.40, 20.71], [-103.42, 20.71]]
+    polygon = {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [square, hole]}}
+    inside = lons.between(-103.43, -103.39) & lats.between(20.68, 20.72) & \
+        ~(lons.between(-103.42, -103.40) & lats.between(20.69, 20.71))
+
+    main_df, rent_df = p.polygon_query(polygon, 'Casa', 'Buy', price=6500000)
+    expected = df[inside & (df['tipo_inmueble'] == 'Casa') & (df['tipo_oferta_nombre'] == 'Buy')]
+    assert main_df['sku_nombre'].tolist() == expected['sku_nombre'].tolist()
+    assert (rent_df['tipo_oferta_nombre'] == 'Rent').all() and rent_df['sector_inmo'].nunique() == 1
+    assert 'distancia' in main_df
+
+    p.build_spatial_index()
+    indexed = p.polygon_query(polygon, 'Casa', 'Buy', 'precio_name', price=6500000)
+    for result, expected in zip(indexed, p.polygon_query(polygon['geometry'], 'Casa', 'Buy', 'precio_name',
+                                                         price=6500000)):
+        pd.testing.assert_frame_equal(result, expected)
+
+    # A MultiPolygon is the union of its polygons
+    triangle = [[-103.39, 20.66], [-103.37, 20.66], [-103.37, 20.68]]
+    multi = {'type': 'MultiPolygon', 'coordinates': [[square[:4]], [triangle]]}
+    union = pd.concat([p.polygon_query(square, 'Casa', 'Rent')[0], p.polygon_query(triangle, 'Casa', 'Rent')[0]])
+    assert sorted(p.polygon_query(multi, 'Casa', 'Rent')[0]['sku_nombre']) == sorted(union['sku_nombre'])
+    assert len(p.polygon_query(triangle, 'Casa', 'Rent')[0])
+
+    # Rings: the same rows of the biggest circle
+    main_df, rent_df = p.ring_query((1, 2, 3), 'Casa', 'Buy', 'precio_name', lat=20.70, long=-103.41, price=6500000)
+    expected = p.query('Casa', 'Buy', 'precio_name', lat=20.70, long=-103.41, price=6500000, radio=3)
+    pd.testing.assert_frame_equal(main_df.drop(columns='ring'), expected[0])
+    pd.testing.assert_frame_equal(rent_df.drop(columns='ring'), expected[1])
+    assert (main_df['distancia'] > main_df['ring']).all() and (main_df['distancia'] <= main_df['ring'] + 1).all()
+
+    with pytest.raises(ValueError):
+        p.ring_query((2, 1), lat=20.70, long=-103.41)